@@ -0,0 +1,229 @@
+"""Headless batch runner for the recommendation pipelines.
+
+Reads one profile per line from a JSONL file and writes one result per line,
+so a whole cohort can be processed without the interactive prompts:
+
+    python batch_runner.py profiles.jsonl results.jsonl --concurrency 16
+
+Each input line names its pipeline and carries that pipeline's inputs:
+
+    {"id": "u1", "pipeline": "questionnaire", "user_inputs": {...}}
+    {"id": "u2", "pipeline": "skills", "skills_data": {...}, "target_field": "Data Science"}
+    {"id": "u3", "pipeline": "projects", "completed_courses": [...], "field": "Web", "experience_level": "beginner"}
+    {"id": "u4", "pipeline": "career", "profile_data": {...}, "target_industry": "Fintech", "job_choice": "Data Engineer"}
+
+Results are appended and flushed as each profile finishes. Rerunning with the
+same output file skips profiles that already succeeded, so a crashed run can
+be resumed. A line that can't be parsed gets an error record naming its line
+number, and the rest of the file is still processed.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import time
+
+import llm_client
+import tracing
+
+PIPELINES = ("questionnaire", "skills", "projects", "career")
+
+
+async def run_profile(profile):
+    """Runs one profile through its pipeline and returns the result."""
+    pipeline = profile.get("pipeline")
+    if pipeline == "questionnaire":
+        module = importlib.import_module("questionnare")
+        return await module.generate_course_recommendations_async(profile["user_inputs"])
+    if pipeline == "skills":
+        module = importlib.import_module("skills")
+        return await module.generate_course_recommendations_async(
+            profile["skills_data"], profile["target_field"]
+        )
+    if pipeline == "projects":
+        module = importlib.import_module("projects")
+        return await module.generate_project_recommendations_async(
+            profile["completed_courses"], profile["field"], profile.get("experience_level", "intermediate")
+        )
+    if pipeline == "career":
+        module = importlib.import_module("model")
+        extracted_data = await module.extract_skills_and_experience_async(profile["profile_data"])
+        result = {"extracted_data": extracted_data}
+        if "error" in extracted_data:
+            result["error"] = extracted_data["error"]
+            return result
+        if profile.get("target_industry"):
+            result["job_suggestions"] = await module.generate_job_suggestions_async(
+                extracted_data, profile["target_industry"]
+            )
+        if profile.get("job_choice"):
+            result["learning_path"] = await module.generate_learning_path_async(
+                extracted_data, profile["job_choice"]
+            )
+        # The text pipelines return a message instead of raising; treat it as a failure
+        failed = [text for text in (result.get("job_suggestions"), result.get("learning_path"))
+                  if module.is_error_message(text)]
+        if failed:
+            result["error"] = " ".join(failed)
+        return result
+    raise ValueError(f"Unknown pipeline {pipeline!r}, expected one of {', '.join(PIPELINES)}")
+
+
+def completed_ids(output_path):
+    """Returns the ids that already have a successful result in the output file."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn last line from a crash; that profile will be rerun
+                continue
+            if "result" in record:
+                done.add(record["id"])
+    return done
+
+
+def read_profiles(input_path, skip_ids, on_invalid=None):
+    """Yields every profile that still needs processing, one line at a time.
+
+    A line that isn't a JSON object is skipped after calling
+    on_invalid(line_number, message), so one bad line doesn't stop the batch.
+    """
+    with open(input_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                profile = json.loads(line)
+            except json.JSONDecodeError as e:
+                profile, message = None, f"Invalid JSON on line {line_number}: {e}"
+            else:
+                message = f"Line {line_number} is not a JSON object"
+            if not isinstance(profile, dict):
+                if on_invalid is not None:
+                    on_invalid(line_number, message)
+                continue
+            profile.setdefault("id", str(line_number))
+            if profile["id"] in skip_ids:
+                continue
+            yield profile
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_batch(input_path, output_path, concurrency=8, resume=True):
+    """Processes every profile in input_path and returns throughput and latency stats."""
+    skip_ids = completed_ids(output_path) if resume else set()
+    # Let every worker have a Gemini call in flight
+    llm_client.MAX_CONCURRENCY = max(llm_client.MAX_CONCURRENCY, concurrency)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    latencies = []
+    failures = 0
+    invalid = 0
+
+    with open(output_path, "a" if resume else "w", encoding="utf-8") as out:
+        if resume and out.tell() > 0:
+            # Terminate a torn last line so the next record starts cleanly
+            with open(output_path, "rb") as existing:
+                existing.seek(-1, os.SEEK_END)
+                if existing.read(1) != b"\n":
+                    out.write("\n")
+
+        def write(record):
+            out.write(json.dumps(record, default=str) + "\n")
+            out.flush()
+
+        def invalid_line(line_number, message):
+            nonlocal invalid
+            invalid += 1
+            write({"id": str(line_number), "line": line_number, "error": message})
+
+        async def worker():
+            nonlocal failures
+            while True:
+                profile = await queue.get()
+                if profile is None:
+                    return
+                start = time.perf_counter()
+                record = {"id": profile["id"], "pipeline": profile.get("pipeline")}
+                with tracing.start_trace(f"batch {record['pipeline']}", profile_id=profile["id"]) as span:
+                    try:
+                        result = await run_profile(profile)
+                        if isinstance(result, dict) and "error" in result:
+                            # Recorded as a failure so a resumed run retries it
+                            failures += 1
+                            record["error"] = result["error"]
+                        else:
+                            record["result"] = result
+                    except Exception as e:
+                        failures += 1
+                        record["error"] = str(e)
+                    if "error" in record:
+                        span.set_attribute("error", str(record["error"]))
+                elapsed = time.perf_counter() - start
+                latencies.append(elapsed)
+                record["latency_s"] = round(elapsed, 4)
+                write(record)
+
+        started = time.perf_counter()
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            # The bounded queue keeps only a few profiles in memory at a time
+            for profile in read_profiles(input_path, skip_ids, on_invalid=invalid_line):
+                await queue.put(profile)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+        duration = time.perf_counter() - started
+
+    processed = len(latencies)
+    return {
+        "processed": processed,
+        "skipped": len(skip_ids),
+        "failed": failures,
+        "invalid": invalid,
+        "duration_s": round(duration, 3),
+        "profiles_per_s": round(processed / duration, 3) if duration else 0.0,
+        "p50_latency_s": round(percentile(latencies, 50), 3),
+        "p95_latency_s": round(percentile(latencies, 95), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of profiles through the recommenders.")
+    parser.add_argument("input", help="JSONL file with one profile per line")
+    parser.add_argument("output", help="JSONL file results are appended to")
+    parser.add_argument("--concurrency", type=int, default=8, help="profiles processed at once")
+    parser.add_argument("--no-resume", action="store_true", help="overwrite the output instead of resuming")
+    args = parser.parse_args()
+
+    try:
+        stats = asyncio.run(run_batch(args.input, args.output, args.concurrency, resume=not args.no_resume))
+    except KeyboardInterrupt:
+        print("\nInterrupted. Rerun the same command to resume.")
+        return
+
+    print(f"Processed {stats['processed']} profiles ({stats['skipped']} already done, {stats['failed']} failed, "
+          f"{stats['invalid']} invalid lines) in {stats['duration_s']}s")
+    print(f"Throughput: {stats['profiles_per_s']} profiles/s")
+    print(f"Latency: p50 {stats['p50_latency_s']}s, p95 {stats['p95_latency_s']}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""Local course catalog with an inverted index for LLM-free course lookup.
+
+Courses are stored in SQLite and indexed in memory by topic term (from
+key_topics and title), skill level and duration, so a top-k lookup is a few
+set operations instead of a Gemini call. The catalog fills up from
+courses Gemini has already recommended (seed_from_cache, record_response)
+and from CSV/JSON imports:
+
+    python course_catalog.py import courses.csv
+    python course_catalog.py seed
+    python course_catalog.py search "machine learning" --level beginner --max-weeks 8
+"""
+import argparse
+import csv
+import hashlib
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import skill_canon
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "course_catalog.sqlite3")
+LEVELS = ("beginner", "intermediate", "advanced")
+
+# A course must cover this share of a query's term weight to count as a match
+MIN_COVERAGE = float(os.getenv("CATALOG_MIN_COVERAGE", "0.6"))
+# Recommenders use the catalog only when it has at least this many matches
+MIN_MATCHES = int(os.getenv("CATALOG_MIN_MATCHES", "3"))
+
+_TERM = re.compile(r"[a-z0-9+#]+")
+_WEEKS = re.compile(r"(\d+(?:\.\d+)?)\s*(week|wk|month|day|hour)", re.IGNORECASE)
+STOP_WORDS = frozenset(
+    "a an and the for of to in on with how i want learn learning about my get be into "
+    "course courses intro introduction basics fundamentals".split()
+)
+
+
+def terms(text):
+    """Lower-cased index terms of a piece of text, without stop words."""
+    return [t for t in _TERM.findall(str(text).lower()) if t not in STOP_WORDS]
+
+
+def course_id(title, platform):
+    """Stable ID for a course: the same title on the same platform is one course."""
+    key = f"{' '.join(terms(title))}|{str(platform).strip().lower()}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_weeks(value):
+    """Reads a duration such as 8, "8", "4 weeks" or "3 months" as weeks."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    match = _WEEKS.search(str(value))
+    if not match:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    amount, unit = float(match.group(1)), match.group(2).lower()
+    return {"month": amount * 4.3, "day": amount / 7, "hour": amount / 40}.get(unit, amount)
+
+
+def _flag(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y")
+    return bool(value)
+
+
+def normalize_course(raw, level=None, source="import"):
+    """Maps a course from either recommender's JSON, or a CSV row, onto the catalog's fields."""
+    topics = raw.get("key_topics") or []
+    if isinstance(topics, str):
+        topics = [t.strip() for t in re.split(r"[;,|]", topics) if t.strip()]
+    skill_level = str(raw.get("skill_level") or level or "").strip().lower()
+    weeks = parse_weeks(raw.get("duration_weeks", raw.get("estimated_duration")))
+    return {
+        "id": course_id(raw["title"], raw.get("platform", "")),
+        "title": str(raw["title"]).strip(),
+        "platform": str(raw.get("platform", "")).strip(),
+        "description": str(raw.get("description", "")).strip(),
+        "duration_weeks": weeks,
+        "skill_level": skill_level if skill_level in LEVELS else "",
+        "key_topics": list(topics),
+        "includes_projects": _flag(raw.get("includes_projects", False)),
+        "certification": _flag(raw.get("certification", False)),
+        "source": source,
+    }
+
+
+def courses_in_response(recommendations):
+    """Yields (course, level) for every course in a questionnaire or skills response."""
+    for course in recommendations.get("recommended_courses", []):
+        yield course, None
+    for stage in recommendations.get("learning_path", []):
+        for course in stage.get("courses", []):
+            yield course, stage.get("level")
+
+
+class CourseCatalog:
+    """SQLite-backed course store with in-memory topic, level and duration indexes."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._courses = None
+        self._postings = {}
+        self._by_level = {}
+
+    def _connect(self):
+        # SQLite connections must not be shared across a fork
+        if self._conn is not None and self._pid != os.getpid():
+            self._conn = None
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS courses (
+                    id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    platform TEXT NOT NULL,
+                    description TEXT NOT NULL,
+                    duration_weeks REAL,
+                    skill_level TEXT NOT NULL,
+                    key_topics TEXT NOT NULL,
+                    includes_projects INTEGER NOT NULL,
+                    certification INTEGER NOT NULL,
+                    source TEXT NOT NULL,
+                    times_seen INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _load(self):
+        if self._courses is not None:
+            return
+        self._courses = {}
+        rows = self._connect().execute(
+            "SELECT id, title, platform, description, duration_weeks, skill_level, key_topics, "
+            "includes_projects, certification, source, times_seen FROM courses"
+        ).fetchall()
+        for row in rows:
+            self._index({
+                "id": row[0], "title": row[1], "platform": row[2], "description": row[3],
+                "duration_weeks": row[4], "skill_level": row[5], "key_topics": json.loads(row[6]),
+                "includes_projects": bool(row[7]), "certification": bool(row[8]), "source": row[9],
+                "times_seen": row[10],
+            })
+
+    def _course_terms(self, course):
+        found = set(terms(course["title"]))
+        for topic in course["key_topics"]:
+            # Index "ML" and "Machine Learning" topics under the same terms
+            found.update(terms(skill_canon.canonical_name(topic)))
+        return found
+
+    def _index(self, course):
+        previous = self._courses.get(course["id"])
+        if previous is not None:
+            for term in self._course_terms(previous):
+                self._postings.get(term, set()).discard(course["id"])
+            self._by_level.get(previous["skill_level"], set()).discard(course["id"])
+        self._courses[course["id"]] = course
+        for term in self._course_terms(course):
+            self._postings.setdefault(term, set()).add(course["id"])
+        self._by_level.setdefault(course["skill_level"], set()).add(course["id"])
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self._courses)
+
+    def add_courses(self, courses, source="import"):
+        """Inserts or updates courses (raw dicts in recommender or CSV form). Returns how many were stored."""
+        now = time.time()
+        stored = 0
+        with self._lock:
+            self._load()
+            conn = self._connect()
+            for raw, level in courses:
+                try:
+                    course = normalize_course(raw, level, source)
+                except KeyError:
+                    continue
+                previous = self._courses.get(course["id"])
+                course["times_seen"] = (previous["times_seen"] if previous else 0) + 1
+                if previous:
+                    # Keep details a sparser copy of the same course would lose
+                    for field in ("description", "duration_weeks", "skill_level"):
+                        course[field] = course[field] or previous[field]
+                    course["key_topics"] = list(dict.fromkeys(previous["key_topics"] + course["key_topics"]))
+                conn.execute(
+                    "INSERT OR REPLACE INTO courses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (course["id"], course["title"], course["platform"], course["description"],
+                     course["duration_weeks"], course["skill_level"], json.dumps(course["key_topics"]),
+                     int(course["includes_projects"]), int(course["certification"]), course["source"],
+                     course["times_seen"], now),
+                )
+                self._index(course)
+                stored += 1
+            conn.commit()
+        return stored
+
+    def record_response(self, recommendations):
+        """Adds the courses of a parsed Gemini response to the catalog."""
+        if "error" in recommendations:
+            return 0
+        try:
+            return self.add_courses(courses_in_response(recommendations), source="llm")
+        except sqlite3.Error as e:
+            logger.warning("Could not record courses in the catalog: %s", e)
+            return 0
+
+    def import_file(self, path):
+        """Imports courses from a .json file (a list, or a recommender response) or a .csv file."""
+        if path.lower().endswith(".csv"):
+            with open(path, newline="", encoding="utf-8") as f:
+                return self.add_courses(((row, None) for row in csv.DictReader(f)), source="import")
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            return self.add_courses(courses_in_response(data), source="import")
+        return self.add_courses(((course, None) for course in data), source="import")
+
+    def seed_from_cache(self, response_cache=None):
+        """Imports every course found in cached questionnaire and skills responses."""
+        if response_cache is None:
+            from llm_client import get_cache
+            response_cache = get_cache()
+        stored = 0
+        for text in response_cache.iter_responses("course_recommendations", "skills_course_recommendations"):
+            try:
+                recommendations = json.loads(text)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(recommendations, dict):
+                stored += self.add_courses(courses_in_response(recommendations), source="llm")
+        return stored
+
+    def search(self, query, level=None, max_weeks=None, k=5):
+        """Top-k courses for a free-text query, best first.
+
+        Courses are scored by the IDF weight of the query terms they cover and
+        must cover at least MIN_COVERAGE of the query. `level` and `max_weeks`
+        are hard filters; courses without a known duration pass `max_weeks`
+        only when it is None.
+        """
+        query_terms = set(terms(skill_canon.canonical_name(query)))
+        if not query_terms:
+            return []
+        with self._lock:
+            self._load()
+            total = len(self._courses) or 1
+            weights = {t: math.log(1 + total / (1 + len(self._postings.get(t, ())))) for t in query_terms}
+            needed = sum(weights.values()) * MIN_COVERAGE
+            scores = {}
+            for term in query_terms:
+                for cid in self._postings.get(term, ()):
+                    scores[cid] = scores.get(cid, 0.0) + weights[term]
+            if level:
+                allowed = self._by_level.get(level.lower(), set())
+                scores = {cid: s for cid, s in scores.items() if cid in allowed}
+            results = []
+            for cid, score in scores.items():
+                if score < needed:
+                    continue
+                course = self._courses[cid]
+                if max_weeks is not None and (course["duration_weeks"] is None
+                                              or course["duration_weeks"] > max_weeks):
+                    continue
+                # Courses recommended more often break ties
+                results.append((score, course["times_seen"], cid))
+            best = heapq.nlargest(k, results)
+            return [dict(self._courses[cid]) for _, _, cid in best]
+
+
+def as_questionnaire_course(course):
+    """Shapes a catalog course like a course in a questionnaire response."""
+    return {
+        "title": course["title"],
+        "platform": course["platform"],
+        "description": course["description"],
+        "duration_weeks": course["duration_weeks"],
+        "skill_level": course["skill_level"],
+        "includes_projects": course["includes_projects"],
+        "certification": course["certification"],
+        "key_topics": course["key_topics"],
+    }
+
+
+def as_skills_course(course):
+    """Shapes a catalog course like a course in a skills learning path."""
+    weeks = course["duration_weeks"]
+    return {
+        "title": course["title"],
+        "platform": course["platform"],
+        "description": course["description"],
+        "estimated_duration": f"{weeks:g} weeks" if weeks else "self-paced",
+        "key_topics": course["key_topics"],
+    }
+
+
+_catalog = None
+
+
+def get_catalog():
+    """Returns the process-wide catalog, creating it on first use."""
+    global _catalog
+    if _catalog is None:
+        _catalog = CourseCatalog(os.getenv("COURSE_CATALOG_PATH", DEFAULT_PATH))
+    return _catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local course catalog.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="import courses from CSV or JSON")
+    importer.add_argument("path")
+    commands.add_parser("seed", help="import courses from cached Gemini responses")
+    searcher = commands.add_parser("search", help="look up courses")
+    searcher.add_argument("query")
+    searcher.add_argument("--level", choices=LEVELS)
+    searcher.add_argument("--max-weeks", type=float)
+    searcher.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    catalog = get_catalog()
+    if args.command == "import":
+        print(f"Imported {catalog.import_file(args.path)} courses.")
+    elif args.command == "seed":
+        print(f"Seeded {catalog.seed_from_cache()} courses from the response cache.")
+    else:
+        for course in catalog.search(args.query, args.level, args.max_weeks, args.k):
+            print(json.dumps(course, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,455 @@
+"""Durable background jobs for generations too slow to hold an HTTP request open.
+
+Jobs live in a SQLite table (by default in the project's db.sqlite3, next to
+Django's own tables), so no broker is needed. A web request enqueues a job
+and returns its ID; worker processes claim jobs, run the pipeline and store
+the result, and clients poll (or long-poll) for it:
+
+    python job_queue.py worker --concurrency 8
+    python job_queue.py status <job id>
+
+Claiming a job takes a lease. A worker renews the leases of the jobs it is
+running; if it dies, the lease runs out and another worker picks the job up.
+Failed attempts are retried with exponential backoff up to max_attempts.
+Higher priority jobs are claimed first, then oldest first. Scale out by
+starting more worker processes against the same database file.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PATH = os.path.join(PROJECT_DIR, "db.sqlite3")
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# kind -> (module, async function, argument names taken from the job payload)
+HANDLERS = {
+    "extract_profile": ("model", "extract_skills_and_experience_async", ("profile_data",)),
+    "job_suggestions": ("model", "generate_job_suggestions_async", ("extracted_data", "target_industry")),
+    "learning_path": ("model", "generate_learning_path_async", ("extracted_data", "job_choice")),
+    "course_recommendations": ("questionnare", "generate_course_recommendations_async", ("user_inputs",)),
+    "skills_course_recommendations": (
+        "skills", "generate_course_recommendations_async", ("skills_data", "target_field")),
+    "project_recommendations": (
+        "projects", "generate_project_recommendations_async", ("completed_courses", "field", "experience_level")),
+}
+
+_COLUMNS = ("id, kind, status, priority, payload, result, error, attempts, max_attempts, "
+            "created_at, updated_at, run_after, lease_until, worker")
+
+
+def missing_arguments(kind, payload):
+    """Names of the payload fields a job of this kind needs but doesn't have."""
+    return [name for name in HANDLERS[kind][2] if name not in payload]
+
+
+class JobQueue:
+    """SQLite-backed job table with leased claims, retries and priorities."""
+
+    def __init__(self, path=DEFAULT_PATH, lease_seconds=60, max_attempts=3, retry_delay=5,
+                 keep_seconds=7 * 24 * 3600):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.keep_seconds = keep_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    @classmethod
+    def from_env(cls):
+        """Builds a queue configured from JOB_QUEUE_* environment variables."""
+        return cls(
+            path=os.getenv("JOB_QUEUE_PATH", DEFAULT_PATH),
+            lease_seconds=int(os.getenv("JOB_QUEUE_LEASE_SECONDS", "60")),
+            max_attempts=int(os.getenv("JOB_QUEUE_MAX_ATTEMPTS", "3")),
+            retry_delay=float(os.getenv("JOB_QUEUE_RETRY_DELAY", "5")),
+            keep_seconds=int(os.getenv("JOB_QUEUE_KEEP_SECONDS", str(7 * 24 * 3600))),
+        )
+
+    def _connect(self):
+        # SQLite connections must not be shared across a fork
+        if self._conn is not None and self._pid != os.getpid():
+            self._conn = None
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS ai_jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL,
+                    max_attempts INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    run_after REAL NOT NULL,
+                    lease_until REAL,
+                    worker TEXT
+                )"""
+            )
+            # Serves the claim query: the best ready job is the first row of this index
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ai_jobs_ready ON ai_jobs (status, priority DESC, run_after, created_at)"
+            )
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def enqueue(self, kind, payload, priority=0, max_attempts=None):
+        """Adds a job and returns its ID. Higher priority runs first."""
+        if kind not in HANDLERS:
+            raise ValueError(f"Unknown job kind {kind!r}, expected one of {', '.join(HANDLERS)}")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                f"INSERT INTO ai_jobs ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, NULL, NULL, 0, ?, ?, ?, ?, NULL, NULL)",
+                (job_id, kind, QUEUED, int(priority), json.dumps(payload, default=str),
+                 max_attempts or self.max_attempts, now, now, now),
+            )
+            conn.commit()
+        return job_id
+
+    def get(self, job_id):
+        """Returns a job as a dict (payload and result decoded), or None if there is no such job."""
+        with self._lock:
+            row = self._connect().execute(f"SELECT {_COLUMNS} FROM ai_jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job(row) if row is not None else None
+
+    def claim(self, worker):
+        """Leases the next ready job to a worker and returns it, or None if nothing is ready.
+
+        A running job whose lease has expired (its worker died) counts as ready.
+        The select and update run in one write transaction, so two workers never
+        claim the same job.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._fail_exhausted(conn, now)
+                row = conn.execute(
+                    f"""SELECT {_COLUMNS} FROM ai_jobs
+                        WHERE (status = ? AND run_after <= ?) OR (status = ? AND lease_until <= ?)
+                        ORDER BY priority DESC, run_after, created_at LIMIT 1""",
+                    (QUEUED, now, RUNNING, now),
+                ).fetchone()
+                if row is None:
+                    conn.commit()
+                    return None
+                conn.execute(
+                    """UPDATE ai_jobs SET status = ?, attempts = attempts + 1, lease_until = ?,
+                           worker = ?, updated_at = ? WHERE id = ?""",
+                    (RUNNING, now + self.lease_seconds, worker, now, row["id"]),
+                )
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        job = _job(row)
+        job.update(status=RUNNING, attempts=job["attempts"] + 1, worker=worker)
+        return job
+
+    def _fail_exhausted(self, conn, now):
+        # Jobs whose workers died on every attempt would otherwise be reclaimed forever
+        conn.execute(
+            """UPDATE ai_jobs SET status = ?, error = COALESCE(error, 'lease expired'), lease_until = NULL,
+                   updated_at = ? WHERE status = ? AND lease_until <= ? AND attempts >= max_attempts""",
+            (FAILED, now, RUNNING, now),
+        )
+
+    def renew(self, worker, job_ids):
+        """Extends the leases a worker holds on the given running jobs."""
+        if not job_ids:
+            return
+        now = time.time()
+        placeholders = ", ".join("?" for _ in job_ids)
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                f"""UPDATE ai_jobs SET lease_until = ?, updated_at = ?
+                    WHERE worker = ? AND status = ? AND id IN ({placeholders})""",
+                (now + self.lease_seconds, now, worker, RUNNING, *job_ids),
+            )
+            conn.commit()
+
+    def complete(self, job_id, worker, result):
+        """Stores a job's result. Returns False if the worker had lost its lease."""
+        return self._finish(job_id, worker, status=SUCCEEDED, result=json.dumps(result, default=str))
+
+    def fail(self, job_id, worker, error):
+        """Records a failed attempt: requeues the job with backoff, or fails it after max_attempts."""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM ai_jobs WHERE id = ? AND worker = ? AND status = ?",
+                (job_id, worker, RUNNING),
+            ).fetchone()
+            if row is None:
+                return False
+            if row["attempts"] < row["max_attempts"]:
+                delay = self.retry_delay * 2 ** (row["attempts"] - 1)
+                conn.execute(
+                    """UPDATE ai_jobs SET status = ?, error = ?, run_after = ?, lease_until = NULL,
+                           worker = NULL, updated_at = ? WHERE id = ?""",
+                    (QUEUED, str(error), now + delay, now, job_id),
+                )
+            else:
+                conn.execute(
+                    "UPDATE ai_jobs SET status = ?, error = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+                    (FAILED, str(error), now, job_id),
+                )
+            conn.commit()
+            return True
+
+    def _finish(self, job_id, worker, status, result=None):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            updated = conn.execute(
+                """UPDATE ai_jobs SET status = ?, result = ?, error = NULL, lease_until = NULL, updated_at = ?
+                    WHERE id = ? AND worker = ? AND status = ?""",
+                (status, result, now, job_id, worker, RUNNING),
+            ).rowcount
+            conn.commit()
+        return updated == 1
+
+    def cancel(self, job_id):
+        """Cancels a job that hasn't started yet. Returns False if it is already running or finished."""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            updated = conn.execute(
+                "UPDATE ai_jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, now, job_id, QUEUED),
+            ).rowcount
+            conn.commit()
+        return updated == 1
+
+    def purge(self):
+        """Deletes finished jobs older than keep_seconds and returns how many were removed."""
+        cutoff = time.time() - self.keep_seconds
+        placeholders = ", ".join("?" for _ in FINISHED)
+        with self._lock:
+            conn = self._connect()
+            deleted = conn.execute(
+                f"DELETE FROM ai_jobs WHERE status IN ({placeholders}) AND updated_at < ?",
+                (*FINISHED, cutoff),
+            ).rowcount
+            conn.commit()
+        return deleted
+
+    def counts(self):
+        """Number of jobs in each status."""
+        with self._lock:
+            rows = self._connect().execute("SELECT status, COUNT(*) FROM ai_jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    async def wait(self, job_id, timeout, interval=0.25, max_interval=2.0):
+        """Polls until a job finishes or timeout passes, then returns it (None if it doesn't exist).
+
+        Used for long polling: the caller's coroutine sleeps between checks, so
+        a waiting client holds no thread.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await asyncio.to_thread(self.get, job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in FINISHED or remaining <= 0:
+                return job
+            await asyncio.sleep(min(interval, remaining))
+            interval = min(interval * 1.5, max_interval)
+
+
+def _job(row):
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+    return job
+
+
+_queue = None
+
+
+def get_queue():
+    """Returns the process-wide job queue, creating it on first use."""
+    global _queue
+    if _queue is None:
+        _queue = JobQueue.from_env()
+    return _queue
+
+
+# --- worker ------------------------------------------------------------------
+
+async def run_job(job):
+    """Runs one job's pipeline and returns its result."""
+    module_name, function_name, arguments = HANDLERS[job["kind"]]
+    module = await asyncio.to_thread(importlib.import_module, module_name)
+    function = getattr(module, function_name)
+    return await function(*(job["payload"][name] for name in arguments))
+
+
+def result_error(job, result):
+    """The failure a pipeline reported in its result instead of raising, or None.
+
+    The recommenders return a dict with an "error" key; the text pipelines in
+    model.py return a fixed failure message (see model.is_error_message).
+    """
+    if isinstance(result, dict):
+        return result.get("error")
+    module = importlib.import_module(HANDLERS[job["kind"]][0])  # already loaded by run_job
+    is_error_message = getattr(module, "is_error_message", None)
+    if is_error_message is not None and is_error_message(result):
+        return result
+    return None
+
+
+class Worker:
+    """Claims and runs jobs, up to `concurrency` at once on one event loop."""
+
+    def __init__(self, queue, concurrency=8, poll_interval=1.0, name=None, max_backoff=30.0):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff  # longest wait between claims while the database errors
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.processed = 0
+        self.failed = 0
+        self._running = {}  # task -> job ID
+        self._stopping = False
+
+    def stop(self):
+        """Stops claiming new jobs; jobs already running finish first."""
+        self._stopping = True
+
+    async def _execute(self, job):
+        with tracing.start_trace(f"job {job['kind']}", job_id=job["id"], attempt=job["attempts"]) as span:
+            try:
+                result = await run_job(job)
+                error = result_error(job, result)
+            except Exception as e:
+                result, error = None, f"{type(e).__name__}: {e}"
+            if error:
+                span.set_attribute("error", error)
+        if error:
+            self.failed += 1
+            logger.warning("job %s (%s) attempt %s failed: %s", job["id"], job["kind"], job["attempts"], error)
+        else:
+            self.processed += 1
+        try:
+            if error:
+                await asyncio.to_thread(self.queue.fail, job["id"], self.name, error)
+            elif not await asyncio.to_thread(self.queue.complete, job["id"], self.name, result):
+                logger.warning("job %s finished after its lease was taken over", job["id"])
+        except sqlite3.Error as e:
+            # The lease runs out and the job is claimed again
+            logger.warning("Could not record the outcome of job %s: %s", job["id"], e)
+
+    async def _renew_leases(self):
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            try:
+                await asyncio.to_thread(self.queue.renew, self.name, list(self._running.values()))
+            except sqlite3.Error as e:
+                logger.warning("Could not renew job leases: %s", e)
+
+    async def run(self, max_jobs=None, until_empty=False):
+        """Runs until stop(), or after max_jobs claims, or once the queue is empty if until_empty."""
+        renewer = asyncio.create_task(self._renew_leases())
+        claimed = 0
+        backoff = self.poll_interval
+        try:
+            while not self._stopping and (max_jobs is None or claimed < max_jobs):
+                if len(self._running) >= self.concurrency:
+                    await asyncio.wait(self._running, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                try:
+                    job = await asyncio.to_thread(self.queue.claim, self.name)
+                except sqlite3.Error as e:
+                    # A locked or briefly unavailable database shouldn't stop the worker
+                    logger.warning("Could not claim a job, retrying in %.1fs: %s", backoff, e)
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+                backoff = self.poll_interval
+                if job is None:
+                    if until_empty and not self._running:
+                        break
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                claimed += 1
+                task = asyncio.create_task(self._execute(job))
+                self._running[task] = job["id"]
+                task.add_done_callback(lambda task: self._running.pop(task, None))
+            if self._running:
+                await asyncio.gather(*self._running)
+        finally:
+            renewer.cancel()
+        return {"processed": self.processed, "failed": self.failed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background job queue for the recommenders.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker_parser = commands.add_parser("worker", help="run jobs until interrupted")
+    worker_parser.add_argument("--concurrency", type=int, default=8, help="jobs run at once by this process")
+    worker_parser.add_argument("--until-empty", action="store_true", help="exit once no job is ready")
+    status_parser = commands.add_parser("status", help="show a job, or counts per status")
+    status_parser.add_argument("job_id", nargs="?")
+    commands.add_parser("purge", help="delete old finished jobs")
+    args = parser.parse_args()
+
+    # The same queued, rotated logging as the web app, in a log file of the worker's own
+    if PROJECT_DIR not in sys.path:
+        sys.path.append(PROJECT_DIR)
+    import app_logging
+
+    app_logging.configure(os.path.join(os.getenv("LOG_DIR", os.path.join(PROJECT_DIR, "logs")), "worker.log"))
+    queue = get_queue()
+    if args.command == "worker":
+        import llm_client
+        # Let every job slot have a Gemini call in flight
+        llm_client.MAX_CONCURRENCY = max(llm_client.MAX_CONCURRENCY, args.concurrency)
+        worker = Worker(queue, concurrency=args.concurrency)
+        print(f"Worker {worker.name} running up to {args.concurrency} jobs from {queue.path}")
+        try:
+            stats = asyncio.run(worker.run(until_empty=args.until_empty))
+        except KeyboardInterrupt:
+            print("\nInterrupted. Unfinished jobs are picked up again once their leases expire.")
+            return
+        print(f"Processed {stats['processed']} jobs, {stats['failed']} failed attempts")
+    elif args.command == "status":
+        print(json.dumps(queue.get(args.job_id) if args.job_id else queue.counts(), indent=2, default=str))
+    else:
+        print(f"Deleted {queue.purge()} finished jobs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Incremental JSON parsing for streamed Gemini responses.
+
+The recommenders ask Gemini for one large JSON document. Instead of waiting
+for the whole body, IncrementalJsonParser is fed text chunks as they arrive
+and hands back each value at a watched path as soon as that value closes.
+Paths are dotted keys with ``*`` for "any array element", e.g.
+``recommended_courses.*`` or ``learning_path.*.courses.*``.
+
+Text before the document (a ```json fence, or prose such as "Here are
+[3] courses:") is skipped. The watched paths tell whether the document is
+an object or an array, and an opening bracket only counts once the next
+character could start its first key or element.
+"""
+import json
+
+# Pseudo-path for the complete response text, delivered once the stream ends
+DOCUMENT = "$"
+
+_WHITESPACE = " \t\r\n"
+# What may follow the opening bracket of a document
+_FIRST_AFTER = {"{": '"}', "[": '{["-0123456789]'}
+_LITERALS = {"t": "true", "f": "false", "n": "null"}
+
+
+def counts_toward_limit(path):
+    """Whether a value at `path` is an item for `limit`: an array element, not a summary field."""
+    return path.endswith("*")
+
+
+class IncrementalJsonParser:
+    """Character-level JSON scanner that emits completed values at watched paths."""
+
+    def __init__(self, paths):
+        self.patterns = {tuple(path.split(".")): path for path in paths if path != DOCUMENT}
+        # Paths like "recommended_courses.*" mean the document is an object, "*.title" an array
+        roots = {pattern[0] == "*" for pattern in self.patterns}
+        self._openers = "{[" if len(roots) != 1 else "[" if True in roots else "{"
+        self.text = ""
+        self.done = False
+        self._pos = 0
+        self._stack = []
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._string_is_key = False
+        self._capture = None
+
+    def _value_path(self):
+        path = []
+        for frame in self._stack:
+            path.append(frame["key"] if frame["type"] == "object" else "*")
+        return tuple(path)
+
+    def _start_value(self, index):
+        if self._capture is None:
+            pattern = self.patterns.get(self._value_path())
+            if pattern is not None:
+                self._capture = (pattern, index, len(self._stack))
+
+    def _finish_value(self, index, emitted):
+        if self._capture is not None and self._capture[2] == len(self._stack):
+            pattern, start, _ = self._capture
+            self._capture = None
+            try:
+                emitted.append((pattern, json.loads(self.text[start:index + 1])))
+            except json.JSONDecodeError:
+                pass
+
+    def _opens_document(self, text, index):
+        """Whether the bracket at text[index] starts the document; None until more text arrives."""
+        if text[index] not in self._openers:
+            return False
+        following = index + 1
+        while following < len(text) and text[following] in _WHITESPACE:
+            following += 1
+        if following == len(text):
+            return None
+        first = text[following]
+        literal = _LITERALS.get(first) if text[index] == "[" else None
+        if literal is not None:
+            # "[null" starts an array, "[note]" doesn't
+            rest = text[following:following + len(literal)]
+            return None if len(rest) < len(literal) and literal.startswith(rest) else rest == literal
+        return first in _FIRST_AFTER[text[index]]
+
+    def feed(self, chunk):
+        """Consumes a chunk of text and returns the (path, value) pairs it completed."""
+        emitted = []
+        self.text += chunk
+        if self.done:
+            return emitted
+        text = self.text
+        i = self._pos
+        end = len(text)
+        while i < end:
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._string_is_key:
+                        frame = self._stack[-1]
+                        frame["key"] = json.loads(text[self._string_start:i + 1])
+                        frame["expect"] = "colon"
+                    else:
+                        self._finish_value(i, emitted)
+                i += 1
+                continue
+
+            if not self._started:
+                opens = self._opens_document(text, i) if c in "{[" else False
+                if opens is None:
+                    break  # decided once the next chunk arrives
+                if not opens:
+                    i += 1
+                    continue
+                self._started = True
+
+            if c in _WHITESPACE:
+                pass
+            elif c in "{[":
+                self._start_value(i)
+                if c == "{":
+                    self._stack.append({"type": "object", "key": None, "expect": "key"})
+                else:
+                    self._stack.append({"type": "array"})
+            elif c in "}]":
+                self._stack.pop()
+                self._finish_value(i, emitted)
+                if not self._stack:
+                    self.done = True
+                    i += 1
+                    break
+            elif c == '"':
+                frame = self._stack[-1]
+                self._in_string = True
+                self._string_start = i
+                self._string_is_key = frame["type"] == "object" and frame["expect"] == "key"
+                if not self._string_is_key:
+                    self._start_value(i)
+            elif c == ":":
+                self._stack[-1]["expect"] = "value"
+            elif c == ",":
+                if self._stack[-1]["type"] == "object":
+                    self._stack[-1]["expect"] = "key"
+            i += 1
+        self._pos = i
+        return emitted
+
+
+def iter_items(chunks, paths, limit=None):
+    """Yields (path, value) pairs from an iterator of text chunks.
+
+    Include DOCUMENT in `paths` to receive (DOCUMENT, full_text) at the end.
+    Stops after `limit` items (see counts_toward_limit) and closes `chunks`,
+    which cancels the upstream generation when `chunks` is a streaming
+    response generator. Closing this generator early closes `chunks` too.
+    """
+    parser = IncrementalJsonParser(paths)
+    count = 0
+    try:
+        for chunk in chunks:
+            for item in parser.feed(chunk):
+                yield item
+                if counts_toward_limit(item[0]):
+                    count += 1
+                    if limit is not None and count >= limit:
+                        return
+        if DOCUMENT in paths:
+            yield DOCUMENT, parser.text
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+async def aiter_items(chunks, paths, limit=None):
+    """Async variant of iter_items for an async iterator of text chunks."""
+    parser = IncrementalJsonParser(paths)
+    count = 0
+    try:
+        async for chunk in chunks:
+            for item in parser.feed(chunk):
+                yield item
+                if counts_toward_limit(item[0]):
+                    count += 1
+                    if limit is not None and count >= limit:
+                        return
+        if DOCUMENT in paths:
+            yield DOCUMENT, parser.text
+    finally:
+        aclose = getattr(chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
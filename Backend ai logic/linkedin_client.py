@@ -0,0 +1,322 @@
+"""Pooled HTTP session, token store and conditional profile requests for the LinkedIn API.
+
+Every request goes through one requests.Session. Its connection pool keeps
+connections to LinkedIn open between calls, every call has connect and read
+timeouts, and connection errors, 429 and 5xx responses are retried with
+backoff (honouring Retry-After). A token exchange is only retried if it
+never reached LinkedIn, because an authorization code can be redeemed once.
+
+Access tokens are stored with their expiry in a SQLite file, so a later run
+reuses a token that is still valid (or refreshes it, when LinkedIn issued a
+refresh token) instead of going through OAuth again. Profile responses are
+stored with their ETag and revalidated with If-None-Match; on a 304 the
+stored copy is returned.
+
+LINKEDIN_OAUTH_URL and LINKEDIN_API_URL point the client at another server,
+such as benchmarks.fakes.FakeLinkedIn.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OAUTH_URL = "https://www.linkedin.com/oauth/v2"
+DEFAULT_API_URL = "https://api.linkedin.com/v2"
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "linkedin_tokens.sqlite3")
+
+# A token this close to its expiry counts as expired, so it can't run out mid-request
+EXPIRY_MARGIN = 300
+# Stored profiles nobody has revalidated for this long are deleted
+PROFILE_TTL = 30 * 24 * 3600
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def oauth_url():
+    return os.getenv("LINKEDIN_OAUTH_URL", DEFAULT_OAUTH_URL).rstrip("/")
+
+
+def api_url():
+    return os.getenv("LINKEDIN_API_URL", DEFAULT_API_URL).rstrip("/")
+
+
+def _timeout():
+    return (float(os.getenv("LINKEDIN_CONNECT_TIMEOUT", "3.05")), float(os.getenv("LINKEDIN_READ_TIMEOUT", "10")))
+
+
+# --- session -----------------------------------------------------------------
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def _build_session():
+    import requests  # only the LinkedIn flow needs it
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retries = int(os.getenv("LINKEDIN_RETRIES", "3"))
+    retry = Retry(
+        total=retries, connect=retries, read=retries, status=retries, backoff_factor=0.5,
+        status_forcelist=RETRY_STATUSES,
+        # Read errors and retryable statuses only repeat GETs; connection errors repeat anything
+        allowed_methods=frozenset({"GET"}),
+        respect_retry_after_header=True,
+        # Hand back the last response, so raise_for_status() reports its status
+        raise_on_status=False,
+    )
+    # One pool per host (www.linkedin.com and api.linkedin.com)
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=int(os.getenv("LINKEDIN_POOL_SIZE", "10")),
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session():
+    """Returns the shared session, creating it from LINKEDIN_* on first use (and after a fork)."""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                # A forked child must not reuse the parent's sockets
+                _session, _session_pid = _build_session(), os.getpid()
+    return _session
+
+
+def close_session():
+    """Closes the pooled connections; the next request builds a new session."""
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+    if session is not None:
+        session.close()
+
+
+# --- token and profile store -------------------------------------------------
+
+class TokenStore:
+    """SQLite file of access tokens per client ID and of profile responses with their ETags."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(path=os.getenv("LINKEDIN_TOKEN_PATH", DEFAULT_PATH))
+
+    def _connect(self):
+        # SQLite connections must not be shared across a fork
+        if self._conn is not None and self._pid != os.getpid():
+            self._conn = None
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS tokens (
+                    client_id TEXT PRIMARY KEY,
+                    access_token TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    refresh_token TEXT,
+                    refresh_expires_at REAL,
+                    scope TEXT,
+                    created_at REAL NOT NULL
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS profiles (
+                    key TEXT PRIMARY KEY,
+                    etag TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    validated_at REAL NOT NULL
+                )"""
+            )
+            conn.commit()
+            try:
+                os.chmod(self.path, 0o600)  # it holds credentials
+            except OSError:
+                pass
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get_token(self, client_id):
+        """Returns the stored token row for client_id (expired or not) as a dict, or None."""
+        with self._lock:
+            row = self._connect().execute("SELECT * FROM tokens WHERE client_id = ?", (client_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def save_token(self, client_id, payload):
+        """Stores a token endpoint response (access_token, expires_in, and optionally refresh_token)."""
+        now = time.time()
+        refresh_expires_in = payload.get("refresh_token_expires_in")
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO tokens VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (client_id, payload["access_token"], now + float(payload.get("expires_in", 0)),
+                 payload.get("refresh_token"), now + float(refresh_expires_in) if refresh_expires_in else None,
+                 payload.get("scope"), now),
+            )
+            conn.commit()
+
+    def forget_token(self, access_token):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM tokens WHERE access_token = ?", (access_token,))
+            conn.commit()
+
+    def get_profile(self, key):
+        """Returns (etag, body text) of a stored profile response, or None."""
+        with self._lock:
+            row = self._connect().execute("SELECT etag, body FROM profiles WHERE key = ?", (key,)).fetchone()
+        return (row["etag"], row["body"]) if row is not None else None
+
+    def save_profile(self, key, etag, body):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?)", (key, etag, body, now))
+            conn.execute("DELETE FROM profiles WHERE validated_at <= ?", (now - PROFILE_TTL,))
+            conn.commit()
+
+    def touch_profile(self, key):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("UPDATE profiles SET validated_at = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Returns the process-wide token store, configured from LINKEDIN_TOKEN_PATH on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TokenStore.from_env()
+    return _store
+
+
+def set_store(store):
+    """Replaces the token store (e.g. with one in a temporary directory); returns the old one."""
+    global _store
+    with _store_lock:
+        previous, _store = _store, store
+    return previous
+
+
+# --- API calls ---------------------------------------------------------------
+
+def _request_token(client_id, data, grant):
+    with tracing.span("linkedin.token", grant=grant) as span:
+        response = get_session().post(f"{oauth_url()}/accessToken", data=data, timeout=_timeout())
+        span.set_attribute("status_code", response.status_code)
+        response.raise_for_status()
+        payload = response.json()
+    if not payload.get("access_token"):
+        return None
+    get_store().save_token(client_id, payload)
+    return payload["access_token"]
+
+
+def exchange_code(auth_code, client_id, client_secret, redirect_uri):
+    """Redeems an authorization code; stores and returns the access token (None if LinkedIn sent none).
+
+    Raises requests.RequestException if the request fails.
+    """
+    return _request_token(client_id, {
+        "grant_type": "authorization_code",
+        "code": auth_code,
+        "redirect_uri": redirect_uri,
+        "client_id": client_id,
+        "client_secret": client_secret,
+    }, "authorization_code")
+
+
+def refresh_token(client_id, client_secret, token):
+    """Trades a refresh token for a new access token, which is stored and returned."""
+    return _request_token(client_id, {
+        "grant_type": "refresh_token",
+        "refresh_token": token,
+        "client_id": client_id,
+        "client_secret": client_secret,
+    }, "refresh_token")
+
+
+def cached_access_token(client_id, client_secret=None):
+    """Returns a stored access token that is still valid, refreshing an expired one if possible.
+
+    Returns None when the caller has to go through the authorization flow.
+    """
+    import requests
+
+    row = get_store().get_token(client_id)
+    if row is None:
+        return None
+    now = time.time()
+    if row["expires_at"] - EXPIRY_MARGIN > now:
+        return row["access_token"]
+    refresh_expires_at = row["refresh_expires_at"]
+    if row["refresh_token"] and client_secret and (refresh_expires_at is None
+                                                   or refresh_expires_at - EXPIRY_MARGIN > now):
+        try:
+            return refresh_token(client_id, client_secret, row["refresh_token"])
+        except requests.exceptions.RequestException as e:
+            logger.warning("Could not refresh the LinkedIn access token: %s", e)
+            if getattr(e, "response", None) is None or e.response.status_code >= 500:
+                return None  # keep the refresh token for the next attempt
+    get_store().forget_token(row["access_token"])
+    return None
+
+
+def get_profile(access_token, path="me"):
+    """GETs an API resource, revalidating a stored copy with its ETag.
+
+    A 401 forgets the token, so the next login goes through OAuth again.
+    Raises requests.RequestException if the request fails.
+    """
+    url = f"{api_url()}/{path}"
+    # Keyed by a hash, so the file holds no more copies of the token than necessary
+    key = hashlib.sha256(f"{access_token}\0{url}".encode("utf-8")).hexdigest()
+    store = get_store()
+    cached = store.get_profile(key)
+    headers = {"Authorization": f"Bearer {access_token}", "X-Restli-Protocol-Version": "2.0.0"}
+    if cached is not None:
+        headers["If-None-Match"] = cached[0]
+    with tracing.span("linkedin.profile", path=path, revalidated=cached is not None) as span:
+        response = get_session().get(url, headers=headers, timeout=_timeout())
+        span.set_attribute("status_code", response.status_code)
+        if response.status_code == 304 and cached is not None:
+            store.touch_profile(key)
+            return json.loads(cached[1])
+        if response.status_code == 401:
+            store.forget_token(access_token)
+        response.raise_for_status()
+        body = response.json()
+    etag = response.headers.get("ETag")
+    if etag:
+        store.save_profile(key, etag, response.text)
+    return body
@@ -0,0 +1,414 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+
+import metrics
+import tracing
+from response_cache import ResponseCache, cache_key
+from singleflight import SingleFlight
+from rate_limit import limiter_for
+
+logger = logging.getLogger(__name__)
+
+_cache = None
+
+# Identical prompts already in flight share one upstream request
+_flights = SingleFlight()
+FLIGHT_TIMEOUT = float(os.getenv("LLM_SINGLEFLIGHT_TIMEOUT", "120"))
+
+# Upper bound on concurrent async Gemini calls per event loop
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+_semaphores = weakref.WeakKeyDictionary()
+
+
+_models = {}
+_models_lock = threading.Lock()
+_env_loaded = False
+
+
+def load_env():
+    """Reads .env into the environment once per process."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def missing_credentials(*names):
+    """Names of the given environment variables that are unset, after reading .env."""
+    load_env()
+    return [name for name in names if not os.getenv(name)]
+
+
+def get_model(name):
+    """Returns the shared GenerativeModel for a model name.
+
+    google.generativeai is imported and configured on the first call, not
+    when a recommender module is imported, so importing one is cheap and
+    never fails for lack of an API key.
+    """
+    model = _models.get(name)
+    if model is None:
+        with _models_lock:
+            model = _models.get(name)
+            if model is None:
+                if missing_credentials("GOOGLE_API_KEY"):
+                    raise RuntimeError("GOOGLE_API_KEY is not set; add it to .env or the environment")
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+                model = _models[name] = genai.GenerativeModel(name)
+    return model
+
+
+class LazyModel:
+    """Stands in for a GenerativeModel and builds the real one on first use.
+
+    model_name is known up front, so cache keys, rate limits and schema
+    support can be worked out without touching the SDK.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.model_name = name if name.startswith("models/") else f"models/{name}"
+
+    def __getattr__(self, attribute):
+        return getattr(get_model(self.name), attribute)
+
+    def __repr__(self):
+        return f"LazyModel({self.name!r})"
+
+
+def get_cache():
+    """Returns the process-wide response cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache.from_env()
+    return _cache
+
+
+def model_name_of(model):
+    return getattr(model, "model_name", None) or str(model)
+
+
+def response_text(response):
+    """Returns the text of a Gemini response, joining the parts if needed."""
+    try:
+        return response.text
+    except (AttributeError, ValueError):
+        parts = response.candidates[0].content.parts
+        return ''.join(part.text for part in parts)
+
+
+def metrics_label(model_name):
+    # Metrics use the bare model name, as the rate limiter does
+    return model_name.split("/")[-1]
+
+
+def log_usage(pipeline, model_name, response):
+    """Logs the token cost Gemini reported for a call and adds it to the token metrics."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    label = metrics_label(model_name)
+    for direction, count in (("input", getattr(usage, "prompt_token_count", None)),
+                             ("output", getattr(usage, "candidates_token_count", None))):
+        if isinstance(count, int):
+            metrics.LLM_TOKENS.inc(pipeline, label, direction, amount=count)
+    logger.info(
+        "tokens pipeline=%s model=%s prompt=%s output=%s total=%s",
+        pipeline,
+        model_name,
+        getattr(usage, "prompt_token_count", None),
+        getattr(usage, "candidates_token_count", None),
+        getattr(usage, "total_token_count", None),
+    )
+
+
+def _timed(pipeline, model_name, stream):
+    # A stream counts until its last chunk; one its consumer abandons isn't recorded
+    return metrics.LLM_REQUEST_SECONDS.time(
+        pipeline, metrics_label(model_name), "true" if stream else "false", errors=metrics.LLM_ERRORS)
+
+
+def _span(model, pipeline, stream):
+    return tracing.span("llm.generate", pipeline=pipeline, model=metrics_label(model_name_of(model)), stream=stream)
+
+
+def _count_lookup(pipeline, use_cache, cached):
+    if not use_cache:
+        result = "bypass"
+    else:
+        result = "miss" if cached is None else "hit"
+    metrics.LLM_CACHE_LOOKUPS.inc(pipeline, result)
+    tracing.current().set_attribute("cache", result)
+
+
+def cache_identity(model, generation_config=None):
+    """Name a response is cached under: the model, plus a fingerprint of any generation config."""
+    model_name = model_name_of(model)
+    if not generation_config:
+        return model_name
+    config = json.dumps(generation_config, sort_keys=True, default=str)
+    return f"{model_name}#{hashlib.sha256(config.encode('utf-8')).hexdigest()[:12]}"
+
+
+def _chunk_text(chunk):
+    # Stream chunks can carry only metadata (e.g. the final finish_reason)
+    try:
+        return response_text(chunk)
+    except (AttributeError, IndexError, ValueError):
+        return ''
+
+
+def generate_text(model, prompt, pipeline, bypass_cache=False, generation_config=None):
+    """Calls model.generate_content through the shared response cache and returns the text.
+
+    generation_config is passed through to Gemini (e.g. structured JSON output)
+    and is part of the cache key, so different configs don't share responses.
+    """
+    with _span(model, pipeline, stream=False):
+        cache = get_cache()
+        model_name = model_name_of(model)
+        cached_as = cache_identity(model, generation_config)
+        use_cache = not (bypass_cache or cache.bypass)
+
+        cached = None
+        if use_cache:
+            try:
+                cached = cache.get(cached_as, prompt, pipeline)
+            except sqlite3.Error as e:
+                logger.warning("Response cache unavailable: %s", e)
+                use_cache = False
+        _count_lookup(pipeline, use_cache, cached)
+        if cached is not None:
+            return cached
+
+        def call():
+            limiter = limiter_for(model_name)
+            with _timed(pipeline, model_name, stream=False), tracing.span("gemini.generate_content"):
+                response = limiter.call(
+                    lambda: model.generate_content(prompt, generation_config=generation_config), prompt)
+            log_usage(pipeline, model_name, response)
+            text = response_text(response)
+            if use_cache:
+                try:
+                    cache.set(cached_as, prompt, pipeline, text)
+                except sqlite3.Error as e:
+                    logger.warning("Could not store response in cache: %s", e)
+            return text
+
+        return _flights.do(cache_key(cached_as, prompt), call, timeout=FLIGHT_TIMEOUT)
+
+
+def flight_stats():
+    """Returns how many upstream calls were made and how many were collapsed into them."""
+    return _flights.stats()
+
+
+def _flight_metrics():
+    stats = _flights.stats()
+    return [
+        ("llm_singleflight_calls_total", "counter", "Upstream Gemini calls made by the request coalescer.",
+         (), {(): stats["calls"]}),
+        ("llm_singleflight_collapsed_total", "counter", "Identical requests that shared an in-flight call.",
+         (), {(): stats["collapsed"]}),
+    ]
+
+
+metrics.register_collector(_flight_metrics)
+
+
+def discard_cached(model, prompt, generation_config=None):
+    """Drops a cached response that the caller could not use."""
+    get_cache().discard(cache_identity(model, generation_config), prompt)
+
+
+def _semaphore():
+    # asyncio primitives are bound to one loop, so keep one per running loop
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENCY)
+    return semaphore
+
+
+async def generate_text_async(model, prompt, pipeline, bypass_cache=False, generation_config=None):
+    """Async counterpart of generate_text built on model.generate_content_async.
+
+    At most MAX_CONCURRENCY calls are in flight per event loop; cancelling the
+    awaiting task cancels the upstream request.
+    """
+    with _span(model, pipeline, stream=False):
+        cache = get_cache()
+        model_name = model_name_of(model)
+        cached_as = cache_identity(model, generation_config)
+        use_cache = not (bypass_cache or cache.bypass)
+
+        cached = None
+        if use_cache:
+            try:
+                cached = await asyncio.to_thread(cache.get, cached_as, prompt, pipeline)
+            except sqlite3.Error as e:
+                logger.warning("Response cache unavailable: %s", e)
+                use_cache = False
+        _count_lookup(pipeline, use_cache, cached)
+        if cached is not None:
+            return cached
+
+        async def call():
+            limiter = limiter_for(model_name)
+            async with _semaphore():
+                with _timed(pipeline, model_name, stream=False), tracing.span("gemini.generate_content"):
+                    response = await limiter.call_async(
+                        lambda: model.generate_content_async(prompt, generation_config=generation_config), prompt)
+            log_usage(pipeline, model_name, response)
+            text = response_text(response)
+            if use_cache:
+                try:
+                    await asyncio.to_thread(cache.set, cached_as, prompt, pipeline, text)
+                except sqlite3.Error as e:
+                    logger.warning("Could not store response in cache: %s", e)
+            return text
+
+        return await _flights.do_async(cache_key(cached_as, prompt), call, timeout=FLIGHT_TIMEOUT)
+
+
+async def gather_bounded(coroutines, limit=None, timeout=None):
+    """Runs coroutines concurrently and returns their results in order.
+
+    At most `limit` run at once. If one fails or `timeout` seconds pass, the
+    others are cancelled and the error is raised.
+    """
+    semaphore = asyncio.Semaphore(limit or MAX_CONCURRENCY)
+    coroutines = list(coroutines)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    tasks = [asyncio.ensure_future(run(c)) for c in coroutines]
+    try:
+        return await asyncio.wait_for(asyncio.gather(*tasks), timeout)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # A task cancelled before it first ran never awaited its coroutine, which
+        # would warn "never awaited"; closing a finished coroutine does nothing
+        for coroutine in coroutines:
+            coroutine.close()
+        raise
+
+
+def stream_text(model, prompt, pipeline, bypass_cache=False, generation_config=None):
+    """Yields response text chunks as Gemini produces them (stream=True).
+
+    A cached response is yielded as a single chunk. The full text is cached
+    only if the stream is consumed to the end.
+    """
+    return tracing.iter_in_span(
+        _stream_text(model, prompt, pipeline, bypass_cache, generation_config), _span(model, pipeline, stream=True))
+
+
+def _stream_text(model, prompt, pipeline, bypass_cache, generation_config):
+    cache = get_cache()
+    model_name = model_name_of(model)
+    cached_as = cache_identity(model, generation_config)
+    use_cache = not (bypass_cache or cache.bypass)
+
+    cached = None
+    if use_cache:
+        try:
+            cached = cache.get(cached_as, prompt, pipeline)
+        except sqlite3.Error as e:
+            logger.warning("Response cache unavailable: %s", e)
+            use_cache = False
+    _count_lookup(pipeline, use_cache, cached)
+    if cached is not None:
+        yield cached
+        return
+
+    chunks = []
+    limiter = limiter_for(model_name)
+    with _timed(pipeline, model_name, stream=True):
+        # Streams are retried only if they fail before producing any text
+        with tracing.span("gemini.generate_content"):
+            response = limiter.stream(
+                lambda: model.generate_content(prompt, stream=True, generation_config=generation_config), prompt)
+        last_chunk = None
+        try:
+            for chunk in response:
+                last_chunk = chunk
+                text = _chunk_text(chunk)
+                if text:
+                    chunks.append(text)
+                    yield text
+        finally:
+            # Frees the concurrency slot if the caller stops reading early
+            response.close()
+    # The final chunk carries the usage for the whole stream
+    log_usage(pipeline, model_name, last_chunk)
+
+    if use_cache:
+        try:
+            cache.set(cached_as, prompt, pipeline, ''.join(chunks))
+        except sqlite3.Error as e:
+            logger.warning("Could not store response in cache: %s", e)
+
+
+def stream_text_async(model, prompt, pipeline, bypass_cache=False, generation_config=None):
+    """Async counterpart of stream_text; closing the generator cancels the upstream stream."""
+    return tracing.aiter_in_span(
+        _stream_text_async(model, prompt, pipeline, bypass_cache, generation_config),
+        _span(model, pipeline, stream=True))
+
+
+async def _stream_text_async(model, prompt, pipeline, bypass_cache, generation_config):
+    cache = get_cache()
+    model_name = model_name_of(model)
+    cached_as = cache_identity(model, generation_config)
+    use_cache = not (bypass_cache or cache.bypass)
+
+    cached = None
+    if use_cache:
+        try:
+            cached = await asyncio.to_thread(cache.get, cached_as, prompt, pipeline)
+        except sqlite3.Error as e:
+            logger.warning("Response cache unavailable: %s", e)
+            use_cache = False
+    _count_lookup(pipeline, use_cache, cached)
+    if cached is not None:
+        yield cached
+        return
+
+    chunks = []
+    limiter = limiter_for(model_name)
+    async with _semaphore():
+        with _timed(pipeline, model_name, stream=True):
+            with tracing.span("gemini.generate_content"):
+                response = await limiter.stream_async(lambda: model.generate_content_async(
+                    prompt, stream=True, generation_config=generation_config), prompt)
+            last_chunk = None
+            try:
+                async for chunk in response:
+                    last_chunk = chunk
+                    text = _chunk_text(chunk)
+                    if text:
+                        chunks.append(text)
+                        yield text
+            finally:
+                await response.aclose()
+    log_usage(pipeline, model_name, last_chunk)
+
+    if use_cache:
+        try:
+            await asyncio.to_thread(cache.set, cached_as, prompt, pipeline, ''.join(chunks))
+        except sqlite3.Error as e:
+            logger.warning("Could not store response in cache: %s", e)
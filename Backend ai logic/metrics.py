@@ -0,0 +1,243 @@
+"""Counters and latency histograms for Gemini calls and MongoDB operations.
+
+llm_client, rate_limit and schemas record every generate_content call: its
+latency per pipeline and model, the tokens Gemini reported, retries,
+response cache lookups and parse failures. db_helpers times each MongoDB
+operation. render() returns all of it in the Prometheus text format (the
+/metrics view serves it), plus gauges that registered collectors read from
+the rate limiters and caches at scrape time.
+
+Values are per process; with several workers, scrape each of them. With
+METRICS_ENABLED=0 every inc()/observe() returns before taking a lock, so
+the instrumentation costs a global lookup per call.
+"""
+import bisect
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_enabled = os.getenv("METRICS_ENABLED", "1").strip().lower() not in ("0", "false", "no", "off")
+
+# Gemini calls take seconds, MongoDB operations milliseconds
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_metrics = []
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+def enabled():
+    return _enabled
+
+
+def set_enabled(value):
+    """Turns recording on or off for the whole process (e.g. to measure its overhead)."""
+    global _enabled
+    _enabled = bool(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _metrics.append(self)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """Monotonic count per label values, e.g. LLM_TOKENS.inc("learning_path", "gemini-pro", "input", amount=812)."""
+
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, labels, (), value) for labels, value in self._values.items()]
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "errors", "start")
+
+    def __init__(self, histogram, labels, errors):
+        self.histogram = histogram
+        self.labels = labels
+        self.errors = errors
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None or self.errors is None:
+            self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        elif issubclass(exc_type, Exception):
+            self.errors.inc(*self.labels)
+
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_TIMER = _NoTimer()
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (seconds) over fixed buckets, per label values."""
+
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LLM_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        if not _enabled:
+            return
+        # Buckets are upper bounds (le), so a value equal to a bound counts in that bucket
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, *labels, errors=None):
+        """Context manager that observes how long its block took.
+
+        With `errors` (a Counter with the same labels), a block that raises
+        is counted there instead, and one interrupted by GeneratorExit or
+        cancellation is not recorded at all.
+        """
+        return _Timer(self, labels, errors) if _enabled else _NO_TIMER
+
+    def count(self, *labels):
+        with self._lock:
+            entry = self._values.get(labels)
+            return entry[2] if entry else 0
+
+    def samples(self):
+        with self._lock:
+            entries = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._values.items()]
+        samples = []
+        bounds = [_number(bound) for bound in self.buckets] + ["+Inf"]
+        for labels, counts, total, count in entries:
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", labels, (("le", bound),), cumulative))
+            samples.append((f"{self.name}_sum", labels, (), total))
+            samples.append((f"{self.name}_count", labels, (), count))
+        return samples
+
+
+def register_collector(collect):
+    """Adds a function called on every render().
+
+    It returns a list of (name, type, help, label names, {label values: value}),
+    typically gauges or counters read from a component's own stats().
+    """
+    with _registry_lock:
+        if collect not in _collectors:
+            _collectors.append(collect)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return str(int(value)) if value.is_integer() else repr(value)
+    return str(value)
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _family(lines, name, type, help, label_names, samples):
+    lines.append(f"# HELP {name} {help}")
+    lines.append(f"# TYPE {name} {type}")
+    for sample_name, values, extra, value in samples:
+        lines.append(f"{sample_name}{_labels(label_names, values, extra)} {_number(value)}")
+
+
+def render():
+    """Every metric and collector in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_metrics)
+        collectors = list(_collectors)
+    lines = []
+    for metric in metrics:
+        _family(lines, metric.name, metric.type, metric.help, metric.labels, metric.samples())
+    for collect in collectors:
+        try:
+            families = collect()
+        except Exception as e:
+            logger.warning("Metrics collector %s failed: %s", getattr(collect, "__qualname__", collect), e)
+            continue
+        for name, type, help, label_names, values in families:
+            _family(lines, name, type, help, label_names,
+                    [(name, labels, (), value) for labels, value in values.items()])
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """Clears every recorded value (collectors are unaffected)."""
+    with _registry_lock:
+        metrics = list(_metrics)
+    for metric in metrics:
+        metric.reset()
+
+
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_seconds", "Gemini generate_content latency, including rate limit waits and retries.",
+    ("pipeline", "model", "stream"), LLM_BUCKETS)
+LLM_ERRORS = Counter("llm_errors_total", "Gemini calls that failed after all retries.",
+                     ("pipeline", "model", "stream"))
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens Gemini reported using.", ("pipeline", "model", "direction"))
+LLM_RETRIES = Counter("llm_retries_total", "Gemini calls retried, by the status that caused the retry.",
+                      ("model", "status"))
+LLM_CACHE_LOOKUPS = Counter("llm_cache_lookups_total", "Response cache lookups (hit, miss or bypass).",
+                            ("pipeline", "result"))
+LLM_PARSES = Counter("llm_parse_total", "Responses parsed against the pipeline schema (ok or failed).",
+                     ("pipeline", "result"))
+DB_OPERATION_SECONDS = Histogram(
+    "mongo_operation_seconds", "db_helpers MongoDB operation latency.", ("operation", "collection"), DB_BUCKETS)
+DB_ERRORS = Counter("mongo_errors_total", "db_helpers MongoDB operations that raised.", ("operation", "collection"))
@@ -1,51 +1,51 @@
-import google.generativeai as genai
-import requests
+import asyncio
 import json
+import logging
 import os
 import sys
-from dotenv import load_dotenv
+from llm_client import (
+    LazyModel, generate_text, generate_text_async, gather_bounded, load_env, missing_credentials, stream_text,
+    stream_text_async,
+)
+from schemas import generation_config, parse_response
+from skill_canon import canonical_names
+from prompts import extraction_prompt, job_suggestions_prompt, learning_path_prompt
+import linkedin_client
 
-# Load environment variables from .env file
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-# Configure your API keys and credentials
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-LINKEDIN_CLIENT_ID = os.getenv("LINKEDIN_CLIENT_ID")
-LINKEDIN_CLIENT_SECRET = os.getenv("LINKEDIN_CLIENT_SECRET")
 LINKEDIN_REDIRECT_URI = "http://127.0.0.1:8000/social-auth/complete/linkedin-oauth2/"  # Should match your LinkedIn app configuration
+REQUIRED_CREDENTIALS = ("GOOGLE_API_KEY", "LINKEDIN_CLIENT_ID", "LINKEDIN_CLIENT_SECRET")
+# What the text pipelines return instead of raising when generation fails
+JOB_SUGGESTIONS_ERROR = "Error generating job suggestions. Please try again."
+LEARNING_PATH_ERROR = "Error generating learning path. Please try again."
 
-# Check for required credentials
-missing_credentials = []
-if not GOOGLE_API_KEY:
-    missing_credentials.append("GOOGLE_API_KEY")
-if not LINKEDIN_CLIENT_ID:
-    missing_credentials.append("LINKEDIN_CLIENT_ID")
-if not LINKEDIN_CLIENT_SECRET:
-    missing_credentials.append("LINKEDIN_CLIENT_SECRET")
+def is_error_message(text):
+    """Whether a text pipeline returned its failure message instead of an answer."""
+    return isinstance(text, str) and text in (JOB_SUGGESTIONS_ERROR, LEARNING_PATH_ERROR)
 
-if missing_credentials:
-    print(f"Error: Missing required environment variables: {', '.join(missing_credentials)}")
-    print("Please create a .env file with these variables or set them in your environment.")
-    print("Example .env file:")
-    print('GOOGLE_API_KEY="your_gemini_api_key"')
-    print('LINKEDIN_CLIENT_ID="your_linkedin_client_id"')
-    print('LINKEDIN_CLIENT_SECRET="your_linkedin_client_secret"')
-    sys.exit(1)
+# Gemini is configured on the first call, so importing this module has no side effects
+model = LazyModel('gemini-pro')
 
-# Configure Gemini
-try:
-    genai.configure(api_key=GOOGLE_API_KEY)
-    model = genai.GenerativeModel('gemini-pro')
-except Exception as e:
-    print(f"Error configuring Gemini API: {e}")
-    sys.exit(1)
+def check_credentials():
+    """Exits with instructions if any credential the CLI needs is missing (reads .env first)."""
+    missing = missing_credentials(*REQUIRED_CREDENTIALS)
+    if missing:
+        print(f"Error: Missing required environment variables: {', '.join(missing)}")
+        print("Please create a .env file with these variables or set them in your environment.")
+        print("Example .env file:")
+        print('GOOGLE_API_KEY="your_gemini_api_key"')
+        print('LINKEDIN_CLIENT_ID="your_linkedin_client_id"')
+        print('LINKEDIN_CLIENT_SECRET="your_linkedin_client_secret"')
+        sys.exit(1)
 
 def get_linkedin_auth_url():
     """Generates the LinkedIn authorization URL."""
-    auth_url = "https://www.linkedin.com/oauth/v2/authorization"
+    load_env()
+    auth_url = f"{linkedin_client.oauth_url()}/authorization"
     params = {
         "response_type": "code",
-        "client_id": LINKEDIN_CLIENT_ID,
+        "client_id": os.getenv("LINKEDIN_CLIENT_ID"),
         "redirect_uri": LINKEDIN_REDIRECT_URI,
         "state": "random_string",
         "scope": "r_liteprofile r_emailaddress"  # Updated scope to use available permissions
@@ -53,45 +53,39 @@ def get_linkedin_auth_url():
     return f"{auth_url}?{'&'.join([f'{k}={v}' for k, v in params.items()])}"
 
 def get_linkedin_access_token(auth_code):
-    """Gets an access token from LinkedIn using authorization code."""
-    token_url = "https://www.linkedin.com/oauth/v2/accessToken"
-    token_params = {
-        "grant_type": "authorization_code",
-        "code": auth_code,
-        "redirect_uri": LINKEDIN_REDIRECT_URI,
-        "client_id": LINKEDIN_CLIENT_ID,
-        "client_secret": LINKEDIN_CLIENT_SECRET,
-    }
-    
+    """Gets an access token from LinkedIn using authorization code, and saves it for later runs."""
+    import requests  # only the LinkedIn flow needs it
+
+    load_env()
     try:
-        token_response = requests.post(token_url, data=token_params)
-        token_response.raise_for_status()
-        return token_response.json().get("access_token")
+        return linkedin_client.exchange_code(
+            auth_code, os.getenv("LINKEDIN_CLIENT_ID"), os.getenv("LINKEDIN_CLIENT_SECRET"), LINKEDIN_REDIRECT_URI
+        )
     except requests.exceptions.HTTPError as e:
-        print(f"LinkedIn API Error: {e}")
-        print(f"Response: {token_response.text}")
+        logger.error("LinkedIn token request failed: %s; response: %s", e, e.response.text)
+        return None
+    except requests.exceptions.RequestException as e:
+        logger.error("LinkedIn token request failed: %s", e)
         return None
 
+def cached_linkedin_access_token():
+    """Returns the access token saved by an earlier login if it is still valid, else None."""
+    load_env()
+    return linkedin_client.cached_access_token(os.getenv("LINKEDIN_CLIENT_ID"), os.getenv("LINKEDIN_CLIENT_SECRET"))
+
 def get_linkedin_profile_data(access_token):
     """Fetches LinkedIn profile data from the API."""
-    profile_url_api = "https://api.linkedin.com/v2/me"
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "X-Restli-Protocol-Version": "2.0.0"
-    }
-    
+    import requests
+
     try:
-        profile_response = requests.get(profile_url_api, headers=headers)
-        profile_response.raise_for_status()
-        profile_data = profile_response.json()
-        
         # Get skills (This would require a different API endpoint and permissions)
         # For simplicity, we'll use manual input for skills in this example
-        
-        return profile_data
+        return linkedin_client.get_profile(access_token)
     except requests.exceptions.HTTPError as e:
-        print(f"LinkedIn API Error: {e}")
-        print(f"Response: {profile_response.text if 'profile_response' in locals() else 'No response'}")
+        logger.error("LinkedIn profile request failed: %s; response: %s", e, e.response.text)
+        return None
+    except requests.exceptions.RequestException as e:
+        logger.error("LinkedIn profile request failed: %s", e)
         return None
 
 def manually_collect_profile_data():
@@ -129,100 +123,142 @@ def manually_collect_profile_data():
         except ValueError:
             print("Invalid format. Please use 'Company | Title | Years'")
     
+    # "JS", "javascript" and "Java Script" become one skill
+    profile_data["skills"] = canonical_names(profile_data["skills"])
     return profile_data
 
-def extract_skills_and_experience(profile_data):
-    """Extracts skills, experience, and other relevant information."""
-    try:
-        prompt = f"""Extract technical skills, soft skills, industry knowledge, and years of experience from the following profile data:
-        Skills: {profile_data.get('skills', [])}
-        Experience: {profile_data.get('experience', [])}
+def build_extraction_prompt(profile_data):
+    """Builds the prompt that extracts structured skills from raw profile data."""
+    return extraction_prompt(profile_data, model)
 
-        Output the data in JSON format, including:
-        1. Technical skills
-        2. Soft skills
-        3. Industry knowledge
-        4. Years of experience in each skill (if mentioned)
-        5. Proficiency level (if indicated)
-        """
+def parse_extracted_data(text):
+    """Parses the extraction response and checks it against the extraction schema."""
+    data, error = parse_response("extract_skills", text)
+    if error:
+        logger.warning("Could not parse extracted data: %s", error)
+        # If we can't parse JSON, return the text response
+        return {"extracted_text": text}
+    return data
 
-        response = model.generate_content(prompt)
-        try:
-            # Try to parse as JSON, but handle text response as well
-            if hasattr(response, 'text'):
-                # Find JSON in the response if it's not a pure JSON response
-                text = response.text
-                json_start = text.find('{')
-                json_end = text.rfind('}') + 1
-                if json_start >= 0 and json_end > json_start:
-                    json_str = text[json_start:json_end]
-                    try:
-                        return json.loads(json_str)
-                    except json.JSONDecodeError:
-                        pass
-                
-                # If we can't parse JSON, return the text response
-                return {"extracted_text": text}
-            else:
-                # Handle the response object structure
-                parts = response.candidates[0].content.parts
-                text = ''.join(part.text for part in parts)
-                try:
-                    return json.loads(text)
-                except json.JSONDecodeError:
-                    return {"extracted_text": text}
-        except (json.JSONDecodeError, AttributeError, IndexError) as e:
-            print(f"Error processing Gemini response: {e}")
-            if hasattr(response, 'text'):
-                return {"extracted_text": response.text}
-            return {"error": "Could not extract data"}
+def build_job_suggestions_prompt(extracted_data, target_industry):
+    return job_suggestions_prompt(extracted_data, target_industry, model)
+
+def build_learning_path_prompt(extracted_data, job_choice):
+    return learning_path_prompt(extracted_data, job_choice, model)
+
+def extract_skills_and_experience(profile_data, bypass_cache=False):
+    """Extracts skills, experience, and other relevant information."""
+    try:
+        prompt = build_extraction_prompt(profile_data)
+        config = generation_config("extract_skills", model)
+        text = generate_text(
+            model, prompt, "extract_skills", bypass_cache=bypass_cache, generation_config=config)
+        return parse_extracted_data(text)
     except Exception as e:
-        print(f"Error generating content: {e}")
+        logger.exception("Could not extract skills and experience")
         return {"error": f"Could not extract data: {str(e)}"}
 
-def generate_job_suggestions(extracted_data, target_industry):
+def generate_job_suggestions(extracted_data, target_industry, bypass_cache=False):
     """Generates job suggestions based on extracted data and target industry."""
-    prompt = f"""Based on the following profile data:
-    {json.dumps(extracted_data, indent=4)}
+    prompt = build_job_suggestions_prompt(extracted_data, target_industry)
+    try:
+        return generate_text(model, prompt, "job_suggestions", bypass_cache=bypass_cache)
+    except Exception:
+        logger.exception("Error generating job suggestions")
+        return JOB_SUGGESTIONS_ERROR
+
+def generate_learning_path(extracted_data, job_choice, bypass_cache=False):
+    """Generates a learning path for a chosen career path."""
+    prompt = build_learning_path_prompt(extracted_data, job_choice)
+    try:
+        return generate_text(model, prompt, "learning_path", bypass_cache=bypass_cache)
+    except Exception:
+        logger.exception("Error generating learning path")
+        return LEARNING_PATH_ERROR
 
-    And the user's target industry: {target_industry}
+def stream_job_suggestions(extracted_data, target_industry, bypass_cache=False):
+    """Yields job suggestion text chunks as they are generated."""
+    prompt = build_job_suggestions_prompt(extracted_data, target_industry)
+    try:
+        yield from stream_text(model, prompt, "job_suggestions", bypass_cache=bypass_cache)
+    except Exception:
+        logger.exception("Error generating job suggestions")
+        yield JOB_SUGGESTIONS_ERROR
 
-    Recommend 3 to 5 suitable job titles and roles, considering the user's skills and experience.
-    Provide a brief description of each role and why it's a good fit.
-    """
+def stream_learning_path(extracted_data, job_choice, bypass_cache=False):
+    """Yields learning path text chunks as they are generated."""
+    prompt = build_learning_path_prompt(extracted_data, job_choice)
     try:
-        response = model.generate_content(prompt)
-        if hasattr(response, 'text'):
-            return response.text
-        else:
-            parts = response.candidates[0].content.parts
-            return ''.join(part.text for part in parts)
+        yield from stream_text(model, prompt, "learning_path", bypass_cache=bypass_cache)
+    except Exception:
+        logger.exception("Error generating learning path")
+        yield LEARNING_PATH_ERROR
+
+async def extract_skills_and_experience_async(profile_data, bypass_cache=False):
+    """Async variant of extract_skills_and_experience."""
+    try:
+        prompt = await asyncio.to_thread(build_extraction_prompt, profile_data)
+        config = generation_config("extract_skills", model)
+        text = await generate_text_async(
+            model, prompt, "extract_skills", bypass_cache=bypass_cache, generation_config=config)
+        return parse_extracted_data(text)
     except Exception as e:
-        print(f"Error generating job suggestions: {e}")
-        return "Error generating job suggestions. Please try again."
+        logger.exception("Could not extract skills and experience")
+        return {"error": f"Could not extract data: {str(e)}"}
 
-def generate_learning_path(extracted_data, job_choice):
-    """Generates a learning path for a chosen career path."""
-    prompt = f"""Based on the following profile data:
-    {json.dumps(extracted_data, indent=4)}
+async def generate_job_suggestions_async(extracted_data, target_industry, bypass_cache=False):
+    """Async variant of generate_job_suggestions."""
+    # Fitting the prompt counts tokens, which may call the API
+    prompt = await asyncio.to_thread(build_job_suggestions_prompt, extracted_data, target_industry)
+    try:
+        return await generate_text_async(model, prompt, "job_suggestions", bypass_cache=bypass_cache)
+    except Exception:
+        logger.exception("Error generating job suggestions")
+        return JOB_SUGGESTIONS_ERROR
 
-    And the user's chosen career path: {job_choice}
+async def generate_learning_path_async(extracted_data, job_choice, bypass_cache=False):
+    """Async variant of generate_learning_path."""
+    prompt = await asyncio.to_thread(build_learning_path_prompt, extracted_data, job_choice)
+    try:
+        return await generate_text_async(model, prompt, "learning_path", bypass_cache=bypass_cache)
+    except Exception:
+        logger.exception("Error generating learning path")
+        return LEARNING_PATH_ERROR
 
-    Recommend a detailed learning path, including specific skills to acquire, courses, platforms, projects, and networking strategies.
-    Explain how this path will help the user achieve their career goal.
-    """
+async def stream_job_suggestions_async(extracted_data, target_industry, bypass_cache=False):
+    """Async variant of stream_job_suggestions."""
+    prompt = await asyncio.to_thread(build_job_suggestions_prompt, extracted_data, target_industry)
     try:
-        response = model.generate_content(prompt)
-        if hasattr(response, 'text'):
-            return response.text
-        else:
-            parts = response.candidates[0].content.parts
-            return ''.join(part.text for part in parts)
-    except Exception as e:
-        print(f"Error generating learning path: {e}")
-        return "Error generating learning path. Please try again."
+        async for chunk in stream_text_async(model, prompt, "job_suggestions", bypass_cache=bypass_cache):
+            yield chunk
+    except Exception:
+        logger.exception("Error generating job suggestions")
+        yield JOB_SUGGESTIONS_ERROR
+
+async def stream_learning_path_async(extracted_data, job_choice, bypass_cache=False):
+    """Async variant of stream_learning_path."""
+    prompt = await asyncio.to_thread(build_learning_path_prompt, extracted_data, job_choice)
+    try:
+        async for chunk in stream_text_async(model, prompt, "learning_path", bypass_cache=bypass_cache):
+            yield chunk
+    except Exception:
+        logger.exception("Error generating learning path")
+        yield LEARNING_PATH_ERROR
+
+async def generate_job_suggestions_for_industries_async(extracted_data, industries, limit=None, timeout=None):
+    """Generates job suggestions for several target industries concurrently.
+
+    Returns a dict mapping each industry to its suggestions.
+    """
+    results = await gather_bounded(
+        [generate_job_suggestions_async(extracted_data, industry) for industry in industries],
+        limit=limit,
+        timeout=timeout,
+    )
+    return dict(zip(industries, results))
 
 if __name__ == "__main__":
+    check_credentials()
     print("===== LinkedIn Career Path Advisor =====")
     
     # Ask if user wants to use LinkedIn API or manual input
@@ -231,6 +267,13 @@ if __name__ == "__main__":
     profile_data = None
     
     if use_api:
+        # A token saved by an earlier run skips the authorization round trip
+        access_token = cached_linkedin_access_token()
+        if access_token:
+            print("Using your saved LinkedIn login.")
+            profile_data = get_linkedin_profile_data(access_token)
+    
+    if use_api and profile_data is None:
         # Generate auth URL
         auth_url = get_linkedin_auth_url()
         print(f"\nPlease visit this URL in your browser to authorize the app:")
@@ -260,7 +303,7 @@ if __name__ == "__main__":
             print(f"Error processing authentication: {e}")
             print("Switching to manual input.")
             profile_data = manually_collect_profile_data()
-    else:
+    elif not use_api:
         profile_data = manually_collect_profile_data()
     
     if profile_data:
@@ -273,17 +316,17 @@ if __name__ == "__main__":
             
             target_industry = input("\nEnter your target industry: ")
             print("\nGenerating job suggestions...")
-            job_suggestions = generate_job_suggestions(extracted_data, target_industry)
-            
             print("\n===== Job Suggestions =====")
-            print(job_suggestions)
+            for chunk in stream_job_suggestions(extracted_data, target_industry):
+                print(chunk, end="", flush=True)
+            print()
             
             job_choice = input("\nEnter the job title you want to pursue: ")
             print("\nGenerating learning path...")
-            learning_path = generate_learning_path(extracted_data, job_choice)
-            
             print("\n===== Learning Path =====")
-            print(learning_path)
+            for chunk in stream_learning_path(extracted_data, job_choice):
+                print(chunk, end="", flush=True)
+            print()
             
             print("\nThank you for using LinkedIn Career Path Advisor!")
         else:
@@ -1,15 +1,24 @@
-import google.generativeai as genai
+import asyncio
 import json
-import os
-from dotenv import load_dotenv
-load_dotenv()
+import logging
+from contextlib import aclosing, closing
+from llm_client import (
+    LazyModel, missing_credentials, generate_text, generate_text_async, discard_cached, stream_text,
+    stream_text_async,
+)
+from json_stream import DOCUMENT, iter_items, aiter_items
+from schemas import generation_config, parse_response
+from skill_canon import canonical_names
+from prompts import projects_prompt
+import tracing
 
-# Configure your API key
-GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")  # Replace with your Gemini API key
+logger = logging.getLogger(__name__)
 
-# Configure Gemini
-genai.configure(api_key=GOOGLE_API_KEY)
-model = genai.GenerativeModel('gemini-2.0-flash')
+# Gemini is configured on the first call, so importing this module has no side effects
+model = LazyModel('gemini-2.0-flash')
+
+# Parts of the response emitted as soon as they are complete while streaming
+STREAM_PATHS = ("recommended_projects.*",)
 
 def collect_completed_courses():
     """Collect information about courses the user has completed."""
@@ -33,7 +42,7 @@ def collect_completed_courses():
         
         # Optional: topics covered
         topics = input("Main topics covered (comma-separated): ").strip()
-        topics_list = [topic.strip() for topic in topics.split(',') if topic.strip()]
+        topics_list = canonical_names(topics.split(','))
         
         courses.append({
             "name": course_name,
@@ -58,112 +67,127 @@ def get_career_field():
     
     return field, experience_level
 
-def generate_project_recommendations(completed_courses, field, experience_level):
+def build_project_prompt(completed_courses, field, experience_level):
+    """Builds the Gemini prompt for completed courses and career information."""
+    return projects_prompt(completed_courses, field, experience_level, model)
+
+def parse_recommendations(response_text):
+    """Parses the model's JSON answer and checks it against the response schema."""
+    recommendations, error = parse_response("project_recommendations", response_text)
+    if error:
+        return {
+            "error": "Could not generate proper project recommendations. Please try again.",
+            "details": error,
+            "raw_response": response_text
+        }
+    return recommendations
+
+def generate_project_recommendations(completed_courses, field, experience_level, bypass_cache=False):
     """Generate project recommendations using the Gemini API."""
-    prompt = f"""
-    Based on the courses a user has completed:
-    {json.dumps(completed_courses, indent=2)}
-    
-    And their career information:
-    - Field/Goal: {field}
-    - Experience Level: {experience_level}
-    
-    Please suggest 3-5 portfolio projects that would:
-    1. Build on the knowledge gained from the completed courses
-    2. Be relevant to their career field ({field})
-    3. Demonstrate their skills at an appropriate difficulty level ({experience_level})
-    4. Create meaningful additions to their professional portfolio
-    
-    For each project, include:
-    - A title and detailed description
-    - The specific skills this project will demonstrate
-    - Estimated completion time
-    - Difficulty level
-    - Key features or components to implement
-    - Why this project would be valuable in a portfolio
-    - Resources and technologies needed to complete it
-    - Learning outcomes
-    
-    Format the output as a JSON object with the following structure:
-    {{
-        "recommended_projects": [
-            {{
-                "title": "string",
-                "description": "string",
-                "skills_demonstrated": ["string"],
-                "estimated_time": "string",
-                "difficulty": "beginner|intermediate|advanced",
-                "key_features": ["string"],
-                "portfolio_value": "string",
-                "resources_needed": ["string"],
-                "learning_outcomes": ["string"]
-            }}
-        ],
-        "learning_progression": "string",
-        "project_selection_tips": ["string"],
-        "additional_resources": ["string"]
-    }}
-    
-    Return only valid JSON with no additional text or formatting.
+    prompt = build_project_prompt(completed_courses, field, experience_level)
+    config = generation_config("project_recommendations", model)
+    response_text = generate_text(
+        model, prompt, "project_recommendations", bypass_cache=bypass_cache, generation_config=config)
+    recommendations = parse_recommendations(response_text)
+    if "error" in recommendations:
+        # Don't keep serving a response we could not parse
+        discard_cached(model, prompt, config)
+    return recommendations
+
+async def generate_project_recommendations_async(completed_courses, field, experience_level, bypass_cache=False):
+    """Async variant of generate_project_recommendations that doesn't block the event loop."""
+    prompt = await asyncio.to_thread(build_project_prompt, completed_courses, field, experience_level)
+    config = generation_config("project_recommendations", model)
+    response_text = await generate_text_async(
+        model, prompt, "project_recommendations", bypass_cache=bypass_cache, generation_config=config)
+    recommendations = parse_recommendations(response_text)
+    if "error" in recommendations:
+        discard_cached(model, prompt, config)
+    return recommendations
+
+def stream_project_recommendations(completed_courses, field, experience_level, limit=None, bypass_cache=False):
+    """Yields (path, value) pairs as each recommended project is generated.
+
+    Unless `limit` stops the stream early, the last pair is
+    ("recommendations", full_result).
     """
+    prompt = build_project_prompt(completed_courses, field, experience_level)
+    config = generation_config("project_recommendations", model)
+    chunks = stream_text(
+        model, prompt, "project_recommendations", bypass_cache=bypass_cache, generation_config=config)
+    with closing(iter_items(chunks, STREAM_PATHS + (DOCUMENT,), limit=limit)) as items:
+        for path, value in items:
+            if path == DOCUMENT:
+                recommendations = parse_recommendations(value)
+                if "error" in recommendations:
+                    discard_cached(model, prompt, config)
+                yield "recommendations", recommendations
+            else:
+                yield path, value
+
+async def stream_project_recommendations_async(completed_courses, field, experience_level, limit=None, bypass_cache=False):
+    """Async variant of stream_project_recommendations."""
+    prompt = await asyncio.to_thread(build_project_prompt, completed_courses, field, experience_level)
+    config = generation_config("project_recommendations", model)
+    chunks = stream_text_async(
+        model, prompt, "project_recommendations", bypass_cache=bypass_cache, generation_config=config)
+    async with aclosing(aiter_items(chunks, STREAM_PATHS + (DOCUMENT,), limit=limit)) as items:
+        async for path, value in items:
+            if path == DOCUMENT:
+                recommendations = parse_recommendations(value)
+                if "error" in recommendations:
+                    discard_cached(model, prompt, config)
+                yield "recommendations", recommendations
+            else:
+                yield path, value
+
+def display_header():
+    print("\n" + "=" * 80)
+    print(" " * 25 + "PROJECT RECOMMENDATIONS")
+    print("=" * 80 + "\n")
+
+def display_project(i, project):
+    print(f"\n{i}. {project['title']}")
+    print(f"   Difficulty: {project['difficulty'].title()}")
+    print(f"   Estimated Time: {project['estimated_time']}")
+    print(f"   Description: {project['description']}")
+    print("\n   Skills Demonstrated:")
+    for j, skill in enumerate(project['skills_demonstrated'], 1):
+        print(f"     {j}. {skill}")
     
-    response = model.generate_content(prompt)
+    print("\n   Key Features:")
+    for j, feature in enumerate(project['key_features'], 1):
+        print(f"     {j}. {feature}")
     
-    try:
-        # Try to parse the response as JSON
-        recommendations = json.loads(response.text)
-        return recommendations
-    except json.JSONDecodeError:
-        # If direct parsing fails, try to extract JSON from markdown code blocks
-        import re
-        json_match = re.search(r'```(?:json)?\n(.*?)\n```', response.text, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group(1))
-            except json.JSONDecodeError:
-                pass
-        
-        # Return an error message if JSON extraction fails
-        return {
-            "error": "Could not generate proper project recommendations. Please try again.",
-            "raw_response": response.text
-        }
+    print(f"\n   Portfolio Value: {project['portfolio_value']}")
+    
+    print("\n   Resources Needed:")
+    for j, resource in enumerate(project['resources_needed'], 1):
+        print(f"     {j}. {resource}")
+    
+    print("\n   Learning Outcomes:")
+    for j, outcome in enumerate(project['learning_outcomes'], 1):
+        print(f"     {j}. {outcome}")
+
+@tracing.traced("display")
+def display_project_recommendations(recommendations, streamed=False):
+    """Displays the project recommendations in a formatted way.
 
-def display_project_recommendations(recommendations):
-    """Displays the project recommendations in a formatted way."""
+    With streamed=True the header and projects have already been printed by
+    display_streaming_project_recommendations.
+    """
     if "error" in recommendations:
         print("\n⚠️ Error generating project recommendations:")
         print(recommendations["error"])
         return
     
-    print("\n" + "=" * 80)
-    print(" " * 25 + "PROJECT RECOMMENDATIONS")
-    print("=" * 80 + "\n")
-    
-    # Display projects
-    print("🚀 RECOMMENDED PROJECTS:")
-    for i, project in enumerate(recommendations["recommended_projects"], 1):
-        print(f"\n{i}. {project['title']}")
-        print(f"   Difficulty: {project['difficulty'].title()}")
-        print(f"   Estimated Time: {project['estimated_time']}")
-        print(f"   Description: {project['description']}")
-        print("\n   Skills Demonstrated:")
-        for j, skill in enumerate(project['skills_demonstrated'], 1):
-            print(f"     {j}. {skill}")
-        
-        print("\n   Key Features:")
-        for j, feature in enumerate(project['key_features'], 1):
-            print(f"     {j}. {feature}")
+    if not streamed:
+        display_header()
         
-        print(f"\n   Portfolio Value: {project['portfolio_value']}")
-        
-        print("\n   Resources Needed:")
-        for j, resource in enumerate(project['resources_needed'], 1):
-            print(f"     {j}. {resource}")
-        
-        print("\n   Learning Outcomes:")
-        for j, outcome in enumerate(project['learning_outcomes'], 1):
-            print(f"     {j}. {outcome}")
+        # Display projects
+        print("🚀 RECOMMENDED PROJECTS:")
+        for i, project in enumerate(recommendations["recommended_projects"], 1):
+            display_project(i, project)
     
     print("\n" + "-" * 80 + "\n")
     
@@ -188,6 +212,24 @@ def display_project_recommendations(recommendations):
     
     print("\n" + "=" * 80)
 
+@tracing.traced("cli projects", root=True)
+def display_streaming_project_recommendations(completed_courses, field, experience_level):
+    """Prints each project as soon as it is generated, then the remaining sections."""
+    project_count = 0
+    recommendations = {"error": "Could not generate proper project recommendations. Please try again."}
+    for path, value in stream_project_recommendations(completed_courses, field, experience_level):
+        if path == "recommendations":
+            recommendations = value
+            continue
+        if project_count == 0:
+            display_header()
+            print("🚀 RECOMMENDED PROJECTS:")
+        project_count += 1
+        display_project(project_count, value)
+    display_project_recommendations(recommendations, streamed=project_count > 0)
+    return recommendations
+
+@tracing.traced("serialize")
 def save_recommendations_to_file(recommendations, filename="project_recommendations.json"):
     """Save project recommendations to a JSON file."""
     try:
@@ -195,12 +237,12 @@ def save_recommendations_to_file(recommendations, filename="project_recommendati
             json.dump(recommendations, f, indent=2)
         print(f"\nRecommendations saved to {filename}")
     except Exception as e:
-        print(f"Error saving recommendations: {str(e)}")
+        logger.error("Error saving recommendations to %s: %s", filename, e)
 
 def main():
     """Main function to run the project recommendation system."""
     # Check if API key is configured
-    if not GOOGLE_API_KEY:
+    if missing_credentials("GOOGLE_API_KEY"):
         print("Error: GOOGLE_API_KEY environment variable not set.")
         print("Please set your API key by running: export GOOGLE_API_KEY='your-api-key'")
         return
@@ -222,10 +264,8 @@ def main():
         
         # Generate recommendations
         print("\nGenerating project recommendations...")
-        recommendations = generate_project_recommendations(completed_courses, field, experience_level)
-        
-        # Display recommendations
-        display_project_recommendations(recommendations)
+        # Display each project as soon as it is generated
+        recommendations = display_streaming_project_recommendations(completed_courses, field, experience_level)
         
         # Ask if user wants to save recommendations
         save_choice = input("\nWould you like to save these recommendations to a file? (y/n): ").lower()
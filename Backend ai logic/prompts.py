@@ -0,0 +1,298 @@
+"""Prompt construction shared by the four AI modules.
+
+Profile data is embedded as compact JSON, the response shapes are rendered
+once from Python dicts, and every prompt is checked against its pipeline's
+input-token budget. Oversized skill or course lists are trimmed (largest
+list first) with a "+N more" marker until the prompt fits, and then overlong
+strings are shortened.
+"""
+import copy
+import json
+import logging
+import os
+
+import schemas
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Input-token budget per pipeline; override with PROMPT_BUDGET_<PIPELINE>
+DEFAULT_BUDGETS = {
+    "extract_skills": 2000,
+    "job_suggestions": 2000,
+    "learning_path": 2000,
+    "course_recommendations": 1500,
+    "course_narrative": 1500,
+    "skills_course_recommendations": 2500,
+    "skills_course_narrative": 2000,
+    "project_recommendations": 2500,
+}
+FALLBACK_BUDGET = 2000
+
+# "never": local estimate only; "near": ask the API when the estimate is within
+# 20% of the budget; "always": ask the API for every prompt
+PREFLIGHT = os.getenv("PROMPT_PREFLIGHT", "near")
+PREFLIGHT_MARGIN = 0.8
+
+# Strings shorter than this are never cut, even when a prompt stays over budget
+MIN_TRUNCATE = 200
+
+JSON_ONLY = "Respond with only a valid JSON object (no markdown, no extra text) of this shape:"
+
+# Shapes shown to the model, rendered from the same schemas used for structured output
+QUESTIONNAIRE_SHAPE = schemas.shape(schemas.COURSE_RECOMMENDATIONS)
+SKILLS_SHAPE = schemas.shape(schemas.SKILLS_COURSE_RECOMMENDATIONS)
+PROJECTS_SHAPE = schemas.shape(schemas.PROJECT_RECOMMENDATIONS)
+EXTRACTION_SHAPE = schemas.shape(schemas.EXTRACTION)
+COURSE_NARRATIVE_SHAPE = schemas.shape(schemas.COURSE_NARRATIVE)
+SKILLS_NARRATIVE_SHAPE = schemas.shape(schemas.SKILLS_COURSE_NARRATIVE)
+
+
+def compact(data):
+    """Serialises data as JSON without indentation or spaces after separators."""
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token)."""
+    return max(1, len(text) // 4)
+
+
+def budget_for(pipeline):
+    value = os.getenv(f"PROMPT_BUDGET_{pipeline.upper()}")
+    return int(value) if value else DEFAULT_BUDGETS.get(pipeline, FALLBACK_BUDGET)
+
+
+def count_tokens(prompt, budget, model=None):
+    """Counts prompt tokens, asking the API only when the local estimate is close to the budget."""
+    estimate = estimate_tokens(prompt)
+    if model is None or PREFLIGHT == "never":
+        return estimate
+    if PREFLIGHT == "near" and estimate < budget * PREFLIGHT_MARGIN:
+        return estimate
+    try:
+        return model.count_tokens(prompt).total_tokens
+    except Exception as e:
+        logger.warning("count_tokens failed, using estimate: %s", e)
+        return estimate
+
+
+def _is_marker(value):
+    return isinstance(value, str) and value.startswith("+") and value.endswith(" more")
+
+
+def _largest_list(data):
+    """Finds the list with the most items (2+, not counting a "+N more" marker) anywhere inside data."""
+    best, best_size = None, 1
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            size = len(value) - (1 if value and _is_marker(value[-1]) else 0)
+            if size > best_size:
+                best, best_size = value, size
+            stack.extend(value)
+    return best
+
+
+def _shrink(data):
+    """Halves the longest list in data, leaving a "+N more" marker. Returns False if nothing is left to trim."""
+    items = _largest_list(data)
+    if items is None:
+        return False
+    dropped = int(items.pop()[1:-5]) if _is_marker(items[-1]) else 0
+    keep = max(1, len(items) // 2)
+    if keep >= len(items):
+        return False
+    dropped += len(items) - keep
+    del items[keep:]
+    items.append(f"+{dropped} more")
+    return True
+
+
+def _truncate_longest_string(data):
+    """Halves the longest string value (of MIN_TRUNCATE+ characters) in data. Returns False if there is none."""
+    best = None
+    stack = [(None, None, data)]
+    while stack:
+        parent, key, value = stack.pop()
+        if isinstance(value, dict):
+            stack.extend((value, k, v) for k, v in value.items())
+        elif isinstance(value, list):
+            stack.extend((value, i, v) for i, v in enumerate(value))
+        elif (isinstance(value, str) and parent is not None and len(value) >= MIN_TRUNCATE
+              and (best is None or len(value) > len(best[2]))):
+            best = (parent, key, value)
+    if best is None:
+        return False
+    parent, key, value = best
+    parent[key] = value[:len(value) // 2] + "…"
+    return True
+
+
+def fit_prompt(pipeline, render, data, model=None):
+    """Renders render(data), trimming the largest lists in data until the prompt fits the pipeline's budget.
+
+    When no list has more than one item left, the longest strings are cut in
+    half instead; a prompt that is still over budget after that is sent as is.
+    """
+    budget = budget_for(pipeline)
+    original = data
+    with tracing.span("prompt.build", pipeline=pipeline, budget=budget) as span:
+        while True:
+            prompt = render(data)
+            tokens = count_tokens(prompt, budget, model)
+            if tokens <= budget:
+                break
+            if data is original:
+                data = copy.deepcopy(original)
+            if not _shrink(data) and not _truncate_longest_string(data):
+                logger.warning("Prompt for %s is %d tokens, over its %d token budget", pipeline, tokens, budget)
+                break
+        span.set_attributes(tokens=tokens, trimmed=data is not original)
+    logger.info("prompt pipeline=%s tokens=%d budget=%d trimmed=%s", pipeline, tokens, budget, data is not original)
+    return prompt
+
+
+# --- prompt templates --------------------------------------------------------
+
+def _render_extraction(data):
+    return (
+        "Extract technical skills, soft skills, industry knowledge, years of experience per skill "
+        "(if mentioned) and proficiency level (if indicated) from this profile data:\n"
+        f"Skills: {compact(data.get('skills', []))}\n"
+        f"Experience: {compact(data.get('experience', []))}\n"
+        f"{JSON_ONLY} {compact(EXTRACTION_SHAPE)}"
+    )
+
+
+def _render_job_suggestions(data):
+    return (
+        f"Profile data: {compact(data['extracted_data'])}\n"
+        f"Target industry: {data['target_industry']}\n"
+        "Recommend 3 to 5 suitable job titles and roles, considering the user's skills and experience. "
+        "Give a brief description of each role and why it's a good fit."
+    )
+
+
+def _render_learning_path(data):
+    return (
+        f"Profile data: {compact(data['extracted_data'])}\n"
+        f"Chosen career path: {data['job_choice']}\n"
+        "Recommend a detailed learning path, including specific skills to acquire, courses, platforms, "
+        "projects, and networking strategies. Explain how this path will help the user achieve their career goal."
+    )
+
+
+def _render_questionnaire(data):
+    weeks = data["completion_time"]
+    return (
+        "Generate a personalized course recommendation plan for this learner:\n"
+        f"- Learning goal: {data['learning_goal']}\n"
+        f"- Desired level: {data['learning_level']}\n"
+        f"- Expectations: {data['expectations']}\n"
+        f"- Pursuing a career in the field: {'Yes' if data['career_pursuit'] else 'No'}\n"
+        f"- Current occupation: {data['occupation'].title()}\n"
+        f"- Desired completion time: {weeks} weeks\n"
+        "Provide a summary analysis of their needs; 3-5 matching courses (platform, description, duration, "
+        "skill level, whether it has practical projects and certification); a weekly schedule that fits "
+        f"within {weeks} weeks; additional resources; and next steps after these courses.\n"
+        f"{JSON_ONLY} {compact(QUESTIONNAIRE_SHAPE)}"
+    )
+
+
+def _render_course_narrative(data):
+    weeks = data["completion_time"]
+    courses = [
+        {"title": c["title"], "platform": c["platform"], "weeks": c["duration_weeks"], "topics": c["key_topics"]}
+        for c in data["courses"] if isinstance(c, dict)  # skips a "+N more" trim marker
+    ]
+    return (
+        "A learner has been matched with these courses:\n"
+        f"{compact(courses)}\n"
+        f"- Learning goal: {data['learning_goal']}\n"
+        f"- Desired level: {data['learning_level']}\n"
+        f"- Expectations: {data['expectations']}\n"
+        f"- Pursuing a career in the field: {'Yes' if data['career_pursuit'] else 'No'}\n"
+        f"- Current occupation: {data['occupation'].title()}\n"
+        f"- Desired completion time: {weeks} weeks\n"
+        "Provide a summary analysis of their needs; a weekly schedule over these courses that fits within "
+        f"{weeks} weeks; additional resources; and next steps after these courses.\n"
+        f"{JSON_ONLY} {compact(COURSE_NARRATIVE_SHAPE)}"
+    )
+
+
+def _render_skills(data):
+    return (
+        f"Skills profile: {compact(data['skills_data'])}\n"
+        f"Target field: {data['target_field']}\n"
+        "Provide a personalized learning path with specific courses that will help the user advance in this "
+        "field: an assessment of current skills relative to the field, the skill gaps, a sequential course path "
+        "(beginner courses if needed, then intermediate, then advanced/specialized), an estimated timeline and "
+        "recommended learning platforms.\n"
+        f"{JSON_ONLY} {compact(SKILLS_SHAPE)}"
+    )
+
+
+def _render_skills_narrative(data):
+    return (
+        f"Skills profile: {compact(data['skills_data'])}\n"
+        f"Target field: {data['target_field']}\n"
+        "Assess the user's current skills relative to the field, list the skill gaps (short skill names), "
+        "estimate a timeline to close them and recommend learning platforms and next steps.\n"
+        f"{JSON_ONLY} {compact(SKILLS_NARRATIVE_SHAPE)}"
+    )
+
+
+def _render_projects(data):
+    field = data["field"]
+    level = data["experience_level"]
+    return (
+        f"Completed courses: {compact(data['completed_courses'])}\n"
+        f"Field/goal: {field}\n"
+        f"Experience level: {level}\n"
+        "Suggest 3-5 portfolio projects that build on these courses, are relevant to "
+        f"{field}, match the {level} level and make meaningful portfolio additions. For each, give a title and "
+        "detailed description, skills demonstrated, estimated completion time, difficulty, key features, "
+        "portfolio value, resources and technologies needed, and learning outcomes.\n"
+        f"{JSON_ONLY} {compact(PROJECTS_SHAPE)}"
+    )
+
+
+def extraction_prompt(profile_data, model=None):
+    return fit_prompt("extract_skills", _render_extraction, profile_data, model)
+
+
+def job_suggestions_prompt(extracted_data, target_industry, model=None):
+    data = {"extracted_data": extracted_data, "target_industry": target_industry}
+    return fit_prompt("job_suggestions", _render_job_suggestions, data, model)
+
+
+def learning_path_prompt(extracted_data, job_choice, model=None):
+    data = {"extracted_data": extracted_data, "job_choice": job_choice}
+    return fit_prompt("learning_path", _render_learning_path, data, model)
+
+
+def questionnaire_prompt(user_inputs, model=None):
+    return fit_prompt("course_recommendations", _render_questionnaire, user_inputs, model)
+
+
+def course_narrative_prompt(user_inputs, courses, model=None):
+    return fit_prompt("course_narrative", _render_course_narrative, dict(user_inputs, courses=courses), model)
+
+
+def skills_narrative_prompt(skills_data, target_field, model=None):
+    data = {"skills_data": skills_data, "target_field": target_field}
+    return fit_prompt("skills_course_narrative", _render_skills_narrative, data, model)
+
+
+def skills_prompt(skills_data, target_field, model=None):
+    data = {"skills_data": skills_data, "target_field": target_field}
+    return fit_prompt("skills_course_recommendations", _render_skills, data, model)
+
+
+def projects_prompt(completed_courses, field, experience_level, model=None):
+    data = {"completed_courses": completed_courses, "field": field, "experience_level": experience_level}
+    return fit_prompt("project_recommendations", _render_projects, data, model)
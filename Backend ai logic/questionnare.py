@@ -1,15 +1,25 @@
-import google.generativeai as genai
-import json
-import os
-from dotenv import load_dotenv
-load_dotenv()
+import asyncio
+import logging
+import sqlite3
+from contextlib import aclosing, closing
+from llm_client import (
+    LazyModel, missing_credentials, generate_text, generate_text_async, discard_cached, stream_text,
+    stream_text_async,
+)
+from json_stream import DOCUMENT, iter_items, aiter_items
+from schemas import generation_config, parse_response
+from prompts import questionnaire_prompt, course_narrative_prompt
+import course_catalog
+import tracing
 
-# Configure your API key
-GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")  # Replace with your Gemini API key
+logger = logging.getLogger(__name__)
 
-# Configure Gemini
-genai.configure(api_key=GOOGLE_API_KEY)
-model = genai.GenerativeModel('gemini-2.0-flash')
+# Gemini is configured on the first call, so importing this module has no side effects
+model = LazyModel('gemini-2.0-flash')
+
+# Parts of the response emitted as soon as they are complete while streaming
+STREAM_PATHS = ("needs_analysis", "recommended_courses.*")
+NARRATIVE_STREAM_PATHS = ("needs_analysis",)
 
 def get_user_inputs():
     """Collects the 6 questions from the user through terminal input."""
@@ -78,120 +88,162 @@ def get_user_inputs():
         "completion_time": completion_time
     }
 
-def generate_course_recommendations(user_inputs):
-    """Generate course recommendations using the Gemini API."""
-    prompt = f"""
-    Generate a personalized course recommendation plan based on the following inputs:
-    
-    - Learning Goal: {user_inputs['learning_goal']}
-    - Desired Learning Level: {user_inputs['learning_level']}
-    - User Expectations: {user_inputs['expectations']}
-    - Career Pursuit in Field: {"Yes" if user_inputs['career_pursuit'] else "No"}
-    - Current Occupation: {user_inputs['occupation'].title()}
-    - Desired Completion Time: {user_inputs['completion_time']} weeks
-    
-    Please provide:
-    1. A summary analysis of the user's needs based on these inputs
-    2. A list of 3-5 recommended courses that match these requirements, including:
-       - Course name
-       - Platform or provider
-       - Brief description
-       - Estimated duration
-       - Skill level
-       - Whether it includes practical projects
-       - Whether it offers certification
-    3. A suggested weekly learning schedule that fits within their {user_inputs['completion_time']} week timeframe
-    4. Additional resources and complementary materials
-    5. Next steps after completing these courses
-    
-    Format the output as a JSON object with the following structure:
-    {{
-        "needs_analysis": "string",
-        "recommended_courses": [
-            {{
-                "title": "string",
-                "platform": "string",
-                "description": "string",
-                "duration_weeks": number,
-                "skill_level": "string",
-                "includes_projects": boolean,
-                "certification": boolean,
-                "key_topics": ["string"]
-            }}
-        ],
-        "learning_schedule": {{
-            "weekly_breakdown": [
-                {{
-                    "week": number,
-                    "focus": "string",
-                    "hours_required": number,
-                    "goals": ["string"]
-                }}
-            ],
-            "total_hours_weekly": number
-        }},
-        "additional_resources": [
-            {{
-                "type": "string",
-                "name": "string",
-                "url": "string" (optional)
-            }}
-        ],
-        "next_steps": ["string"]
-    }}
-    
-    Return only valid JSON with no additional text or formatting.
-    """
-    
-    response = model.generate_content(prompt)
-    
-    try:
-        # Try to parse the response as JSON
-        recommendations = json.loads(response.text)
-        return recommendations
-    except json.JSONDecodeError:
-        # If direct parsing fails, try to extract JSON from markdown code blocks
-        import re
-        json_match = re.search(r'```(?:json)?\n(.*?)\n```', response.text, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group(1))
-            except json.JSONDecodeError:
-                pass
-        
-        # Return an error message if JSON extraction fails
+def build_course_prompt(user_inputs):
+    """Builds the Gemini prompt for the questionnaire answers."""
+    return questionnaire_prompt(user_inputs, model)
+
+def parse_recommendations(response_text, pipeline="course_recommendations"):
+    """Parses the model's JSON answer and checks it against the response schema."""
+    recommendations, error = parse_response(pipeline, response_text)
+    if error:
         return {
             "error": "Could not generate proper recommendations. Please try again.",
-            "raw_response": response.text
+            "details": error,
+            "raw_response": response_text
         }
+    return recommendations
+
+def catalog_courses(user_inputs):
+    """Courses from the local catalog that answer the learning goal, or None if it has too few."""
+    try:
+        courses = course_catalog.get_catalog().search(
+            user_inputs["learning_goal"],
+            level=user_inputs["learning_level"],
+            max_weeks=user_inputs["completion_time"],
+            k=5,
+        )
+    except sqlite3.Error as e:
+        logger.warning("Course catalog unavailable: %s", e)
+        return None
+    if len(courses) < course_catalog.MIN_MATCHES:
+        return None
+    return [course_catalog.as_questionnaire_course(course) for course in courses]
 
-def display_recommendations(recommendations):
-    """Displays the course recommendations in a formatted way."""
+def plan_request(user_inputs):
+    """Returns (pipeline, prompt, catalog courses).
+
+    When the catalog covers the goal, Gemini is only asked for the narrative
+    around its courses; otherwise it generates the whole plan.
+    """
+    courses = catalog_courses(user_inputs)
+    if courses is not None:
+        return "course_narrative", course_narrative_prompt(user_inputs, courses, model), courses
+    return "course_recommendations", build_course_prompt(user_inputs), None
+
+def finish_recommendations(pipeline, response_text, prompt, config, courses):
+    """Parses a response, merging in catalog courses or adding generated ones to the catalog."""
+    recommendations = parse_recommendations(response_text, pipeline)
     if "error" in recommendations:
-        print("\n⚠️ Error generating recommendations:")
-        print(recommendations["error"])
-        return
-    
+        # Don't keep serving a response we could not parse
+        discard_cached(model, prompt, config)
+    elif courses is not None:
+        recommendations = dict(recommendations, recommended_courses=courses)
+    else:
+        course_catalog.get_catalog().record_response(recommendations)
+    return recommendations
+
+def generate_course_recommendations(user_inputs, bypass_cache=False):
+    """Generate course recommendations using the Gemini API."""
+    pipeline, prompt, courses = plan_request(user_inputs)
+    config = generation_config(pipeline, model)
+    response_text = generate_text(model, prompt, pipeline, bypass_cache=bypass_cache, generation_config=config)
+    return finish_recommendations(pipeline, response_text, prompt, config, courses)
+
+async def generate_course_recommendations_async(user_inputs, bypass_cache=False):
+    """Async variant of generate_course_recommendations that doesn't block the event loop."""
+    pipeline, prompt, courses = await asyncio.to_thread(plan_request, user_inputs)
+    config = generation_config(pipeline, model)
+    response_text = await generate_text_async(
+        model, prompt, pipeline, bypass_cache=bypass_cache, generation_config=config)
+    return await asyncio.to_thread(finish_recommendations, pipeline, response_text, prompt, config, courses)
+
+def stream_course_recommendations(user_inputs, limit=None, bypass_cache=False):
+    """Yields (path, value) pairs as parts of the recommendations are generated.
+
+    The needs analysis and each course are yielded as soon as they close;
+    catalog courses are yielded before Gemini is called. Unless `limit` stops
+    the stream early, the last pair is ("recommendations", full_result).
+    """
+    pipeline, prompt, courses = plan_request(user_inputs)
+    for course in (courses or [])[:limit]:
+        yield "recommended_courses.*", course
+    if courses is not None and limit is not None:
+        limit -= len(courses)
+        if limit <= 0:
+            return
+    config = generation_config(pipeline, model)
+    chunks = stream_text(model, prompt, pipeline, bypass_cache=bypass_cache, generation_config=config)
+    paths = STREAM_PATHS if courses is None else NARRATIVE_STREAM_PATHS
+    with closing(iter_items(chunks, paths + (DOCUMENT,), limit=limit)) as items:
+        for path, value in items:
+            if path == DOCUMENT:
+                yield "recommendations", finish_recommendations(pipeline, value, prompt, config, courses)
+            else:
+                yield path, value
+
+async def stream_course_recommendations_async(user_inputs, limit=None, bypass_cache=False):
+    """Async variant of stream_course_recommendations."""
+    pipeline, prompt, courses = await asyncio.to_thread(plan_request, user_inputs)
+    for course in (courses or [])[:limit]:
+        yield "recommended_courses.*", course
+    if courses is not None and limit is not None:
+        limit -= len(courses)
+        if limit <= 0:
+            return
+    config = generation_config(pipeline, model)
+    chunks = stream_text_async(model, prompt, pipeline, bypass_cache=bypass_cache, generation_config=config)
+    paths = STREAM_PATHS if courses is None else NARRATIVE_STREAM_PATHS
+    async with aclosing(aiter_items(chunks, paths + (DOCUMENT,), limit=limit)) as items:
+        async for path, value in items:
+            if path == DOCUMENT:
+                recommendations = await asyncio.to_thread(
+                    finish_recommendations, pipeline, value, prompt, config, courses)
+                yield "recommendations", recommendations
+            else:
+                yield path, value
+
+def display_header():
     print("\n" + "=" * 80)
     print(" " * 25 + "COURSE RECOMMENDATIONS")
     print("=" * 80 + "\n")
-    
-    # Display needs analysis
+
+def display_needs_analysis(needs_analysis):
     print("🔍 NEEDS ANALYSIS:")
-    print(recommendations["needs_analysis"])
+    print(needs_analysis)
     print("\n" + "-" * 80 + "\n")
+
+def display_course(i, course):
+    print(f"\n{i}. {course['title']}")
+    print(f"   Platform: {course['platform']}")
+    print(f"   Level: {course['skill_level']}")
+    print(f"   Duration: {course['duration_weeks']} weeks")
+    print(f"   Certification: {'Yes' if course['certification'] else 'No'}")
+    print(f"   Projects Included: {'Yes' if course['includes_projects'] else 'No'}")
+    print(f"   Description: {course['description']}")
+    print(f"   Key Topics: {', '.join(course['key_topics'])}")
+
+@tracing.traced("display")
+def display_recommendations(recommendations, streamed=False):
+    """Displays the course recommendations in a formatted way.
+
+    With streamed=True the header, needs analysis and courses have already
+    been printed by display_streaming_recommendations.
+    """
+    if "error" in recommendations:
+        print("\n⚠️ Error generating recommendations:")
+        print(recommendations["error"])
+        return
     
-    # Display recommended courses
-    print("📚 RECOMMENDED COURSES:")
-    for i, course in enumerate(recommendations["recommended_courses"], 1):
-        print(f"\n{i}. {course['title']}")
-        print(f"   Platform: {course['platform']}")
-        print(f"   Level: {course['skill_level']}")
-        print(f"   Duration: {course['duration_weeks']} weeks")
-        print(f"   Certification: {'Yes' if course['certification'] else 'No'}")
-        print(f"   Projects Included: {'Yes' if course['includes_projects'] else 'No'}")
-        print(f"   Description: {course['description']}")
-        print(f"   Key Topics: {', '.join(course['key_topics'])}")
+    if not streamed:
+        display_header()
+        
+        # Display needs analysis
+        display_needs_analysis(recommendations["needs_analysis"])
+        
+        # Display recommended courses
+        print("📚 RECOMMENDED COURSES:")
+        for i, course in enumerate(recommendations["recommended_courses"], 1):
+            display_course(i, course)
     
     print("\n" + "-" * 80 + "\n")
     
@@ -224,10 +276,33 @@ def display_recommendations(recommendations):
     
     print("\n" + "=" * 80)
 
+@tracing.traced("cli questionnare", root=True)
+def display_streaming_recommendations(user_inputs):
+    """Prints each course as soon as it is generated, then the remaining sections."""
+    streamed = False
+    course_count = 0
+    recommendations = {"error": "Could not generate proper recommendations. Please try again."}
+    for path, value in stream_course_recommendations(user_inputs):
+        if path == "recommendations":
+            recommendations = value
+            continue
+        if not streamed:
+            display_header()
+            streamed = True
+        if path == "needs_analysis":
+            display_needs_analysis(value)
+        else:
+            if course_count == 0:
+                print("📚 RECOMMENDED COURSES:")
+            course_count += 1
+            display_course(course_count, value)
+    display_recommendations(recommendations, streamed=streamed and course_count > 0)
+    return recommendations
+
 def main():
     """Main function to run the recommendation system."""
     # Check if API key is configured
-    if not GOOGLE_API_KEY:
+    if missing_credentials("GOOGLE_API_KEY"):
         print("Error: GOOGLE_API_KEY environment variable not set.")
         print("Please set your API key by running: export GOOGLE_API_KEY='your-api-key'")
         return
@@ -237,11 +312,8 @@ def main():
         user_inputs = get_user_inputs()
         
         print("\nGenerating personalized course recommendations...")
-        # Generate recommendations
-        recommendations = generate_course_recommendations(user_inputs)
-        
-        # Display recommendations
-        display_recommendations(recommendations)
+        # Generate and display recommendations as they stream in
+        display_streaming_recommendations(user_inputs)
         
     except KeyboardInterrupt:
         print("\n\nProcess interrupted. Exiting...")
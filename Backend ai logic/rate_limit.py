@@ -0,0 +1,387 @@
+"""Quota-aware rate limiting for Gemini calls.
+
+Each model gets a requests/min and a tokens/min token bucket, an adaptive
+concurrency limit and jittered exponential-backoff retries. The concurrency
+limit grows additively while calls succeed within the latency target and is
+halved on every 429, so bursts queue up near the quota ceiling instead of
+failing.
+
+Quotas default to the values in DEFAULT_QUOTAS and can be overridden per
+model with GEMINI_RPM_<MODEL> / GEMINI_TPM_<MODEL>, e.g. GEMINI_RPM_GEMINI_2_0_FLASH=2000.
+"""
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+
+import metrics
+import tracing
+
+# (requests per minute, tokens per minute)
+DEFAULT_QUOTAS = {
+    "gemini-pro": (60, 32000),
+    "gemini-2.0-flash": (15, 1000000),
+}
+FALLBACK_QUOTA = (15, 32000)
+
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "5"))
+BASE_BACKOFF = float(os.getenv("GEMINI_BASE_BACKOFF", "1.0"))
+MAX_BACKOFF = float(os.getenv("GEMINI_MAX_BACKOFF", "60.0"))
+LATENCY_TARGET = float(os.getenv("GEMINI_LATENCY_TARGET", "20.0"))
+MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "16"))
+# Output tokens reserved up front, reconciled once usage_metadata is known
+EXPECTED_OUTPUT_TOKENS = int(os.getenv("GEMINI_EXPECTED_OUTPUT_TOKENS", "1024"))
+
+RETRYABLE_STATUS = {429, 500, 503, 504}
+_POLL_INTERVAL = 0.02
+
+
+def _env_name(model_name):
+    return re.sub(r"[^A-Z0-9]", "_", model_name.upper())
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) used before the real count is known."""
+    return max(1, len(text) // 4)
+
+
+def status_of(error):
+    """Returns the HTTP-style status code of an API error, if it has one."""
+    code = getattr(error, "code", None)
+    if callable(code):
+        try:
+            code = code()
+        except Exception:
+            return None
+        code = getattr(code, "value", code)
+        if isinstance(code, tuple):
+            # grpc.StatusCode values are (number, name); RESOURCE_EXHAUSTED is 8
+            code = {8: 429, 14: 503, 4: 504, 13: 500}.get(code[0])
+    return code if isinstance(code, int) else None
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+    return random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * (2 ** attempt)))
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `per_minute` tokens per minute."""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, amount):
+        """Takes `amount` tokens if available; otherwise returns the seconds to wait."""
+        amount = min(amount, self.capacity)
+        with self.lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def give_back(self, amount):
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    def charge(self, amount):
+        """Charges extra usage discovered after the fact; may leave the bucket in debt."""
+        with self.lock:
+            self._refill()
+            self.tokens -= amount
+
+
+class ModelLimiter:
+    """Request, token and concurrency limits for one Gemini model."""
+
+    def __init__(self, model_name, requests_per_minute, tokens_per_minute, max_concurrency=MAX_CONCURRENCY):
+        self.model_name = model_name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.limit = float(min(4, max_concurrency))
+        self.in_flight = 0
+        self.throttled = 0
+        self.retries = 0
+        self.lock = threading.Lock()
+
+    # --- admission -------------------------------------------------------
+
+    def _try_admit(self, tokens):
+        """Returns 0 when admitted, otherwise the seconds to wait before trying again."""
+        with self.lock:
+            if self.in_flight >= int(self.limit):
+                return _POLL_INTERVAL
+            wait = self.requests.try_take(1)
+            if wait:
+                return wait
+            wait = self.tokens.try_take(tokens)
+            if wait:
+                self.requests.give_back(1)
+                return wait
+            self.in_flight += 1
+            return 0.0
+
+    def acquire(self, tokens):
+        started = None
+        while True:
+            wait = self._try_admit(tokens)
+            if not wait:
+                break
+            started = started or time.time_ns()
+            time.sleep(min(wait, 1.0))
+        if started:
+            tracing.record("rate_limit.wait", started, time.time_ns(), model=self.model_name)
+
+    async def acquire_async(self, tokens):
+        started = None
+        while True:
+            wait = self._try_admit(tokens)
+            if not wait:
+                break
+            started = started or time.time_ns()
+            await asyncio.sleep(min(wait, 1.0))
+        if started:
+            tracing.record("rate_limit.wait", started, time.time_ns(), model=self.model_name)
+
+    def release(self, reserved_tokens, used_tokens=None, latency=None, throttled=False):
+        """Frees a concurrency slot and adapts the limit (AIMD) to what was observed."""
+        with self.lock:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                self.limit = max(1.0, self.limit / 2)
+            elif latency is not None and latency > LATENCY_TARGET:
+                self.limit = max(1.0, self.limit * 0.9)
+            elif latency is not None:
+                self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+        if used_tokens is not None and used_tokens != reserved_tokens:
+            if used_tokens > reserved_tokens:
+                self.tokens.charge(used_tokens - reserved_tokens)
+            else:
+                self.tokens.give_back(reserved_tokens - used_tokens)
+
+    # --- calls -----------------------------------------------------------
+
+    def _start(self, fn, reserved):
+        """Calls fn() in a concurrency slot, retrying throttling and transient errors.
+
+        Returns (response, start time) with the slot still held.
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            self.acquire(reserved)
+            start = time.monotonic()
+            try:
+                response = fn()
+            except BaseException as e:
+                # Whatever ends the call (KeyboardInterrupt included) gives the slot back
+                status = status_of(e)
+                self.release(reserved, throttled=status == 429)
+                if status not in RETRYABLE_STATUS or attempt == MAX_RETRIES:
+                    raise
+            else:
+                return response, start
+            self._count_retry(status)
+            started = time.time_ns()
+            time.sleep(backoff_delay(attempt))
+            tracing.record("gemini.retry_backoff", started, time.time_ns(), status=status, attempt=attempt + 1)
+
+    async def _start_async(self, fn, reserved):
+        for attempt in range(MAX_RETRIES + 1):
+            await self.acquire_async(reserved)
+            start = time.monotonic()
+            try:
+                response = await fn()
+            except BaseException as e:
+                # Cancellation included
+                status = status_of(e)
+                self.release(reserved, throttled=status == 429)
+                if status not in RETRYABLE_STATUS or attempt == MAX_RETRIES:
+                    raise
+            else:
+                return response, start
+            self._count_retry(status)
+            started = time.time_ns()
+            await asyncio.sleep(backoff_delay(attempt))
+            tracing.record("gemini.retry_backoff", started, time.time_ns(), status=status, attempt=attempt + 1)
+
+    def call(self, fn, prompt):
+        """Runs fn() within the model's budgets, retrying throttling and transient errors."""
+        reserved = estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS
+        response, start = self._start(fn, reserved)
+        self.release(reserved, used_tokens_of(response), time.monotonic() - start)
+        return response
+
+    async def call_async(self, fn, prompt):
+        """Async variant of call(); fn returns an awaitable."""
+        reserved = estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS
+        response, start = await self._start_async(fn, reserved)
+        self.release(reserved, used_tokens_of(response), time.monotonic() - start)
+        return response
+
+    def stream(self, fn, prompt):
+        """Like call() for a streaming fn: returns its chunks as a HeldStream.
+
+        The slot stays taken until the stream is exhausted, fails or is closed,
+        so streams count against the concurrency limit while Gemini is still
+        generating. Only a failure before the first chunk is retried.
+        """
+        reserved = estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS
+        response, start = self._start(fn, reserved)
+        return HeldStream(self, response, reserved, start)
+
+    async def stream_async(self, fn, prompt):
+        """Async variant of stream(); fn returns an awaitable of an async iterable."""
+        reserved = estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS
+        response, start = await self._start_async(fn, reserved)
+        return AsyncHeldStream(self, response, reserved, start)
+
+    def _count_retry(self, status):
+        with self.lock:
+            self.retries += 1
+        metrics.LLM_RETRIES.inc(self.model_name, str(status))
+
+    def stats(self):
+        with self.lock:
+            return {
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "throttled": self.throttled,
+                "retries": self.retries,
+            }
+
+
+class HeldStream:
+    """Iterator over a streaming response that holds its limiter slot until the stream ends.
+
+    The slot is released once: when the stream is exhausted (reporting the
+    whole stream's latency and usage to the limiter), when it fails, or when
+    it is closed or garbage collected before the end.
+    """
+
+    def __init__(self, limiter, response, reserved, start):
+        self._limiter = limiter
+        self._response = response
+        self._reserved = reserved
+        self._start = start
+        self._iterator = None
+        self._last = None
+        self._held = True
+
+    def _release(self, finished=False, throttled=False):
+        if self._held:
+            self._held = False
+            if finished:
+                self._limiter.release(self._reserved, used_tokens_of(self._last), time.monotonic() - self._start)
+            else:
+                # An abandoned or failed stream tells nothing about how long a whole answer takes
+                self._limiter.release(self._reserved, throttled=throttled)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            if self._iterator is None:
+                self._iterator = iter(self._response)
+            self._last = next(self._iterator)
+        except StopIteration:
+            self._release(finished=True)
+            raise
+        except BaseException as e:
+            self._release(throttled=status_of(e) == 429)
+            raise
+        return self._last
+
+    def close(self):
+        self._release()
+        close = getattr(self._iterator, "close", None)
+        if close is not None:
+            close()
+
+    def __del__(self):
+        self._release()
+
+
+class AsyncHeldStream(HeldStream):
+    """Async iterator counterpart of HeldStream."""
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            if self._iterator is None:
+                self._iterator = self._response.__aiter__()
+            self._last = await self._iterator.__anext__()
+        except StopAsyncIteration:
+            self._release(finished=True)
+            raise
+        except BaseException as e:
+            self._release(throttled=status_of(e) == 429)
+            raise
+        return self._last
+
+    async def aclose(self):
+        self._release()
+        aclose = getattr(self._iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def used_tokens_of(response):
+    """Total tokens billed for a response, if the SDK reported usage."""
+    usage = getattr(response, "usage_metadata", None)
+    total = getattr(usage, "total_token_count", None)
+    return total if isinstance(total, int) and total > 0 else None
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(model_name):
+    """Returns the shared limiter for a model name such as 'models/gemini-pro'."""
+    name = model_name.split("/")[-1]
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            rpm, tpm = DEFAULT_QUOTAS.get(name, FALLBACK_QUOTA)
+            rpm = int(os.getenv(f"GEMINI_RPM_{_env_name(name)}", rpm))
+            tpm = int(os.getenv(f"GEMINI_TPM_{_env_name(name)}", tpm))
+            limiter = _limiters[name] = ModelLimiter(name, rpm, tpm)
+        return limiter
+
+
+def stats():
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: limiter.stats() for name, limiter in limiters.items()}
+
+
+def _limiter_metrics():
+    by_model = stats()
+    return [
+        ("llm_concurrency_limit", "gauge", "Adaptive concurrency limit per model.",
+         ("model",), {(name,): s["concurrency_limit"] for name, s in by_model.items()}),
+        ("llm_in_flight", "gauge", "Gemini calls currently running per model.",
+         ("model",), {(name,): s["in_flight"] for name, s in by_model.items()}),
+        ("llm_throttled_total", "counter", "Gemini calls rejected with 429 per model.",
+         ("model",), {(name,): s["throttled"] for name, s in by_model.items()}),
+    ]
+
+
+metrics.register_collector(_limiter_metrics)
@@ -0,0 +1,197 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Default time-to-live (seconds) for each pipeline's cached responses.
+# Override with LLM_CACHE_TTL_<PIPELINE>, e.g. LLM_CACHE_TTL_LEARNING_PATH=3600
+DEFAULT_TTLS = {
+    "extract_skills": 7 * 24 * 3600,
+    "job_suggestions": 24 * 3600,
+    "learning_path": 24 * 3600,
+    "course_recommendations": 24 * 3600,
+    "skills_course_recommendations": 24 * 3600,
+    "project_recommendations": 24 * 3600,
+}
+FALLBACK_TTL = 24 * 3600
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.sqlite3")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt):
+    """Collapses whitespace so indentation changes don't change the cache key."""
+    return _WHITESPACE.sub(" ", prompt).strip()
+
+
+def cache_key(model_name, prompt):
+    """Returns the content address of a prompt for a given model."""
+    payload = f"{model_name}\0{normalize_prompt(prompt)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _env_flag(name):
+    return os.getenv(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+class ResponseCache:
+    """SQLite-backed LRU cache of Gemini response text keyed by model and prompt."""
+
+    def __init__(self, path=DEFAULT_PATH, max_entries=5000, max_bytes=64 * 1024 * 1024,
+                 ttls=None, bypass=False):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.bypass = bypass
+        self.hits = {}
+        self.misses = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    @classmethod
+    def from_env(cls):
+        """Builds a cache configured from LLM_CACHE_* environment variables."""
+        ttls = {}
+        for pipeline in DEFAULT_TTLS:
+            value = os.getenv(f"LLM_CACHE_TTL_{pipeline.upper()}")
+            if value:
+                ttls[pipeline] = int(value)
+        return cls(
+            path=os.getenv("LLM_CACHE_PATH", DEFAULT_PATH),
+            max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000")),
+            max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            ttls=ttls,
+            bypass=_env_flag("LLM_CACHE_BYPASS"),
+        )
+
+    def _connect(self):
+        # SQLite connections must not be shared across a fork
+        if self._conn is not None and self._pid != os.getpid():
+            self._conn = None
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    pipeline TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def ttl_for(self, pipeline):
+        return self.ttls.get(pipeline, FALLBACK_TTL)
+
+    def get(self, model_name, prompt, pipeline):
+        """Returns the cached response text, or None on a miss or expiry."""
+        key = cache_key(model_name, prompt)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT response FROM responses WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                self.misses[pipeline] = self.misses.get(pipeline, 0) + 1
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits[pipeline] = self.hits.get(pipeline, 0) + 1
+            return row[0]
+
+    def set(self, model_name, prompt, pipeline, response_text):
+        """Stores a response and evicts least recently used entries past the limits."""
+        key = cache_key(model_name, prompt)
+        now = time.time()
+        size = len(response_text.encode("utf-8"))
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model_name, pipeline, response_text, size, now, now + self.ttl_for(pipeline), now),
+            )
+            conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+            self._evict(conn)
+            conn.commit()
+
+    def iter_responses(self, *pipelines, page_size=500):
+        """Yields the text of every unexpired response from the given pipelines.
+
+        Rows are read a page at a time under the cache lock, so other threads
+        can use the cache between pages; an entry written meanwhile may or may
+        not be included.
+        """
+        placeholders = ", ".join("?" * len(pipelines))
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self._connect().execute(
+                    f"SELECT rowid, response FROM responses WHERE rowid > ? AND expires_at > ? "
+                    f"AND pipeline IN ({placeholders}) ORDER BY rowid LIMIT ?",
+                    (last_rowid, time.time(), *pipelines, page_size),
+                ).fetchall()
+            for _, text in rows:
+                yield text
+            if len(rows) < page_size:
+                return
+            last_rowid = rows[-1][0]
+
+    def _evict(self, conn):
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        while count > self.max_entries or total > self.max_bytes:
+            row = conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+            count -= 1
+            total -= row[1]
+
+    def discard(self, model_name, prompt):
+        """Removes a cached response, e.g. one that turned out to be unparseable."""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses WHERE key = ?", (cache_key(model_name, prompt),))
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def stats(self):
+        """Returns hit/miss counters per pipeline plus totals."""
+        with self._lock:
+            hits = sum(self.hits.values())
+            misses = sum(self.misses.values())
+            pipelines = sorted(set(self.hits) | set(self.misses))
+            return {
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+                "pipelines": {
+                    p: {"hits": self.hits.get(p, 0), "misses": self.misses.get(p, 0)}
+                    for p in pipelines
+                },
+            }
@@ -0,0 +1,274 @@
+"""Response schemas for the JSON-producing pipelines.
+
+Each schema is written once in the OpenAPI subset Gemini's structured-output
+mode accepts. The same definition drives the generation config sent to the
+API, the shape description embedded in prompts, and a validator compiled
+once at import time. parse_response() records how many responses parsed,
+how many failed and how long parsing took, per pipeline.
+"""
+import json
+import threading
+import time
+
+import metrics
+import tracing
+
+STRING = {"type": "STRING"}
+NUMBER = {"type": "NUMBER"}
+INTEGER = {"type": "INTEGER"}
+BOOLEAN = {"type": "BOOLEAN"}
+LEVEL = {"type": "STRING", "enum": ["beginner", "intermediate", "advanced"]}
+
+
+def array(items):
+    return {"type": "ARRAY", "items": items}
+
+
+def obj(optional=(), **properties):
+    return {
+        "type": "OBJECT",
+        "properties": properties,
+        "required": [name for name in properties if name not in optional],
+    }
+
+
+EXTRACTION = obj(
+    technical_skills=array(STRING),
+    soft_skills=array(STRING),
+    industry_knowledge=array(STRING),
+    skill_details=array(obj(
+        optional=("years_of_experience", "proficiency_level"),
+        skill=STRING,
+        years_of_experience=NUMBER,
+        proficiency_level=STRING,
+    )),
+    optional=("skill_details",),
+)
+
+COURSE_RECOMMENDATIONS = obj(
+    needs_analysis=STRING,
+    recommended_courses=array(obj(
+        title=STRING,
+        platform=STRING,
+        description=STRING,
+        duration_weeks=NUMBER,
+        skill_level=STRING,
+        includes_projects=BOOLEAN,
+        certification=BOOLEAN,
+        key_topics=array(STRING),
+    )),
+    learning_schedule=obj(
+        weekly_breakdown=array(obj(
+            week=INTEGER,
+            focus=STRING,
+            hours_required=NUMBER,
+            goals=array(STRING),
+        )),
+        total_hours_weekly=NUMBER,
+    ),
+    additional_resources=array(obj(type=STRING, name=STRING, url=STRING, optional=("url",))),
+    next_steps=array(STRING),
+)
+
+# Narrative-only answers used when the courses come from the local catalog
+COURSE_NARRATIVE = obj(**{
+    name: COURSE_RECOMMENDATIONS["properties"][name]
+    for name in ("needs_analysis", "learning_schedule", "additional_resources", "next_steps")
+})
+
+SKILLS_COURSE_RECOMMENDATIONS = obj(
+    assessment=STRING,
+    skill_gaps=array(STRING),
+    learning_path=array(obj(
+        level=LEVEL,
+        courses=array(obj(
+            title=STRING,
+            platform=STRING,
+            description=STRING,
+            estimated_duration=STRING,
+            key_topics=array(STRING),
+        )),
+    )),
+    estimated_timeline=STRING,
+    recommended_platforms=array(STRING),
+    next_steps=array(STRING),
+)
+
+SKILLS_COURSE_NARRATIVE = obj(**{
+    name: SKILLS_COURSE_RECOMMENDATIONS["properties"][name]
+    for name in ("assessment", "skill_gaps", "estimated_timeline", "recommended_platforms", "next_steps")
+})
+
+PROJECT_RECOMMENDATIONS = obj(
+    recommended_projects=array(obj(
+        title=STRING,
+        description=STRING,
+        skills_demonstrated=array(STRING),
+        estimated_time=STRING,
+        difficulty=LEVEL,
+        key_features=array(STRING),
+        portfolio_value=STRING,
+        resources_needed=array(STRING),
+        learning_outcomes=array(STRING),
+    )),
+    learning_progression=STRING,
+    project_selection_tips=array(STRING),
+    additional_resources=array(STRING),
+    optional=("additional_resources",),
+)
+
+SCHEMAS = {
+    "extract_skills": EXTRACTION,
+    "course_recommendations": COURSE_RECOMMENDATIONS,
+    "course_narrative": COURSE_NARRATIVE,
+    "skills_course_recommendations": SKILLS_COURSE_RECOMMENDATIONS,
+    "skills_course_narrative": SKILLS_COURSE_NARRATIVE,
+    "project_recommendations": PROJECT_RECOMMENDATIONS,
+}
+
+# Models that predate structured output; they get the shape in the prompt only
+_NO_SCHEMA_MODELS = ("gemini-pro", "gemini-1.0-pro")
+
+
+def shape(schema, optional=False):
+    """Renders a schema as the example-shape dict the prompts describe."""
+    kind = schema["type"]
+    if kind == "OBJECT":
+        required = set(schema.get("required", ()))
+        return {name: shape(prop, name not in required) for name, prop in schema["properties"].items()}
+    if kind == "ARRAY":
+        return [shape(schema["items"])]
+    name = "|".join(schema["enum"]) if "enum" in schema else kind.lower()
+    return f"{name} (optional)" if optional else name
+
+
+def supports_structured_output(model_name):
+    return model_name.split("/")[-1] not in _NO_SCHEMA_MODELS
+
+
+def generation_config(pipeline, model):
+    """Returns the structured-output generation config for a pipeline, or None if the model can't use it."""
+    model_name = getattr(model, "model_name", None) or str(model)
+    if not supports_structured_output(model_name):
+        return None
+    return {"response_mime_type": "application/json", "response_schema": SCHEMAS[pipeline]}
+
+
+# --- validation --------------------------------------------------------------
+
+def compile_validator(schema):
+    """Builds a checker function for a schema once, so validating a response is just calls."""
+    kind = schema["type"]
+    if kind == "OBJECT":
+        properties = {name: compile_validator(prop) for name, prop in schema["properties"].items()}
+        required = tuple(schema.get("required", ()))
+
+        def check(value, path, errors):
+            if not isinstance(value, dict):
+                errors.append(f"{path}: expected object")
+                return
+            for name in required:
+                if name not in value:
+                    errors.append(f"{path}.{name}: missing")
+            for name, item in value.items():
+                checker = properties.get(name)
+                if checker is not None:
+                    checker(item, f"{path}.{name}", errors)
+        return check
+
+    if kind == "ARRAY":
+        item_check = compile_validator(schema["items"])
+
+        def check(value, path, errors):
+            if not isinstance(value, list):
+                errors.append(f"{path}: expected array")
+                return
+            for i, item in enumerate(value):
+                item_check(item, f"{path}[{i}]", errors)
+        return check
+
+    if kind == "STRING":
+        allowed = frozenset(schema.get("enum", ()))
+
+        def check(value, path, errors):
+            if not isinstance(value, str):
+                errors.append(f"{path}: expected string")
+            elif allowed and value not in allowed:
+                errors.append(f"{path}: {value!r} is not one of {sorted(allowed)}")
+        return check
+
+    types = {"NUMBER": (int, float), "INTEGER": (int,), "BOOLEAN": (bool,)}[kind]
+
+    def check(value, path, errors):
+        # bool is an int subclass, so only BOOLEAN accepts it
+        if not isinstance(value, types) or (kind != "BOOLEAN" and isinstance(value, bool)):
+            errors.append(f"{path}: expected {kind.lower()}")
+    return check
+
+
+VALIDATORS = {pipeline: compile_validator(schema) for pipeline, schema in SCHEMAS.items()}
+
+
+def validate(pipeline, value):
+    """Returns a list of validation errors (empty when value matches the pipeline's schema)."""
+    errors = []
+    VALIDATORS[pipeline](value, "$", errors)
+    return errors
+
+
+# --- parsing -----------------------------------------------------------------
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def _record(pipeline, ok, seconds):
+    with _stats_lock:
+        entry = _stats.setdefault(pipeline, {"parsed": 0, "failed": 0, "parse_seconds": 0.0})
+        entry["parsed" if ok else "failed"] += 1
+        entry["parse_seconds"] += seconds
+    metrics.LLM_PARSES.inc(pipeline, "ok" if ok else "failed")
+
+
+def parse_stats():
+    """Parse successes, failures, failure rate and mean parse time per pipeline."""
+    with _stats_lock:
+        result = {}
+        for pipeline, entry in _stats.items():
+            total = entry["parsed"] + entry["failed"]
+            result[pipeline] = dict(
+                entry,
+                failure_rate=entry["failed"] / total if total else 0.0,
+                mean_parse_ms=entry["parse_seconds"] * 1000 / total if total else 0.0,
+            )
+        return result
+
+
+def _loads(text):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        # Models without structured output may still wrap the object in prose or a fence
+        start = text.find("{")
+        end = text.rfind("}") + 1
+        if start < 0 or end <= start:
+            raise
+        return json.loads(text[start:end])
+
+
+def parse_response(pipeline, text):
+    """Parses and validates a response. Returns (data, None) or (None, error message)."""
+    with tracing.span("llm.parse", pipeline=pipeline, chars=len(text)) as span:
+        start = time.perf_counter()
+        try:
+            data = _loads(text)
+        except json.JSONDecodeError as e:
+            _record(pipeline, False, time.perf_counter() - start)
+            span.set_attribute("ok", False)
+            return None, f"invalid JSON: {e}"
+        errors = validate(pipeline, data)
+        _record(pipeline, not errors, time.perf_counter() - start)
+        span.set_attribute("ok", not errors)
+    if errors:
+        return None, "; ".join(errors[:5])
+    return data, None
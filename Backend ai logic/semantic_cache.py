@@ -0,0 +1,338 @@
+"""Similarity cache for skills-based course recommendations.
+
+The exact-match response cache misses profiles that differ only in casing,
+ordering or abbreviations ("ML" vs "Machine Learning"). Here the parts of a
+request that decide the answer, the canonical skill set with each skill's
+level and years, and the industry knowledge, form an exact skill_key():
+two requests only ever share a response when their keys are equal. Only
+the free-text target field is compared by similarity. It is embedded
+locally with feature hashing (word tokens plus character trigrams, no
+network) and kept in a flat inner-product index, the same layout as a FAISS
+IndexFlatIP. A request whose cosine similarity to a stored one with the
+same key reaches the threshold reuses that stored response.
+
+Entries expire after a TTL and are evicted least recently used past
+max_entries. The index is persisted to a single .npz file, at most every
+save_interval seconds and at exit, and rebuild() re-embeds every stored
+entry from its canonical text, for example after EMBEDDING_VERSION changes.
+"""
+import atexit
+import bisect
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import skill_canon
+
+# NumPy is imported when the first cache is built, not when this module is
+np = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "semantic_cache.npz")
+
+# Bump when canonical_text or embed change; stored indexes are rebuilt on load
+EMBEDDING_VERSION = 3
+DIMENSIONS = 512
+
+# Highest similarity seen between different target fields in a labelled set of
+# field pairs is 0.68 ("Web Development" / "Web Developer"); spellings of the
+# same field score 1.0 after normalization
+DEFAULT_THRESHOLD = 0.93
+
+# Years of experience in the same band are treated as the same (upper bounds)
+YEARS_BANDS = (1, 3, 5, 10)
+
+# Common shorthand expanded before embedding
+ABBREVIATIONS = {
+    "ml": "machine learning",
+    "ai": "artificial intelligence",
+    "dl": "deep learning",
+    "nlp": "natural language processing",
+    "cv": "computer vision",
+    "js": "javascript",
+    "ts": "typescript",
+    "k8s": "kubernetes",
+    "db": "database",
+    "ds": "data science",
+    "ux": "user experience",
+    "ui": "user interface",
+    "pm": "project management",
+}
+
+_TOKEN = re.compile(r"[a-z0-9+#.]+")
+
+
+def _load_numpy():
+    """Imports NumPy on first use; returns None if it isn't installed (the cache then disables itself)."""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return None
+        np = numpy
+    return np
+
+
+def _normalize(text):
+    words = _TOKEN.findall(str(text).lower())
+    return " ".join(ABBREVIATIONS.get(word, word) for word in words)
+
+
+def _years_band(years):
+    try:
+        return bisect.bisect_left(YEARS_BANDS, float(years))
+    except (TypeError, ValueError):
+        return None
+
+
+def _entry_key(entry, name_key):
+    return [
+        _normalize(skill_canon.canonical_name(entry.get(name_key, ""))),
+        _normalize(entry.get("proficiency_level") or ""),
+        _years_band(entry.get("years_experience")),
+    ]
+
+
+def skill_key(skills_data):
+    """Order- and case-insensitive digest of the skills, their levels and the industry knowledge.
+
+    Requests with different keys never share a response, however similar
+    their target fields are.
+    """
+    sections = [
+        sorted((_entry_key(e, name_key) for e in skills_data.get(section, [])), key=json.dumps)
+        for section, name_key in (("technical_skills", "skill"), ("soft_skills", "skill"),
+                                  ("industry_knowledge", "knowledge_area"))
+    ]
+    return hashlib.sha256(json.dumps(sections).encode("utf-8")).hexdigest()[:32]
+
+
+def canonical_text(target_field):
+    """Case- and abbreviation-insensitive text form of a target field, the part compared by similarity."""
+    return f"field: {_normalize(skill_canon.canonical_name(target_field))}"
+
+
+def _bucket(feature):
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % DIMENSIONS, 1.0 if value >> 63 else -1.0
+
+
+def embed(text):
+    """Unit-length hashed embedding of a canonical text."""
+    _load_numpy()
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    for section in text.split(" | "):
+        label, _, body = section.partition(": ")
+        weight = 1.0
+        for word in body.replace(";", " ").split():
+            index, sign = _bucket(f"{label}:{word}")
+            vector[index] += sign * weight
+            padded = f"<{word}>"
+            for i in range(len(padded) - 2):
+                index, sign = _bucket(f"{label}:{padded[i:i + 3]}")
+                vector[index] += sign * weight * 0.5
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """Flat inner-product index of embedded requests and their responses."""
+
+    def __init__(self, path=DEFAULT_PATH, threshold=DEFAULT_THRESHOLD, max_entries=2000, ttl=24 * 3600,
+                 enabled=True, save_interval=5.0):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.save_interval = save_interval
+        self._dirty = False
+        self._saved_at = 0.0
+        self._save_lock = threading.Lock()
+        self.enabled = enabled and _load_numpy() is not None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._entries = []  # dicts: namespace, text, response, created_at, accessed_at
+        if self.enabled:
+            self._vectors = np.zeros((0, DIMENSIONS), dtype=np.float32)
+            self.load()
+            atexit.register(self.save)
+        elif enabled:
+            logger.warning("NumPy is not installed; the semantic cache is disabled")
+
+    @classmethod
+    def from_env(cls):
+        """Builds a cache configured from SEMANTIC_CACHE_* environment variables."""
+        return cls(
+            path=os.getenv("SEMANTIC_CACHE_PATH", DEFAULT_PATH),
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", str(DEFAULT_THRESHOLD))),
+            max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000")),
+            ttl=int(os.getenv("SEMANTIC_CACHE_TTL", str(24 * 3600))),
+            enabled=os.getenv("SEMANTIC_CACHE_DISABLE", "").strip().lower() not in ("1", "true", "yes", "on"),
+            save_interval=float(os.getenv("SEMANTIC_CACHE_SAVE_INTERVAL", "5")),
+        )
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, namespace, text):
+        """Returns the stored response most similar to text, or None below the threshold."""
+        if not self.enabled:
+            return None
+        query = embed(text)
+        now = time.time()
+        with self._lock:
+            if self._entries:
+                scores = self._vectors @ query
+                for i, entry in enumerate(self._entries):
+                    if entry["namespace"] != namespace or entry["created_at"] + self.ttl <= now:
+                        scores[i] = -1.0
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._entries[best]["accessed_at"] = now
+                    self.hits += 1
+                    logger.info("semantic cache hit similarity=%.3f", scores[best])
+                    return self._entries[best]["response"]
+            self.misses += 1
+            return None
+
+    def set(self, namespace, text, response):
+        """Stores a response, evicting expired and least recently used entries.
+
+        The index is written to disk if save_interval has passed since the
+        last write; otherwise a later set() or exit writes it.
+        """
+        if not self.enabled:
+            return
+        vector = embed(text)
+        now = time.time()
+        with self._lock:
+            for i, entry in enumerate(self._entries):
+                if entry["namespace"] == namespace and entry["text"] == text:
+                    entry.update(response=response, created_at=now, accessed_at=now)
+                    break
+            else:
+                self._entries.append({"namespace": namespace, "text": text, "response": response,
+                                      "created_at": now, "accessed_at": now})
+                self._vectors = np.vstack([self._vectors, vector[None, :]])
+            self._evict(now)
+            self._dirty = True
+        if now - self._saved_at >= self.save_interval:
+            self.save()
+
+    def discard(self, namespace, text):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._keep([i for i, e in enumerate(self._entries)
+                        if not (e["namespace"] == namespace and e["text"] == text)])
+            self._dirty = True
+        self.save()
+
+    def clear(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._keep([])
+            self._dirty = True
+        self.save()
+
+    def _keep(self, indices):
+        self._entries = [self._entries[i] for i in indices]
+        self._vectors = self._vectors[indices] if indices else np.zeros((0, DIMENSIONS), dtype=np.float32)
+
+    def _evict(self, now):
+        live = [i for i, e in enumerate(self._entries) if e["created_at"] + self.ttl > now]
+        if len(live) > self.max_entries:
+            live.sort(key=lambda i: self._entries[i]["accessed_at"])
+            live = sorted(live[-self.max_entries:])
+        if len(live) != len(self._entries):
+            self._keep(live)
+
+    def rebuild(self):
+        """Re-embeds every stored entry from its canonical text."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._entries:
+                self._vectors = np.stack([embed(e["text"]) for e in self._entries]).astype(np.float32)
+            else:
+                self._vectors = np.zeros((0, DIMENSIONS), dtype=np.float32)
+            self._dirty = True
+        self.save()
+
+    def load(self):
+        """Loads the persisted index, rebuilding it if it was built by another embedding version."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                entries = meta["entries"]
+                vectors = data["vectors"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable semantic cache %s: %s", self.path, e)
+            return
+        # Lookups index both by position, so a file where they disagree can't be used
+        if len(entries) != len(vectors):
+            logger.warning("Ignoring semantic cache %s: %d entries but %d vectors",
+                           self.path, len(entries), len(vectors))
+            return
+        with self._lock:
+            self._entries = entries
+            self._vectors = vectors.astype(np.float32)
+        if meta.get("version") != EMBEDDING_VERSION or vectors.shape[1:] != (DIMENSIONS,):
+            logger.info("Rebuilding semantic cache index for embedding version %s", EMBEDDING_VERSION)
+            self.rebuild()
+
+    def save(self):
+        """Writes the index to disk if it changed since the last write."""
+        if not self.enabled or not self.path:
+            return
+        # One writer at a time; lookups only wait for the snapshot, not the disk
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                meta = json.dumps({"version": EMBEDDING_VERSION, "entries": self._entries})
+                vectors = self._vectors
+                self._dirty = False
+                self._saved_at = time.time()
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    np.savez(f, vectors=vectors, meta=np.array(meta))
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning("Could not persist semantic cache: %s", e)
+                with self._lock:
+                    self._dirty = True
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+
+_cache = None
+
+
+def get_cache():
+    """Returns the process-wide semantic cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        _cache = SemanticCache.from_env()
+    return _cache
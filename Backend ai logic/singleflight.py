@@ -0,0 +1,155 @@
+"""Request coalescing for identical in-flight calls.
+
+When several callers ask for the same key while a call for it is already
+running, only the first (the leader) does the work; the rest wait for and
+share its result or exception. If the leader is cancelled instead (say its
+client disconnected), the waiting followers start over and one of them
+becomes the new leader. Leaders and followers may be any mix of threads and
+asyncio tasks, on any event loop.
+"""
+import asyncio
+import threading
+import time
+
+
+class FlightCancelled(Exception):
+    """The shared call was cancelled before it produced a result; followers retry it."""
+
+
+def _remaining(deadline):
+    return None if deadline is None else max(deadline - time.monotonic(), 0)
+
+
+def _resolve(future, result, error):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.cancelled = False
+        self.waiters = []
+        self.lock = threading.Lock()
+
+    def finish(self, result, error):
+        with self.lock:
+            self.result = result
+            self.error = error
+            self.event.set()
+            waiters, self.waiters = self.waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future, result, error)
+            except RuntimeError:
+                # The waiter's loop has already been closed
+                pass
+
+    def outcome(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def wait(self, timeout):
+        if not self.event.wait(timeout):
+            raise TimeoutError("Timed out waiting for an identical in-flight request")
+        return self.outcome()
+
+    async def wait_async(self, timeout):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self.lock:
+            if self.event.is_set():
+                return self.outcome()
+            self.waiters.append((loop, future))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError("Timed out waiting for an identical in-flight request") from None
+
+
+class SingleFlight:
+    """Collapses concurrent calls that share a key into one upstream call."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.calls = 0
+        self.collapsed = 0
+
+    def _join(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.collapsed += 1
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            self.calls += 1
+            return flight, True
+
+    def _finish(self, key, flight, result, error, cancelled=False):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.cancelled = cancelled
+        flight.finish(result, error)
+
+    def do(self, key, fn, timeout=None):
+        """Runs fn() unless a call for key is in flight, in which case waits for its result.
+
+        timeout bounds the whole wait, including any retries after a cancelled leader.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            flight, leader = self._join(key)
+            if leader:
+                break
+            try:
+                return flight.wait(_remaining(deadline))
+            except FlightCancelled:
+                if not flight.cancelled:
+                    raise
+        try:
+            result = fn()
+        except Exception as e:
+            self._finish(key, flight, None, e)
+            raise
+        except BaseException:
+            self._finish(key, flight, None, FlightCancelled(key), cancelled=True)
+            raise
+        self._finish(key, flight, result, None)
+        return result
+
+    async def do_async(self, key, fn, timeout=None):
+        """Async variant of do(); fn is a coroutine function."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            flight, leader = self._join(key)
+            if leader:
+                break
+            try:
+                return await flight.wait_async(_remaining(deadline))
+            except FlightCancelled:
+                if not flight.cancelled:
+                    raise
+        try:
+            result = await fn()
+        except Exception as e:
+            self._finish(key, flight, None, e)
+            raise
+        except BaseException:
+            # Includes cancellation of the leader's task
+            self._finish(key, flight, None, FlightCancelled(key), cancelled=True)
+            raise
+        self._finish(key, flight, result, None)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "collapsed": self.collapsed, "in_flight": len(self._flights)}
@@ -0,0 +1,312 @@
+"""Skill name canonicalization shared by every intake path.
+
+Free-text skills such as "JS", "javascript" and "Java Script" become one
+canonical name with a stable ID before prompts, caches and storage see
+them. Lookups go alias table first, then a fuzzy match against all known
+spellings: none below six characters, distance 1 up to nine and 2 beyond,
+counting adjacent transpositions as one edit, and only between spellings
+with the same first letter and similar length. Results are memoized, so
+repeated entries in a batch cost a dict lookup.
+
+Extra aliases can be supplied as JSON ({"Canonical": ["alias", ...]}) via
+SKILL_ALIASES_PATH.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+Match = namedtuple("Match", "id name method")  # method: "alias", "fuzzy" or "new"
+
+# Canonical name -> other spellings; the canonical name is an alias of itself
+ALIASES = {
+    # No "python 3": in "Python 3 advanced" the 3 is years of experience
+    "Python": ["py", "python3", "python programming"],
+    "JavaScript": ["js", "java script", "ecmascript", "es6", "vanilla js"],
+    "TypeScript": ["ts"],
+    "Java": ["core java"],
+    "C": [],
+    "C++": ["cpp", "c plus plus"],
+    "C#": ["csharp", "c sharp"],
+    "Go": ["golang"],
+    "Rust": [],
+    "Ruby": [],
+    "PHP": [],
+    "Kotlin": [],
+    "Swift": [],
+    "R": ["r programming", "rlang"],
+    "SQL": ["structured query language"],
+    "PostgreSQL": ["postgres", "psql", "postgre sql"],
+    "MySQL": [],
+    "MongoDB": ["mongo", "mongo db"],
+    "Redis": [],
+    "HTML": ["html5"],
+    "CSS": ["css3"],
+    "React": ["reactjs", "react.js"],
+    "Angular": ["angularjs", "angular.js"],
+    "Vue.js": ["vue", "vuejs"],
+    "Node.js": ["node", "nodejs"],
+    "Express.js": ["express", "expressjs"],
+    "Django": [],
+    "Flask": [],
+    "FastAPI": ["fast api"],
+    "Spring Boot": ["springboot", "spring"],
+    "Docker": [],
+    "Kubernetes": ["k8s", "kube"],
+    "AWS": ["amazon web services"],
+    "Azure": ["microsoft azure"],
+    "GCP": ["google cloud", "google cloud platform"],
+    "Git": [],
+    "Linux": [],
+    "Machine Learning": ["ml"],
+    "Deep Learning": ["dl"],
+    "Artificial Intelligence": ["ai"],
+    "Natural Language Processing": ["nlp"],
+    "Computer Vision": ["cv"],
+    "Data Science": ["ds"],
+    "Data Analysis": ["data analytics"],
+    "TensorFlow": ["tf"],
+    "PyTorch": ["torch"],
+    "scikit-learn": ["sklearn"],
+    "Pandas": [],
+    "NumPy": [],
+    "Excel": ["ms excel", "microsoft excel"],
+    "Power BI": ["powerbi"],
+    "Tableau": [],
+    "CI/CD": ["continuous integration"],
+    "DevOps": [],
+    "REST APIs": ["rest", "rest api", "restful api", "restful"],
+    "GraphQL": [],
+    "Communication": ["communication skills", "verbal communication"],
+    "Leadership": [],
+    "Teamwork": ["team work", "collaboration", "team player"],
+    "Problem Solving": [],
+    "Project Management": ["pm"],
+    "Time Management": [],
+    "Critical Thinking": [],
+    "Agile": ["agile methodology"],
+    "Scrum": [],
+    "UX Design": ["ux", "user experience"],
+    "UI Design": ["ui", "user interface"],
+    "Figma": [],
+    "Fintech": ["financial technology"],
+    "Healthcare": ["health care"],
+}
+
+_SEPARATORS = re.compile(r"[\s_\-./]+")
+_WHITESPACE = re.compile(r"\s+")
+_WORD = re.compile(r"[^\s_\-/]+")
+
+
+def key_of(text):
+    """Spelling-insensitive lookup key: lower case without spaces, dots, dashes or slashes."""
+    return _SEPARATORS.sub("", str(text).lower())
+
+
+def _words(text):
+    return [key_of(word) for word in _WORD.findall(str(text).lower()) if key_of(word)]
+
+
+def skill_id(name):
+    """Stable ID for a canonical skill name."""
+    return "sk_" + hashlib.blake2b(key_of(name).encode("utf-8"), digest_size=5).hexdigest()
+
+
+def _max_distance(key):
+    # Below six characters one edit turns one real skill into another ("jest" / "rest",
+    # "flash" / "flask"), so short names only match exactly or through an alias
+    if len(key) < 6:
+        return 0
+    return 1 if len(key) < 10 else 2
+
+
+def _plausible_typo(key, candidate):
+    # Typos keep the first letter and roughly the length of what was meant
+    return key[0] == candidate[0] and min(len(key), len(candidate)) / max(len(key), len(candidate)) >= 0.8
+
+
+def _deletions(key, distance):
+    """Every string reachable from key by deleting up to `distance` characters."""
+    found = {key}
+    frontier = {key}
+    for _ in range(distance):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        found |= frontier
+    return found
+
+
+def edit_distance(a, b):
+    """Optimal string alignment distance (Levenshtein plus adjacent transpositions)."""
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        row = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            row[j] = min(row[j - 1] + 1, previous[j] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], previous2[j - 2] + 1)
+        previous2, previous = previous, row
+    return previous[-1]
+
+
+class SkillIndex:
+    """Alias table, a word trie for multi-word names and a deletion index for fuzzy matching.
+
+    The trie is keyed by words so the longest known skill at the start of a
+    line ("machine learning 2 advanced") can be split from what follows. The
+    deletion index maps every spelling with up to two characters removed to
+    the spellings it came from, so fuzzy candidates are found with a few
+    dict lookups instead of comparing against every alias.
+    """
+
+    def __init__(self, aliases):
+        self.aliases = {}
+        self.trie = {}
+        self.deletions = {}
+        for name, spellings in aliases.items():
+            for spelling in [name] + list(spellings):
+                self.add(spelling, name)
+
+    def add(self, spelling, name):
+        key = key_of(spelling)
+        if not key:
+            return
+        self.aliases[key] = name
+        node = self.trie
+        for word in _words(spelling):
+            node = node.setdefault(word, {})
+        node[None] = name
+        for variant in _deletions(key, _max_distance(key)):
+            self.deletions.setdefault(variant, set()).add(key)
+
+    def fuzzy(self, key, max_distance):
+        """Known name whose spelling is closest to key, within max_distance edits.
+
+        Returns None when nothing is close enough or two names are equally close.
+        """
+        candidates = set()
+        for variant in _deletions(key, max_distance):
+            candidates |= self.deletions.get(variant, set())
+        best_distance, names = max_distance + 1, set()
+        for candidate in candidates:
+            if not _plausible_typo(key, candidate):
+                continue
+            distance = edit_distance(key, candidate)
+            if distance > _max_distance(candidate) or distance > best_distance:
+                continue
+            if distance < best_distance:
+                best_distance, names = distance, set()
+            names.add(self.aliases[candidate])
+        # "reat" is as close to REST as to React; guessing would merge unrelated skills
+        return names.pop() if len(names) == 1 else None
+
+    def longest_prefix(self, words):
+        """(name, word count) of the longest known skill that the words start with, or (None, 0)."""
+        node = self.trie
+        found = (None, 0)
+        for i, word in enumerate(words):
+            node = node.get(word)
+            if node is None:
+                break
+            if None in node:
+                found = (node[None], i + 1)
+        return found
+
+
+def _load_aliases():
+    aliases = {name: list(spellings) for name, spellings in ALIASES.items()}
+    path = os.getenv("SKILL_ALIASES_PATH")
+    if path:
+        try:
+            with open(path, encoding="utf-8") as f:
+                for name, spellings in json.load(f).items():
+                    aliases.setdefault(name, []).extend(spellings)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load skill aliases from %s: %s", path, e)
+    return aliases
+
+
+_index = None
+
+
+def get_index():
+    global _index
+    if _index is None:
+        _index = SkillIndex(_load_aliases())
+    return _index
+
+
+def _tidy(text):
+    # Unknown skills keep their spelling but get consistent capitalisation
+    return " ".join(w.capitalize() if w.islower() else w for w in _WHITESPACE.split(text.strip()))
+
+
+@lru_cache(maxsize=65536)
+def canonicalize(text):
+    """Returns the Match for one free-text skill."""
+    index = get_index()
+    key = key_of(text)
+    name = index.aliases.get(key)
+    if name is not None:
+        return Match(skill_id(name), name, "alias")
+    distance = _max_distance(key)
+    name = index.fuzzy(key, distance) if distance else None
+    if name is not None:
+        return Match(skill_id(name), name, "fuzzy")
+    name = _tidy(text)
+    return Match(skill_id(name), name, "new")
+
+
+def split_skill(text):
+    """Splits a known skill off the start of a line, e.g. "Machine Learning 2 advanced".
+
+    Returns (Match, rest of the line), or (None, text) if the line doesn't
+    start with a known skill.
+    """
+    tokens = text.split()
+    name, count = get_index().longest_prefix([key_of(token) for token in tokens])
+    if name is None:
+        return None, text
+    return Match(skill_id(name), name, "alias"), " ".join(tokens[count:])
+
+
+def canonical_name(text):
+    return canonicalize(text).name
+
+
+def canonical_names(texts):
+    """Canonical names of a list of skills, duplicates removed, order kept."""
+    seen = {}
+    for text in texts:
+        if text and text.strip():
+            match = canonicalize(text)
+            seen.setdefault(match.id, match.name)
+    return list(seen.values())
+
+
+def canonicalize_entries(entries, name_key="skill"):
+    """Canonicalizes skill dicts in place of their names, adding skill_id and merging duplicates."""
+    merged = {}
+    for entry in entries:
+        match = canonicalize(entry[name_key])
+        current = merged.get(match.id)
+        if current is None:
+            merged[match.id] = dict(entry, **{name_key: match.name, "skill_id": match.id})
+        else:
+            # Keep details (years, proficiency) that only a later duplicate had
+            for field, value in entry.items():
+                current.setdefault(field, value)
+    return list(merged.values())
+
+
+def canonicalize_profile(skills_data):
+    """Canonicalizes every section of a skills profile from skills.py."""
+    return {
+        "technical_skills": canonicalize_entries(skills_data.get("technical_skills", [])),
+        "soft_skills": canonicalize_entries(skills_data.get("soft_skills", [])),
+        "industry_knowledge": canonicalize_entries(skills_data.get("industry_knowledge", []), "knowledge_area"),
+    }
@@ -1,15 +1,28 @@
-import google.generativeai as genai
+import asyncio
 import json
-import os
-from dotenv import load_dotenv
-load_dotenv()
+import logging
+import sqlite3
+from contextlib import aclosing, closing
+from llm_client import (
+    LazyModel, missing_credentials, generate_text, generate_text_async, discard_cached, stream_text,
+    stream_text_async, cache_identity,
+)
+from json_stream import DOCUMENT, iter_items, aiter_items
+from schemas import generation_config, parse_response
+from prompts import skills_prompt, skills_narrative_prompt
+import course_catalog
+import semantic_cache
+import skill_canon
+import tracing
 
-# Configure your API key
-GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")  # Replace with your Gemini API key
+logger = logging.getLogger(__name__)
 
-# Configure Gemini
-genai.configure(api_key=GOOGLE_API_KEY)
-model = genai.GenerativeModel('gemini-2.0-flash')
+# Gemini is configured on the first call, so importing this module has no side effects
+model = LazyModel('gemini-2.0-flash')
+
+# Parts of the response emitted as soon as they are complete while streaming
+STREAM_PATHS = ("assessment", "skill_gaps", "learning_path.*.level", "learning_path.*.courses.*")
+NARRATIVE_STREAM_PATHS = ("assessment", "skill_gaps")
 
 def collect_skills():
     """Collect user's skills in a streamlined manner."""
@@ -34,7 +47,9 @@ def collect_skills():
         if skill_input.lower() == 'done':
             break
             
-        parts = skill_input.split()
+        # Keep multi-word skills ("Machine Learning 2 advanced") together
+        match, rest = skill_canon.split_skill(skill_input)
+        parts = [match.name] + rest.split() if match else skill_input.split()
         skill_entry = {"skill": parts[0]}
         
         if len(parts) > 1:
@@ -70,7 +85,9 @@ def collect_skills():
         if skill_input.lower() == 'done':
             break
             
-        parts = skill_input.split()
+        # Keep multi-word skills ("Machine Learning 2 advanced") together
+        match, rest = skill_canon.split_skill(skill_input)
+        parts = [match.name] + rest.split() if match else skill_input.split()
         skill_entry = {"skill": parts[0]}
         
         if len(parts) > 1:
@@ -119,7 +136,7 @@ def collect_skills():
         skills_data["industry_knowledge"].append(knowledge_entry)
         print(f"Added: {knowledge_entry}")
     
-    return skills_data
+    return skill_canon.canonicalize_profile(skills_data)
 
 def quick_add_skills():
     """Alternative method to quickly add multiple skills at once."""
@@ -140,6 +157,7 @@ def quick_add_skills():
         if skill:
             skills_data["technical_skills"].append({"skill": skill})
     
+    skills_data["technical_skills"] = skill_canon.canonicalize_entries(skills_data["technical_skills"])
     print(f"Added {len(skills_data['technical_skills'])} technical skills.")
     
     # Add experience years and proficiency for technical skills?
@@ -200,7 +218,7 @@ def quick_add_skills():
             if prof_input in ["beginner", "intermediate", "advanced", "expert"]:
                 skills_data["industry_knowledge"][i]["proficiency_level"] = prof_input
     
-    return skills_data
+    return skill_canon.canonicalize_profile(skills_data)
 
 def get_course_field():
     """Get the field to explore from the user."""
@@ -208,106 +226,233 @@ def get_course_field():
     field = input("What field would you like to explore or advance in? ")
     return field
 
-def generate_course_recommendations(skills_data, target_field):
-    """Generate course recommendations using the Gemini API."""
-    prompt = f"""
-    Based on the following skills profile:
-    {json.dumps(skills_data, indent=2)}
-    
-    And the user's target field: {target_field}
-    
-    Please provide a personalized learning path with specific courses that will help the user advance in their career goal.
-    
-    Include in your response:
-    1. Assessment of current skills relative to the field
-    2. Identification of skill gaps
-    3. A sequential course path with:
-       - Beginner courses (if needed)
-       - Intermediate courses
-       - Advanced/specialized courses
-    4. Estimated timeline
-    5. Recommended learning platforms
-    
-    Format the output as a JSON object with the following structure:
-    {{
-        "assessment": "string",
-        "skill_gaps": ["string"],
-        "learning_path": [
-            {{
-                "level": "beginner|intermediate|advanced",
-                "courses": [
-                    {{
-                        "title": "string",
-                        "platform": "string",
-                        "description": "string",
-                        "estimated_duration": "string",
-                        "key_topics": ["string"]
-                    }}
-                ]
-            }}
-        ],
-        "estimated_timeline": "string",
-        "recommended_platforms": ["string"],
-        "next_steps": ["string"]
-    }}
-    
-    Return only valid JSON with no additional text or formatting.
-    """
-    
-    response = model.generate_content(prompt)
-    
-    try:
-        # Try to parse the response as JSON
-        recommendations = json.loads(response.text)
-        return recommendations
-    except json.JSONDecodeError:
-        # If direct parsing fails, try to extract JSON from markdown code blocks
-        import re
-        json_match = re.search(r'```(?:json)?\n(.*?)\n```', response.text, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group(1))
-            except json.JSONDecodeError:
-                pass
-        
-        # Return an error message if JSON extraction fails
+def build_course_prompt(skills_data, target_field):
+    """Builds the Gemini prompt for a skills profile and target field."""
+    return skills_prompt(skills_data, target_field, model)
+
+def parse_recommendations(response_text, pipeline="skills_course_recommendations"):
+    """Parses the model's JSON answer and checks it against the response schema."""
+    recommendations, error = parse_response(pipeline, response_text)
+    if error:
         return {
             "error": "Could not generate proper recommendations. Please try again.",
-            "raw_response": response.text
+            "details": error,
+            "raw_response": response_text
         }
+    return recommendations
 
-def display_recommendations(recommendations):
-    """Displays the course recommendations in a formatted way."""
+def _semantic_key(skills_data, target_field, config):
+    """Namespace (with the exact skill key) and target field text used to find near-identical earlier requests."""
+    identity = cache_identity(model, config)
+    namespace = f"skills_course_recommendations:{identity}:{semantic_cache.skill_key(skills_data)}"
+    return namespace, semantic_cache.canonical_text(target_field)
+
+def _similar_response(skills_data, target_field, bypass_cache):
+    """Returns the recommendations stored for a near-identical profile, as JSON text, or None."""
+    if bypass_cache:
+        return None
+    config = generation_config("skills_course_recommendations", model)
+    return semantic_cache.get_cache().get(*_semantic_key(skills_data, target_field, config))
+
+def _remember_response(skills_data, target_field, recommendations):
+    config = generation_config("skills_course_recommendations", model)
+    semantic_cache.get_cache().set(*_semantic_key(skills_data, target_field, config), json.dumps(recommendations))
+
+async def _replay(text):
+    yield text
+
+def catalog_learning_path(target_field):
+    """Per-level catalog courses for the field, or None if the catalog has too few."""
+    try:
+        catalog = course_catalog.get_catalog()
+        learning_path = []
+        for level in course_catalog.LEVELS:
+            courses = catalog.search(target_field, level=level, k=3)
+            if courses:
+                learning_path.append({"level": level, "courses": courses})
+    except sqlite3.Error as e:
+        logger.warning("Course catalog unavailable: %s", e)
+        return None
+    if sum(len(stage["courses"]) for stage in learning_path) < course_catalog.MIN_MATCHES:
+        return None
+    return learning_path
+
+def _fill_learning_path(learning_path, skill_gaps):
+    """Puts catalog courses that target the skill gaps first in each level."""
+    catalog = course_catalog.get_catalog()
+    filled = []
+    for stage in learning_path:
+        by_gap = [course for gap in skill_gaps for course in catalog.search(gap, level=stage["level"], k=1)]
+        courses = list({course["id"]: course for course in by_gap + stage["courses"]}.values())[:3]
+        filled.append({"level": stage["level"], "courses": [course_catalog.as_skills_course(c) for c in courses]})
+    return filled
+
+def plan_request(skills_data, target_field):
+    """Returns (pipeline, prompt, catalog learning path).
+
+    When the catalog covers the field, Gemini is only asked for the assessment,
+    skill gaps and other narrative; the course path comes from the catalog.
+    """
+    learning_path = catalog_learning_path(target_field)
+    if learning_path is not None:
+        prompt = skills_narrative_prompt(skills_data, target_field, model)
+        return "skills_course_narrative", prompt, learning_path
+    return "skills_course_recommendations", build_course_prompt(skills_data, target_field), None
+
+def finish_recommendations(skills_data, target_field, pipeline, response_text, prompt, config, learning_path,
+                           bypass_cache):
+    """Parses a response, merges in catalog courses and records the result in the catalog and semantic cache."""
+    recommendations = parse_recommendations(response_text, pipeline)
     if "error" in recommendations:
-        print("\n⚠️ Error generating recommendations:")
-        print(recommendations["error"])
+        # Don't keep serving a response we could not parse
+        discard_cached(model, prompt, config)
+        return recommendations
+    if learning_path is not None:
+        recommendations = dict(
+            recommendations, learning_path=_fill_learning_path(learning_path, recommendations["skill_gaps"]))
+    else:
+        course_catalog.get_catalog().record_response(recommendations)
+    if not bypass_cache:
+        _remember_response(skills_data, target_field, recommendations)
+    return recommendations
+
+def generate_course_recommendations(skills_data, target_field, bypass_cache=False):
+    """Generate course recommendations using the Gemini API."""
+    similar = _similar_response(skills_data, target_field, bypass_cache)
+    if similar is not None:
+        return parse_recommendations(similar)
+    pipeline, prompt, learning_path = plan_request(skills_data, target_field)
+    config = generation_config(pipeline, model)
+    response_text = generate_text(model, prompt, pipeline, bypass_cache=bypass_cache, generation_config=config)
+    return finish_recommendations(
+        skills_data, target_field, pipeline, response_text, prompt, config, learning_path, bypass_cache)
+
+async def generate_course_recommendations_async(skills_data, target_field, bypass_cache=False):
+    """Async variant of generate_course_recommendations that doesn't block the event loop."""
+    similar = await asyncio.to_thread(_similar_response, skills_data, target_field, bypass_cache)
+    if similar is not None:
+        return parse_recommendations(similar)
+    pipeline, prompt, learning_path = await asyncio.to_thread(plan_request, skills_data, target_field)
+    config = generation_config(pipeline, model)
+    response_text = await generate_text_async(
+        model, prompt, pipeline, bypass_cache=bypass_cache, generation_config=config)
+    return await asyncio.to_thread(
+        finish_recommendations,
+        skills_data, target_field, pipeline, response_text, prompt, config, learning_path, bypass_cache,
+    )
+
+def stream_course_recommendations(skills_data, target_field, limit=None, bypass_cache=False):
+    """Yields (path, value) pairs as parts of the learning path are generated.
+
+    The assessment, skill gaps, each level name and each course are yielded as
+    soon as they close. Unless `limit` stops the stream early, the last pair is
+    ("recommendations", full_result). A response stored for a near-identical
+    profile is replayed instead of calling Gemini.
+    """
+    similar = _similar_response(skills_data, target_field, bypass_cache)
+    if similar is not None:
+        with closing(iter_items(iter([similar]), STREAM_PATHS + (DOCUMENT,), limit=limit)) as items:
+            for path, value in items:
+                yield ("recommendations", parse_recommendations(value)) if path == DOCUMENT else (path, value)
         return
-    
+    pipeline, prompt, learning_path = plan_request(skills_data, target_field)
+    config = generation_config(pipeline, model)
+    chunks = stream_text(model, prompt, pipeline, bypass_cache=bypass_cache, generation_config=config)
+    paths = STREAM_PATHS if learning_path is None else NARRATIVE_STREAM_PATHS
+    with closing(iter_items(chunks, paths + (DOCUMENT,), limit=limit)) as items:
+        for path, value in items:
+            if path != DOCUMENT:
+                yield path, value
+                continue
+            recommendations = finish_recommendations(
+                skills_data, target_field, pipeline, value, prompt, config, learning_path, bypass_cache)
+            # Catalog courses are only known once the skill gaps have been generated
+            for stage in recommendations.get("learning_path", []) if learning_path is not None else []:
+                yield "learning_path.*.level", stage["level"]
+                for course in stage["courses"]:
+                    yield "learning_path.*.courses.*", course
+            yield "recommendations", recommendations
+
+async def stream_course_recommendations_async(skills_data, target_field, limit=None, bypass_cache=False):
+    """Async variant of stream_course_recommendations."""
+    similar = await asyncio.to_thread(_similar_response, skills_data, target_field, bypass_cache)
+    if similar is not None:
+        async with aclosing(aiter_items(_replay(similar), STREAM_PATHS + (DOCUMENT,), limit=limit)) as items:
+            async for path, value in items:
+                yield ("recommendations", parse_recommendations(value)) if path == DOCUMENT else (path, value)
+        return
+    pipeline, prompt, learning_path = await asyncio.to_thread(plan_request, skills_data, target_field)
+    config = generation_config(pipeline, model)
+    chunks = stream_text_async(model, prompt, pipeline, bypass_cache=bypass_cache, generation_config=config)
+    paths = STREAM_PATHS if learning_path is None else NARRATIVE_STREAM_PATHS
+    async with aclosing(aiter_items(chunks, paths + (DOCUMENT,), limit=limit)) as items:
+        async for path, value in items:
+            if path != DOCUMENT:
+                yield path, value
+                continue
+            recommendations = await asyncio.to_thread(
+                finish_recommendations,
+                skills_data, target_field, pipeline, value, prompt, config, learning_path, bypass_cache,
+            )
+            for stage in recommendations.get("learning_path", []) if learning_path is not None else []:
+                yield "learning_path.*.level", stage["level"]
+                for course in stage["courses"]:
+                    yield "learning_path.*.courses.*", course
+            yield "recommendations", recommendations
+
+def display_header():
     print("\n" + "=" * 80)
     print(" " * 25 + "COURSE RECOMMENDATIONS")
     print("=" * 80 + "\n")
-    
-    # Display skills assessment
+
+def display_assessment(assessment):
     print("🔍 SKILLS ASSESSMENT:")
-    print(recommendations["assessment"])
+    print(assessment)
     print("\n" + "-" * 80 + "\n")
-    
-    # Display skill gaps
+
+def display_skill_gaps(skill_gaps):
     print("🔍 IDENTIFIED SKILL GAPS:")
-    for i, gap in enumerate(recommendations["skill_gaps"], 1):
+    for i, gap in enumerate(skill_gaps, 1):
         print(f"   {i}. {gap}")
     print("\n" + "-" * 80 + "\n")
+
+def display_level(level):
+    print(f"\n[{level.upper()} LEVEL COURSES]")
+
+def display_course(i, course):
+    print(f"\n{i}. {course['title']}")
+    print(f"   Platform: {course['platform']}")
+    print(f"   Duration: {course['estimated_duration']}")
+    print(f"   Description: {course['description']}")
+    print(f"   Key Topics: {', '.join(course['key_topics'])}")
+
+@tracing.traced("display")
+def display_recommendations(recommendations, streamed=False):
+    """Displays the course recommendations in a formatted way.
+
+    With streamed=True everything up to the learning path has already been
+    printed by display_streaming_recommendations.
+    """
+    if "error" in recommendations:
+        print("\n⚠️ Error generating recommendations:")
+        print(recommendations["error"])
+        return
     
-    # Display learning path
-    print("📚 RECOMMENDED LEARNING PATH:")
-    for level_group in recommendations["learning_path"]:
-        print(f"\n[{level_group['level'].upper()} LEVEL COURSES]")
-        for i, course in enumerate(level_group["courses"], 1):
-            print(f"\n{i}. {course['title']}")
-            print(f"   Platform: {course['platform']}")
-            print(f"   Duration: {course['estimated_duration']}")
-            print(f"   Description: {course['description']}")
-            print(f"   Key Topics: {', '.join(course['key_topics'])}")
+    if not streamed:
+        display_header()
+        
+        # Display skills assessment
+        display_assessment(recommendations["assessment"])
+        
+        # Display skill gaps
+        display_skill_gaps(recommendations["skill_gaps"])
+        
+        # Display learning path
+        print("📚 RECOMMENDED LEARNING PATH:")
+        for level_group in recommendations["learning_path"]:
+            display_level(level_group['level'])
+            for i, course in enumerate(level_group["courses"], 1):
+                display_course(i, course)
     
     print("\n" + "-" * 80 + "\n")
     
@@ -331,10 +476,41 @@ def display_recommendations(recommendations):
     
     print("\n" + "=" * 80)
 
+@tracing.traced("cli skills", root=True)
+def display_streaming_recommendations(skills_data, target_field):
+    """Prints the learning path course by course as it is generated, then the remaining sections."""
+    streamed = False
+    course_count = 0
+    learning_path_started = False
+    recommendations = {"error": "Could not generate proper recommendations. Please try again."}
+    for path, value in stream_course_recommendations(skills_data, target_field):
+        if path == "recommendations":
+            recommendations = value
+            continue
+        if not streamed:
+            display_header()
+            streamed = True
+        if path == "assessment":
+            display_assessment(value)
+        elif path == "skill_gaps":
+            display_skill_gaps(value)
+        else:
+            if not learning_path_started:
+                print("📚 RECOMMENDED LEARNING PATH:")
+                learning_path_started = True
+            if path == "learning_path.*.level":
+                display_level(value)
+                course_count = 0
+            else:
+                course_count += 1
+                display_course(course_count, value)
+    display_recommendations(recommendations, streamed=learning_path_started)
+    return recommendations
+
 def main():
     """Main function to run the skills-based course recommendation system."""
     # Check if API key is configured
-    if not GOOGLE_API_KEY:
+    if missing_credentials("GOOGLE_API_KEY"):
         print("Error: GOOGLE_API_KEY environment variable not set.")
         print("Please set your API key by running: export GOOGLE_API_KEY='your-api-key'")
         return
@@ -365,11 +541,8 @@ def main():
         target_field = get_course_field()
         
         print("\nGenerating personalized course recommendations...")
-        # Generate recommendations
-        recommendations = generate_course_recommendations(skills_data, target_field)
-        
-        # Display recommendations
-        display_recommendations(recommendations)
+        # Generate and display recommendations as they stream in
+        display_streaming_recommendations(skills_data, target_field)
         
     except KeyboardInterrupt:
         print("\n\nProcess interrupted. Exiting...")
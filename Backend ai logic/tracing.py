@@ -0,0 +1,484 @@
+"""Lightweight per-request tracing.
+
+A trace is a tree of timed spans: the Django request (myapp.middleware), a
+job-queue job or a CLI run is the root, and prompt construction, each
+Gemini call, rate limit waits and retries, JSON parsing, serialization and
+MongoDB reads and writes are spans under it. The current span lives in a
+context variable, so it follows asyncio tasks and asyncio.to_thread, and
+spans started outside any trace cost a context variable lookup.
+
+Spans use OpenTelemetry's field names (trace_id, span_id, parent_span_id,
+start/end_time_unix_nano, attributes, status). When a root span ends its
+whole trace goes to the exporter chosen by TRACE_EXPORTER:
+
+    memory  keep the last TRACE_MEMORY_LIMIT traces in process (default)
+    file    append one JSON line per trace to TRACE_FILE, from a writer thread
+    none    don't record anything
+
+TRACE_SAMPLE_RATE keeps a fraction of traces and TRACE_MIN_DURATION_MS
+drops fast ones. To see where the slow requests spent their time:
+
+    python tracing.py report traces.jsonl --top 10
+"""
+import argparse
+import atexit
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import statistics
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation; use it as a context manager or call end()."""
+
+    __slots__ = ("trace", "name", "span_id", "parent_span_id", "attributes", "start", "end_time", "status",
+                 "message", "_previous")
+
+    def __init__(self, trace, name, parent_span_id=None, attributes=None, start=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent_span_id
+        self.attributes = dict(attributes or {})
+        self.start = start or time.time_ns()
+        self.end_time = None
+        self.status = "UNSET"
+        self.message = None
+        self._previous = None
+
+    @property
+    def trace_id(self):
+        return self.trace.trace_id
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_error(self, error):
+        self.status = "ERROR"
+        self.message = f"{type(error).__name__}: {error}"
+
+    def end(self, end=None):
+        if self.end_time is not None:
+            return
+        self.end_time = end or time.time_ns()
+        if self.status == "UNSET":
+            self.status = "OK"
+        self.trace.finished(self)
+
+    def __enter__(self):
+        self._previous = _current.get()
+        _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        # Restores rather than resets, so a span entered in one context copy and
+        # left in another (e.g. a sync generator under ASGI) can't raise here
+        _current.set(self._previous)
+        if exc is not None and isinstance(exc, Exception):
+            self.record_error(exc)
+        self.end()
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "start_time_unix_nano": self.start,
+            "end_time_unix_nano": self.end_time,
+            "duration_ms": round((self.end_time - self.start) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": {"code": self.status, "message": self.message},
+        }
+
+
+class _NoSpan:
+    """Stands in for a span outside any (sampled) trace."""
+
+    __slots__ = ()
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+    def record_error(self, error):
+        pass
+
+    def end(self, end=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+class Trace:
+    """The spans of one request; exported together when the root span ends."""
+
+    def __init__(self, exporter, trace_id=None):
+        self.exporter = exporter
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.root = None
+        self.spans = []
+        self.exported = False
+
+    def finished(self, span):
+        if self.exported:
+            return  # e.g. a task cancelled after its request finished
+        self.spans.append(span)
+        if span is self.root:
+            self.exported = True
+            self.exporter.export(self)
+
+    def as_dict(self):
+        root = self.root
+        return {
+            "trace_id": self.trace_id,
+            "name": root.name,
+            "start_time_unix_nano": root.start,
+            "duration_ms": round((root.end_time - root.start) / 1e6, 3),
+            "attributes": root.attributes,
+            "spans": [span.as_dict() for span in sorted(self.spans, key=lambda span: span.start)],
+        }
+
+
+# --- exporters ---------------------------------------------------------------
+
+class MemoryExporter:
+    """Keeps the most recent traces in process, e.g. for tests or a debug view."""
+
+    def __init__(self, limit=200, min_duration_ms=0.0):
+        self.min_duration_ms = min_duration_ms
+        self._traces = deque(maxlen=limit)
+
+    def export(self, trace):
+        if (trace.root.end_time - trace.root.start) / 1e6 >= self.min_duration_ms:
+            self._traces.append(trace.as_dict())
+
+    def traces(self):
+        return list(self._traces)
+
+    def slowest(self, count=10):
+        return sorted(self._traces, key=lambda trace: trace["duration_ms"], reverse=True)[:count]
+
+    def clear(self):
+        self._traces.clear()
+
+
+class FileExporter:
+    """Appends one JSON line per trace to a file; a writer thread does the disk I/O."""
+
+    def __init__(self, path, min_duration_ms=0.0, max_pending=10000):
+        self.path = path
+        self.min_duration_ms = min_duration_ms
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _start(self):
+        # Started lazily so a forked worker gets a thread of its own
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._write, name="trace-writer", daemon=True)
+                self._thread.start()
+
+    def export(self, trace):
+        if (trace.root.end_time - trace.root.start) / 1e6 < self.min_duration_ms:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._start()
+        try:
+            self._queue.put_nowait(trace.as_dict())
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            lines = [item]
+            while len(lines) < 100:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._append(lines)
+                    return
+                lines.append(item)
+            self._append(lines)
+
+    def _append(self, traces):
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(trace, default=str) + "\n" for trace in traces)
+        except OSError as e:
+            logger.warning("Could not write %s traces to %s: %s", len(traces), self.path, e)
+
+    def close(self):
+        """Writes out every queued trace."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+
+class NoopExporter:
+    def export(self, trace):
+        pass
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def exporter_from_env():
+    kind = os.getenv("TRACE_EXPORTER", "memory").strip().lower()
+    min_duration_ms = float(os.getenv("TRACE_MIN_DURATION_MS", "0"))
+    if kind == "file":
+        return FileExporter(os.getenv("TRACE_FILE", "traces.jsonl"), min_duration_ms)
+    if kind == "memory":
+        return MemoryExporter(int(os.getenv("TRACE_MEMORY_LIMIT", "200")), min_duration_ms)
+    if kind not in ("none", "off", ""):
+        logger.warning("Unknown TRACE_EXPORTER %r, tracing is off", kind)
+    return NoopExporter()
+
+
+def get_exporter():
+    """Returns the process-wide exporter, creating it from TRACE_* on first use."""
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = exporter_from_env()
+    return _exporter
+
+
+def set_exporter(exporter):
+    """Replaces the exporter, e.g. with a MemoryExporter in tests; returns the old one."""
+    global _exporter
+    with _exporter_lock:
+        previous, _exporter = _exporter, exporter
+    return previous
+
+
+# --- creating spans ----------------------------------------------------------
+
+def current():
+    """The active span, or NO_SPAN outside a trace."""
+    return _current.get() or NO_SPAN
+
+
+def start_trace(name, trace_id=None, parent_span_id=None, **attributes):
+    """Starts a root span (sampled by TRACE_SAMPLE_RATE); enter it or end() it to export the trace.
+
+    trace_id and parent_span_id continue a trace begun by a caller, e.g. from
+    a W3C traceparent header.
+    """
+    exporter = get_exporter()
+    if isinstance(exporter, NoopExporter):
+        return NO_SPAN
+    rate = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+    if rate < 1 and random.random() >= rate:
+        return NO_SPAN
+    trace = Trace(exporter, trace_id)
+    trace.root = Span(trace, name, parent_span_id, attributes)
+    return trace.root
+
+
+def span(name, **attributes):
+    """A child of the current span, or NO_SPAN outside a trace. Use it in a with block."""
+    parent = _current.get()
+    if parent is None:
+        return NO_SPAN
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+
+def record(name, start, end, **attributes):
+    """Adds an already finished child span, e.g. time spent waiting that was measured anyway."""
+    parent = _current.get()
+    if parent is not None:
+        Span(parent.trace, name, parent.span_id, attributes, start=start).end(end)
+
+
+@contextlib.contextmanager
+def activate(span):
+    """Makes `span` current inside the block without ending it afterwards.
+
+    For spans that stay open across yields: a generator must not leave its
+    span current while suspended, so it activates it around each step.
+    """
+    previous = _current.get()
+    if span is not NO_SPAN:
+        _current.set(span)
+    try:
+        yield span
+    finally:
+        _current.set(previous)
+
+
+def traced(name, root=False):
+    """Decorator: runs the function in a span (a new trace if root=True and none is active)."""
+    def decorator(function):
+        def open_span():
+            if root and _current.get() is None:
+                return start_trace(name, function=function.__qualname__)
+            return span(name, function=function.__qualname__)
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                with open_span():
+                    return await function(*args, **kwargs)
+        else:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with open_span():
+                    return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def iter_in_span(iterable, span):
+    """Iterates `iterable` with `span` current during each step, ending the span when done."""
+    return iterable if span is NO_SPAN else _iter_in_span(iterable, span)
+
+
+def aiter_in_span(iterable, span):
+    """Async variant of iter_in_span."""
+    return iterable if span is NO_SPAN else _aiter_in_span(iterable, span)
+
+
+def _iter_in_span(iterable, span):
+    iterator = iter(iterable)
+    try:
+        while True:
+            with activate(span):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                except Exception as e:
+                    span.record_error(e)
+                    raise
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+        span.end()
+
+
+async def _aiter_in_span(iterable, span):
+    iterator = iterable.__aiter__()
+    try:
+        while True:
+            with activate(span):
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                except Exception as e:
+                    span.record_error(e)
+                    raise
+            yield item
+    finally:
+        close = getattr(iterator, "aclose", None)
+        if close is not None:
+            await close()
+        span.end()
+
+
+# --- offline report ----------------------------------------------------------
+
+def self_times(trace):
+    """{span_id: ms spent in the span itself, not in its children}."""
+    children = {}
+    for entry in trace["spans"]:
+        children.setdefault(entry["parent_span_id"], []).append(entry)
+    return {
+        entry["span_id"]: max(0.0, entry["duration_ms"] - sum(
+            child["duration_ms"] for child in children.get(entry["span_id"], ())))
+        for entry in trace["spans"]
+    }
+
+
+def slowest_stage(trace):
+    """The span that accounts for the most of the trace's time on its own."""
+    times = self_times(trace)
+    entry = max(trace["spans"], key=lambda entry: times[entry["span_id"]])
+    return entry, times[entry["span_id"]]
+
+
+def read_traces(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line torn by a crash
+
+
+def report(traces, top=10):
+    """Prints the slowest traces with their slowest stage, then time per stage across all traces."""
+    traces = list(traces)
+    if not traces:
+        print("No traces.")
+        return
+    print(f"{'ms':>10}  {'trace':<40} slowest stage")
+    for trace in sorted(traces, key=lambda trace: trace["duration_ms"], reverse=True)[:top]:
+        entry, ms = slowest_stage(trace)
+        print(f"{trace['duration_ms']:>10.1f}  {trace['name'][:40]:<40} {entry['name']} "
+              f"({ms:.1f}ms, {ms / max(trace['duration_ms'], 1e-9):.0%})  {trace['trace_id']}")
+
+    by_stage = {}
+    for trace in traces:
+        times = self_times(trace)
+        for entry in trace["spans"]:
+            by_stage.setdefault(entry["name"], []).append(times[entry["span_id"]])
+    total = sum(sum(values) for values in by_stage.values()) or 1e-9
+    print(f"\n{'stage':<40} {'count':>7} {'p50 ms':>10} {'max ms':>10} {'share':>7}")
+    for name, values in sorted(by_stage.items(), key=lambda item: sum(item[1]), reverse=True):
+        print(f"{name[:40]:<40} {len(values):>7} {statistics.median(values):>10.1f} "
+              f"{max(values):>10.1f} {sum(values) / total:>7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise traces written by TRACE_EXPORTER=file.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    report_parser = subcommands.add_parser("report", help="show the slowest traces and stages")
+    report_parser.add_argument("path", nargs="?", default=os.getenv("TRACE_FILE", "traces.jsonl"))
+    report_parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    report(read_traces(args.path), top=args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""Queued, rotated and sampled logging for the Django app and the AI modules.
+
+QueueListenerHandler is the only handler the loggers see: it copies each
+record onto an in-memory queue and returns, and one listener thread formats
+the records and writes them to a rotating log file (and the console). A
+request thread therefore never waits on disk I/O, and when the queue is full
+records are dropped and counted instead of blocking.
+
+ContextFilter stamps every record with the request and user IDs bound by
+myapp.middleware.RequestContextMiddleware, and JsonFormatter writes one JSON
+object per line. SamplingFilter keeps only a fraction of DEBUG records from
+chatty loggers such as django.db.backends; warnings and errors are never
+sampled.
+
+logging_config() builds the dictConfig both Django's LOGGING setting and
+the job queue worker start from; configure() applies it outside Django.
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.config
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import weakref
+
+request_id = contextvars.ContextVar("request_id", default=None)
+user_id = contextvars.ContextVar("user_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed with extra=
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "user_id"}
+
+CONSOLE_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+
+
+def bind_context(request=None, user=None):
+    """Sets the IDs attached to records logged from this context; returns tokens for reset_context()."""
+    return request_id.set(request), user_id.set(user)
+
+
+def reset_context(tokens):
+    request_token, user_token = tokens
+    request_id.reset(request_token)
+    user_id.reset(user_token)
+
+
+def parse_spec(text, convert=str):
+    """Parses "name=value,name=value" (e.g. LOG_LEVELS) into a dict."""
+    spec = {}
+    for item in (text or "").split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            spec[name.strip()] = convert(value.strip())
+    return spec
+
+
+class ContextFilter(logging.Filter):
+    """Adds request_id and user_id to every record."""
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            # django.request logs after the middleware has returned, but passes the request
+            record.request_id = request_id.get() or getattr(getattr(record, "request", None), "request_id", None)
+        if not hasattr(record, "user_id"):
+            record.user_id = user_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of DEBUG records; `rates` overrides `rate` per logger name prefix."""
+
+    def __init__(self, rate=1.0, rates=None):
+        super().__init__()
+        self.rate = float(rate)
+        self.rates = {name: float(value) for name, value in (rates or {}).items()}
+        self.dropped = 0
+        self._resolved = {}
+
+    def rate_for(self, name):
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = self.rate
+            # The most specific configured logger wins, as with logger levels
+            for prefix in sorted(self.rates, key=len, reverse=True):
+                if name == prefix or name.startswith(prefix + "."):
+                    rate = self.rates[prefix]
+                    break
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = self.rate_for(record.name)
+        if rate >= 1 or random.random() < rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including request/user IDs and any extra= fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "user_id": getattr(record, "user_id", None),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, default=str)
+
+
+class QueueListenerHandler(logging.handlers.QueueHandler):
+    """QueueHandler that owns its QueueListener and the file/console handlers behind it.
+
+    Meant to be named as a handler factory ("()") in Django's LOGGING setting
+    (as "class", Python 3.12+ would wire up a listener of its own); every key
+    besides level/filters/formatter is passed to __init__.
+    rotation is "size" (max_bytes per file) or "time" (a new file every
+    `when`, as in TimedRotatingFileHandler); backup_count old files are kept.
+    """
+
+    def __init__(self, filename=None, rotation="size", max_bytes=10 * 1024 * 1024, backup_count=5,
+                 when="midnight", console=True, json_format=True, queue_size=10000):
+        self.queue_size = queue_size
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.dropped = 0
+        self._unreported = 0
+        self.targets = []
+        if filename:
+            os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+            if rotation == "time":
+                target = logging.handlers.TimedRotatingFileHandler(
+                    filename, when=when, backupCount=backup_count, encoding="utf-8", delay=True, utc=True)
+            elif rotation == "size":
+                target = logging.handlers.RotatingFileHandler(
+                    filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+            else:
+                raise ValueError(f"rotation must be 'size' or 'time', not {rotation!r}")
+            target.setFormatter(JsonFormatter() if json_format else logging.Formatter(CONSOLE_FORMAT))
+            self.targets.append(target)
+        if console:
+            target = logging.StreamHandler(sys.stderr)
+            target.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+            self.targets.append(target)
+        self._exceptions = logging.Formatter()
+        self._drop_lock = threading.Lock()
+        self.listener = None
+        self._start()
+        atexit.register(self.close)
+        # The listener thread doesn't survive a fork (e.g. a preloading server)
+        handler = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: handler() is not None and handler()._restart_after_fork())
+
+    def _start(self):
+        self.listener = logging.handlers.QueueListener(self.queue, *self.targets, respect_handler_level=True)
+        self.listener.start()
+
+    def _restart_after_fork(self):
+        if self.listener is not None:
+            self.queue = queue.Queue(maxsize=self.queue_size)
+            self._drop_lock = threading.Lock()
+            self._start()
+
+    def prepare(self, record):
+        # Unlike the base class, leave the formatting to the listener's handlers,
+        # but merge args and render the traceback now, while they are still valid
+        record = copy.copy(record)
+        # CONSOLE_FORMAT needs these even if ContextFilter isn't installed
+        record.__dict__.setdefault("request_id", None)
+        record.__dict__.setdefault("user_id", None)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or self._exceptions.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._drop_lock:
+                self.dropped += 1
+                self._unreported += 1
+            return
+        if self._unreported:
+            with self._drop_lock:
+                count, self._unreported = self._unreported, 0
+            if count:
+                self.enqueue(logging.makeLogRecord({
+                    "name": __name__, "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": "Log queue was full, dropped %s records", "args": (count,),
+                    "request_id": None, "user_id": None,
+                }))
+
+    def close(self):
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            # Writes out everything still queued before the handlers close
+            listener.stop()
+            for target in self.targets:
+                target.close()
+        super().close()
+
+
+def logging_config(filename, level=None):
+    """dictConfig sending every record through one QueueListenerHandler to `filename` and the console.
+
+    The LOG_* environment variables choose the level, rotation, DEBUG
+    sampling and per-logger levels (LOG_LEVELS, LOG_SAMPLE_RATES take
+    "logger=value,logger=value").
+    """
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    return {
+        "version": 1,
+        "disable_existing_loggers": False,
+        "filters": {
+            "context": {"()": "app_logging.ContextFilter"},
+            "sampling": {
+                "()": "app_logging.SamplingFilter",
+                "rate": float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0")),
+                "rates": {
+                    "django.db.backends": 0.01,
+                    **parse_spec(os.getenv("LOG_SAMPLE_RATES"), float),
+                },
+            },
+        },
+        "handlers": {
+            "queue": {
+                "()": "app_logging.QueueListenerHandler",
+                "filters": ["context", "sampling"],
+                "filename": str(filename),
+                "rotation": os.getenv("LOG_ROTATION", "size"),
+                "max_bytes": int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+                "backup_count": int(os.getenv("LOG_BACKUP_COUNT", "5")),
+                "when": os.getenv("LOG_ROTATION_WHEN", "midnight"),
+            },
+        },
+        "root": {"handlers": ["queue"], "level": level},
+        "loggers": {name: {"level": value.upper()} for name, value in parse_spec(os.getenv("LOG_LEVELS")).items()},
+    }
+
+
+def configure(filename, level=None):
+    """Sets up logging_config() for a process that doesn't run Django, such as a job queue worker."""
+    logging.config.dictConfig(logging_config(filename, level))
@@ -0,0 +1,282 @@
+"""Local stand-ins for Gemini, MongoDB and the LinkedIn API used by the benchmarks."""
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from . import payloads
+
+
+class LatencyDistribution:
+    """Samples simulated call latency in seconds.
+
+    Specs are "constant:MS", "uniform:LOW_MS,HIGH_MS" or "lognormal:MEDIAN_MS,SIGMA".
+    """
+
+    def __init__(self, spec="lognormal:50,0.5", seed=None):
+        self.spec = spec
+        kind, _, args = spec.partition(":")
+        self.kind = kind
+        self.args = [float(a) for a in args.split(",") if a]
+        self.random = random.Random(seed)
+        if kind not in ("constant", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution {spec!r}")
+
+    def sample(self):
+        if self.kind == "constant":
+            ms = self.args[0]
+        elif self.kind == "uniform":
+            ms = self.random.uniform(self.args[0], self.args[1])
+        else:
+            median, sigma = self.args
+            ms = median * self.random.lognormvariate(0, sigma)
+        return ms / 1000.0
+
+
+class _Usage:
+    def __init__(self, prompt, text):
+        self.prompt_token_count = max(1, len(prompt) // 4)
+        self.candidates_token_count = max(1, len(text) // 4)
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+
+class FakeResponse:
+    def __init__(self, text, usage=None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class FakeTokenCount:
+    def __init__(self, total_tokens):
+        self.total_tokens = total_tokens
+
+
+class FakeModel:
+    """Mimics genai.GenerativeModel with canned payloads and simulated latency.
+
+    Streaming responses are split into `chunk_size` character chunks, with
+    `time_to_first_chunk` of the total latency spent before the first one.
+    """
+
+    def __init__(self, model_name="models/gemini-2.0-flash", latency=None, chunk_size=64,
+                 time_to_first_chunk=0.1, responder=payloads.response_for):
+        self.model_name = model_name
+        self.latency = latency or LatencyDistribution()
+        self.chunk_size = chunk_size
+        self.time_to_first_chunk = time_to_first_chunk
+        self.responder = responder
+        self.calls = 0
+
+    def _chunks(self, text):
+        return [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        text = self.responder(prompt)
+        delay = self.latency.sample()
+        if not stream:
+            time.sleep(delay)
+            return FakeResponse(text, _Usage(prompt, text))
+
+        def chunks():
+            parts = self._chunks(text)
+            time.sleep(delay * self.time_to_first_chunk)
+            step = delay * (1 - self.time_to_first_chunk) / len(parts)
+            for i, part in enumerate(parts):
+                if i:
+                    time.sleep(step)
+                yield FakeResponse(part, _Usage(prompt, text) if i == len(parts) - 1 else None)
+
+        return chunks()
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        text = self.responder(prompt)
+        delay = self.latency.sample()
+        if not stream:
+            await asyncio.sleep(delay)
+            return FakeResponse(text, _Usage(prompt, text))
+
+        async def chunks():
+            parts = self._chunks(text)
+            await asyncio.sleep(delay * self.time_to_first_chunk)
+            step = delay * (1 - self.time_to_first_chunk) / len(parts)
+            for i, part in enumerate(parts):
+                if i:
+                    await asyncio.sleep(step)
+                yield FakeResponse(part, _Usage(prompt, text) if i == len(parts) - 1 else None)
+
+        return chunks()
+
+    def count_tokens(self, contents, **kwargs):
+        text = contents if isinstance(contents, str) else str(contents)
+        return FakeTokenCount(max(1, len(text) // 4))
+
+
+def use_mongomock():
+    """Points db_helpers at an in-memory mongomock client."""
+    import mongomock
+
+    import db_helpers
+
+    db_helpers.close_client()
+    db_helpers.MongoClient = mongomock.MongoClient
+    return db_helpers
+
+
+class _LinkedInHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so the client's connection pooling shows in `connections`
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.fake.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None, headers=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _injected_failure(self):
+        fake = self.server.fake
+        fake.count("requests")
+        if fake.latency is not None:
+            time.sleep(fake.latency.sample())
+        with fake.lock:
+            if fake.failures:
+                fake.failures -= 1
+                return fake.failure_status
+        return None
+
+    def do_POST(self):
+        fake = self.server.fake
+        form = {name: values[0] for name, values in parse_qs(
+            self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")).items()}
+        status = self._injected_failure()
+        if status:
+            return self._send(status, {"error": "temporarily_unavailable"})
+        if self.path != "/oauth/v2/accessToken":
+            return self._send(404, {"error": "not_found"})
+        self._send(*fake.token(form))
+
+    def do_GET(self):
+        fake = self.server.fake
+        status = self._injected_failure()
+        if status:
+            return self._send(status, {"message": "Service unavailable"})
+        if self.path != "/v2/me":
+            return self._send(404, {"message": "Not found"})
+        token = self.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not fake.valid(token):
+            return self._send(401, {"message": "Invalid access token"})
+        etag = fake.etag()
+        if self.headers.get("If-None-Match") == etag:
+            fake.count("not_modified")
+            return self._send(304, headers={"ETag": etag})
+        self._send(200, fake.profile, {"ETag": etag})
+
+
+class FakeLinkedIn:
+    """A local HTTP server with LinkedIn's token endpoint and /v2/me.
+
+    Authorization codes can be redeemed once, tokens expire after
+    `expires_in` seconds, and /v2/me answers If-None-Match with 304. fail(n)
+    makes the next n requests return `status`, to exercise retries. `stats`
+    counts requests, TCP connections, token grants and 304s.
+    """
+
+    def __init__(self, expires_in=5184000, refresh_expires_in=31536000, latency=None, profile=None):
+        self.expires_in = expires_in
+        self.refresh_expires_in = refresh_expires_in
+        self.latency = latency
+        self.profile = profile or {
+            "id": "benchmark", "localizedFirstName": "Ada", "localizedLastName": "Lovelace",
+            "localizedHeadline": "Data Engineer at Acme",
+        }
+        self.stats = {"requests": 0, "connections": 0, "grants": 0, "not_modified": 0}
+        self.failures = 0
+        self.failure_status = 503
+        self.lock = threading.Lock()
+        self._redeemed = set()
+        self._tokens = {}
+        self._refresh_tokens = set()
+        self._server = None
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _LinkedInHandler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        threading.Thread(target=self._server.serve_forever, name="fake-linkedin", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def oauth_url(self):
+        return f"{self.url}/oauth/v2"
+
+    @property
+    def api_url(self):
+        return f"{self.url}/v2"
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def fail(self, count, status=503):
+        with self.lock:
+            self.failures, self.failure_status = count, status
+
+    def etag(self):
+        return '"' + hashlib.sha256(json.dumps(self.profile, sort_keys=True).encode("utf-8")).hexdigest()[:16] + '"'
+
+    def valid(self, token):
+        with self.lock:
+            expires_at = self._tokens.get(token)
+        return expires_at is not None and expires_at > time.time()
+
+    def token(self, form):
+        """Returns (status, body) for a token request."""
+        with self.lock:
+            if form.get("grant_type") == "authorization_code":
+                code = form.get("code")
+                if not code or code in self._redeemed:
+                    return 400, {"error": "invalid_grant", "error_description": "Authorization code was redeemed"}
+                self._redeemed.add(code)
+            elif form.get("grant_type") == "refresh_token":
+                if form.get("refresh_token") not in self._refresh_tokens:
+                    return 400, {"error": "invalid_grant", "error_description": "Unknown refresh token"}
+            else:
+                return 400, {"error": "unsupported_grant_type"}
+            self.stats["grants"] += 1
+            access_token = f"access-{self.stats['grants']}-{random.getrandbits(32):08x}"
+            refresh_token = f"refresh-{self.stats['grants']}-{random.getrandbits(32):08x}"
+            self._tokens[access_token] = time.time() + self.expires_in
+            self._refresh_tokens.add(refresh_token)
+        return 200, {
+            "access_token": access_token, "expires_in": self.expires_in,
+            "refresh_token": refresh_token, "refresh_token_expires_in": self.refresh_expires_in,
+            "scope": "r_liteprofile,r_emailaddress",
+        }
@@ -0,0 +1,92 @@
+"""Cold import time of each entry point, checked against a budget.
+
+Each module is imported in a fresh interpreter with ``-X importtime`` and
+the cumulative time of its own top-level import is taken (interpreter
+startup and site packages are excluded). The best of --repeats runs is
+compared with IMPORT_BUDGETS_MS:
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --top 5    # also list the slowest imports
+
+benchmarks.run runs the same check after the scenarios.
+"""
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+AI_LOGIC_DIR = Path(__file__).resolve().parent.parent / "Backend ai logic"
+
+# Importing an entry point must not load the Gemini SDK, read credentials or
+# open databases; these budgets leave room for the stdlib and our own modules.
+IMPORT_BUDGETS_MS = {
+    "model": 150,
+    "questionnare": 150,
+    "skills": 150,
+    "projects": 150,
+    "batch_runner": 150,
+    "job_queue": 150,
+    "course_catalog": 100,
+}
+
+
+def profile_import(module):
+    """Returns ({imported module: cumulative ms}, cumulative ms of `module`) from one cold import."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=AI_LOGIC_DIR, capture_output=True, text=True, check=True,
+    )
+    timings = {}
+    total = None
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # the header line
+        ms = int(cumulative) / 1000
+        if name.strip() == "site":
+            timings = {}  # everything so far was interpreter startup
+            continue
+        timings[name.strip()] = max(ms, timings.get(name.strip(), 0.0))
+        if name.strip() == module and name.startswith(" ") and not name.startswith("  "):
+            total = ms
+    return timings, total
+
+
+def check(budgets=IMPORT_BUDGETS_MS, repeats=3, top=0):
+    """Profiles every entry point; returns (results, list of budget overruns)."""
+    results = {}
+    overruns = []
+    for module, budget in budgets.items():
+        best, best_timings = None, {}
+        for _ in range(repeats):
+            timings, total = profile_import(module)
+            if total is not None and (best is None or total < best):
+                best, best_timings = total, timings
+        results[module] = {"import_ms": round(best, 2), "budget_ms": budget}
+        status = "ok" if best <= budget else "OVER BUDGET"
+        print(f"import {module:<40} {best:>8.2f}ms  budget {budget}ms  {status}")
+        if top:
+            slowest = sorted(
+                ((ms, name) for name, ms in best_timings.items() if name != module), reverse=True
+            )[:top]
+            for ms, name in slowest:
+                print(f"    {name:<44} {ms:>8.2f}ms")
+        if best > budget:
+            overruns.append(f"import {module}: {best:.2f}ms vs budget {budget}ms")
+    return results, overruns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=3, help="cold imports per module; the best is kept")
+    parser.add_argument("--top", type=int, default=0, help="list the N slowest nested imports")
+    args = parser.parse_args()
+    _, overruns = check(repeats=args.repeats, top=args.top)
+    if overruns:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
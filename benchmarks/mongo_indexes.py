@@ -0,0 +1,82 @@
+"""Checks with explain() that every db_helpers query is served by an index.
+
+Run from the repository root against a real server (mongomock has no query
+planner):
+
+    python -m benchmarks.mongo_indexes --uri mongodb://localhost:27017
+
+Creates the indexes in db_helpers.INDEXES, then explains each read and
+upsert db_helpers issues and fails if any winning plan contains a
+collection scan instead of an IXSCAN.
+"""
+import argparse
+import os
+import sys
+
+import db_helpers
+
+
+def _stages(plan):
+    """Every stage name in a (possibly nested) explain plan."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _stages(item)
+
+
+def queries(user_id="explain-user"):
+    """(label, collection, explain command) for each query shape db_helpers sends."""
+    commands = []
+    for collection in db_helpers.INDEXES:
+        commands.append((f"{collection}.find_one", collection, {
+            "find": collection, "filter": {"user_id": user_id}, "limit": 1,
+        }))
+        commands.append((f"{collection}.find_one projected", collection, {
+            "find": collection, "filter": {"user_id": user_id}, "limit": 1,
+            "projection": {"_id": 0, "user_id": 1},
+        }))
+        commands.append((f"{collection}.upsert", collection, {
+            "update": collection,
+            "updates": [{"q": {"user_id": user_id}, "u": {"$set": {"explained": True}}, "upsert": True}],
+        }))
+    return commands
+
+
+def check(db):
+    """Returns (label, stages) for every query whose plan doesn't use an index."""
+    failures = []
+    for label, _, command in queries():
+        explained = db.command("explain", command, verbosity="queryPlanner")
+        stages = list(_stages(explained["queryPlanner"]["winningPlan"]))
+        ok = "IXSCAN" in stages or "IDHACK" in stages
+        print(f"{label:<40} {'IXSCAN' if ok else 'NO INDEX':<9} {' > '.join(stages)}")
+        if not ok or "COLLSCAN" in stages:
+            failures.append((label, stages))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uri", help="MongoDB URI (defaults to MONGODB_URI)")
+    args = parser.parse_args()
+
+    if args.uri:
+        os.environ["MONGODB_URI"] = args.uri
+    db_helpers.close_client()
+    db = db_helpers.get_client().career_navigator
+    missing = db_helpers.ensure_indexes(db)
+    if missing:
+        print(f"Missing indexes: {', '.join(missing)}")
+    failures = check(db)
+    db_helpers.close_client()
+    if missing or failures:
+        sys.exit(1)
+    print("Every query uses an index.")
+
+
+if __name__ == "__main__":
+    main()
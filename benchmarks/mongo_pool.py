@@ -0,0 +1,81 @@
+"""Per-operation latency of db_helpers with a fresh MongoClient per call vs the pooled client.
+
+Run from the repository root:
+
+    python -m benchmarks.mongo_pool --uri mongodb://localhost:27017
+    python -m benchmarks.mongo_pool --mongomock
+
+Without a reachable mongod, --mongomock swaps in an in-memory stand-in. It
+has no network handshake, so the gap it shows is only client construction
+cost; point --uri at a real server to see the full connection setup cost.
+"""
+import argparse
+import os
+import statistics
+import time
+
+import db_helpers
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _unpooled_db():
+    # What get_db_connection() did before the shared client: a new client per call
+    client = db_helpers.MongoClient(os.getenv("MONGODB_URI"))
+    return client.career_navigator
+
+
+def _run(label, iterations):
+    samples = []
+    for i in range(iterations):
+        user_id = f"bench-{i % 50}"
+        start = time.perf_counter()
+        db_helpers.save_user_profile(user_id, {"skills": ["python"], "iteration": i})
+        db_helpers.get_user_profile(user_id)
+        samples.append((time.perf_counter() - start) * 1000 / 2)
+    print(
+        f"{label:<10} ops={iterations * 2:<6} "
+        f"mean={statistics.mean(samples):8.3f}ms "
+        f"p50={_percentile(samples, 50):8.3f}ms "
+        f"p95={_percentile(samples, 95):8.3f}ms"
+    )
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uri", help="MongoDB URI (defaults to MONGODB_URI)")
+    parser.add_argument("--mongomock", action="store_true", help="use mongomock instead of a real server")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.uri:
+        os.environ["MONGODB_URI"] = args.uri
+    # Time each save's round trip rather than the write-behind buffer
+    os.environ["MONGODB_WRITE_BEHIND"] = "0"
+    if args.mongomock:
+        import mongomock
+        db_helpers.MongoClient = mongomock.MongoClient
+
+    db_helpers.close_client()
+    pooled_get_db = db_helpers.get_db_connection
+
+    db_helpers.get_db_connection = _unpooled_db
+    try:
+        before = _run("per-call", args.iterations)
+    finally:
+        db_helpers.get_db_connection = pooled_get_db
+
+    after = _run("pooled", args.iterations)
+    db_helpers.close_client()
+
+    speedup = statistics.mean(before) / statistics.mean(after)
+    print(f"pooled client is {speedup:.1f}x faster per operation")
+
+
+if __name__ == "__main__":
+    main()
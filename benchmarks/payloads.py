@@ -0,0 +1,114 @@
+"""Canned Gemini responses for the fake model, one per pipeline."""
+import json
+
+EXTRACTION = {
+    "technical_skills": ["Python", "SQL", "Docker"],
+    "soft_skills": ["Communication", "Teamwork"],
+    "industry_knowledge": ["Fintech"],
+    "skill_details": [
+        {"skill": "Python", "years_of_experience": 3, "proficiency_level": "advanced"},
+        {"skill": "SQL", "years_of_experience": 2, "proficiency_level": "intermediate"},
+    ],
+}
+
+JOB_SUGGESTIONS = "\n".join(
+    f"{i}. **{title}** - A role that builds on your Python and SQL experience in {industry}."
+    for i, (title, industry) in enumerate(
+        [
+            ("Data Engineer", "fintech"),
+            ("Backend Developer", "payments"),
+            ("Analytics Engineer", "banking"),
+            ("Machine Learning Engineer", "risk"),
+        ],
+        1,
+    )
+)
+
+LEARNING_PATH = "\n\n".join(
+    f"## Phase {i}: {phase}\n" + "\n".join(f"- Step {j}: practise {phase.lower()} with a small project." for j in range(1, 6))
+    for i, phase in enumerate(["Foundations", "Data Modelling", "Pipelines", "Cloud", "Portfolio"], 1)
+)
+
+COURSE = {
+    "title": "Machine Learning Specialization",
+    "platform": "Coursera",
+    "description": "Supervised and unsupervised learning with hands-on labs.",
+    "duration_weeks": 8,
+    "skill_level": "intermediate",
+    "includes_projects": True,
+    "certification": True,
+    "key_topics": ["regression", "classification", "clustering"],
+}
+
+QUESTIONNAIRE = {
+    "needs_analysis": "The learner wants a practical, career-oriented path into machine learning.",
+    "recommended_courses": [dict(COURSE, title=f"{COURSE['title']} {i}") for i in range(1, 5)],
+    "learning_schedule": {
+        "weekly_breakdown": [
+            {"week": w, "focus": f"Module {w}", "hours_required": 6, "goals": ["Finish lectures", "Complete lab"]}
+            for w in range(1, 9)
+        ],
+        "total_hours_weekly": 6,
+    },
+    "additional_resources": [{"type": "Book", "name": "Hands-On Machine Learning", "url": ""}],
+    "next_steps": ["Build a portfolio project", "Join a Kaggle competition"],
+}
+
+SKILLS = {
+    "assessment": "Solid programming background with gaps in statistics and MLOps.",
+    "skill_gaps": ["Statistics", "Model deployment", "Experiment tracking"],
+    "learning_path": [
+        {
+            "level": level,
+            "courses": [
+                {
+                    "title": f"{level.title()} course {i}",
+                    "platform": "edX",
+                    "description": "Focused course covering one skill gap.",
+                    "estimated_duration": "4 weeks",
+                    "key_topics": ["statistics", "deployment"],
+                }
+                for i in range(1, 4)
+            ],
+        }
+        for level in ("beginner", "intermediate", "advanced")
+    ],
+    "estimated_timeline": "6 months",
+    "recommended_platforms": ["Coursera", "edX", "Udemy"],
+    "next_steps": ["Start with the beginner statistics course"],
+}
+
+PROJECTS = {
+    "recommended_projects": [
+        {
+            "title": f"Portfolio project {i}",
+            "description": "An end-to-end project that applies the completed courses.",
+            "skills_demonstrated": ["Python", "APIs", "Testing"],
+            "estimated_time": "3 weeks",
+            "difficulty": "intermediate",
+            "key_features": ["REST API", "Dashboard", "CI pipeline"],
+            "portfolio_value": "Shows the full lifecycle of a production service.",
+            "resources_needed": ["Python", "PostgreSQL", "Docker"],
+            "learning_outcomes": ["Service design", "Deployment"],
+        }
+        for i in range(1, 5)
+    ],
+    "learning_progression": "Each project builds on the previous one.",
+    "project_selection_tips": ["Pick projects close to your target job"],
+    "additional_resources": ["The Twelve-Factor App"],
+}
+
+
+def response_for(prompt):
+    """Picks the canned response that matches the pipeline a prompt belongs to."""
+    if "needs_analysis" in prompt:
+        return json.dumps(QUESTIONNAIRE)
+    if "skill_gaps" in prompt:
+        return json.dumps(SKILLS)
+    if "recommended_projects" in prompt:
+        return json.dumps(PROJECTS)
+    if "Extract technical skills" in prompt:
+        return json.dumps(EXTRACTION)
+    if "target industry" in prompt.lower():
+        return JOB_SUGGESTIONS
+    return LEARNING_PATH
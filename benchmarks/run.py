@@ -0,0 +1,336 @@
+"""End-to-end benchmarks for the recommendation pipelines, db_helpers, the LinkedIn client and the Django views.
+
+Gemini is replaced by benchmarks.fakes.FakeModel, MongoDB by mongomock and
+LinkedIn by a local benchmarks.fakes.FakeLinkedIn server, so the numbers
+measure our own overhead plus a simulated model latency:
+
+    python -m benchmarks.run --latency lognormal:50,0.5 --iterations 100 --concurrency 8
+    python -m benchmarks.run --update-baseline        # record benchmarks/baseline.json
+    python -m benchmarks.run --output results.json    # compare against the baseline
+
+The run exits with status 1 if any scenario's p95 latency or throughput is
+worse than the baseline by more than --tolerance, or if an entry point's
+cold import time exceeds its budget in benchmarks.import_time.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import secrets
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+AI_LOGIC_DIR = REPO_ROOT / "Backend ai logic"
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+
+def _prepare_environment():
+    # Keep the benchmark away from real credentials, quotas and the shared cache
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    os.environ.setdefault("LINKEDIN_CLIENT_ID", "benchmark")
+    os.environ.setdefault("LINKEDIN_CLIENT_SECRET", "benchmark")
+    cache_dir = tempfile.mkdtemp(prefix="bench-cache-")
+    os.environ["LLM_CACHE_PATH"] = os.path.join(cache_dir, "llm_cache.sqlite3")
+    os.environ["SEMANTIC_CACHE_PATH"] = os.path.join(cache_dir, "semantic_cache.npz")
+    os.environ["COURSE_CATALOG_PATH"] = os.path.join(cache_dir, "course_catalog.sqlite3")
+    os.environ["LINKEDIN_TOKEN_PATH"] = os.path.join(cache_dir, "linkedin_tokens.sqlite3")
+    for model_name in ("GEMINI_PRO", "GEMINI_2_0_FLASH"):
+        os.environ[f"GEMINI_RPM_{model_name}"] = "1000000"
+        os.environ[f"GEMINI_TPM_{model_name}"] = "1000000000"
+    for path in (str(REPO_ROOT), str(AI_LOGIC_DIR)):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(fn, iterations, concurrency):
+    """Runs fn(i) for each iteration across `concurrency` threads and summarises latency."""
+    latencies = []
+
+    def timed(i):
+        start = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, range(iterations)))
+    wall = time.perf_counter() - started
+    return {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "throughput_ops": round(iterations / wall, 3),
+    }
+
+
+def record_metrics(metrics, count, enabled):
+    """Records `count` token counts and latencies, as every Gemini call does."""
+    # Threads of one scenario all set the same value, so they can't undo each other
+    metrics.set_enabled(enabled)
+    for _ in range(count):
+        metrics.LLM_TOKENS.inc("benchmark", "benchmark", "input", amount=100)
+        metrics.LLM_REQUEST_SECONDS.observe(0.05, "benchmark", "benchmark", "false")
+
+
+def build_scenarios(fake_model, include_views=True):
+    """Returns {name: fn(i)} for every benchmarked operation."""
+    import linkedin_client
+    import metrics
+    import model
+    import projects
+    import questionnare
+    import skill_canon
+    import skills
+
+    from . import fakes, payloads
+
+    for module in (model, questionnare, skills, projects):
+        module.model = fake_model
+    db_helpers = fakes.use_mongomock()
+    linkedin = fakes.FakeLinkedIn().start()
+    os.environ["LINKEDIN_OAUTH_URL"] = linkedin.oauth_url
+    os.environ["LINKEDIN_API_URL"] = linkedin.api_url
+    linkedin_client.close_session()
+    auth_codes = itertools.count()
+
+    profile = {"skills": ["Python", "SQL"], "experience": [{"company": "Acme", "title": "Engineer", "years": "3"}]}
+    extracted = {"technical_skills": ["Python", "SQL"], "soft_skills": ["Communication"]}
+    questionnaire_inputs = {
+        "learning_goal": "machine learning",
+        "learning_level": "intermediate",
+        "expectations": "get a job",
+        "career_pursuit": True,
+        "occupation": "student",
+        "completion_time": 8,
+    }
+    skills_data = {
+        "technical_skills": [{"skill": "Python", "years_experience": 3, "proficiency_level": "advanced"}],
+        "soft_skills": [{"skill": "Communication"}],
+        "industry_knowledge": [{"knowledge_area": "Fintech"}],
+    }
+    spellings = [alias for name, aliases in skill_canon.ALIASES.items() for alias in [name] + aliases]
+    skill_batch = [f"{spellings[i % len(spellings)]}{' ' * (i % 3)}" for i in range(10000)]
+    courses = [{"name": "Python 101", "platform": "Coursera", "skill_level": "beginner", "topics": ["python"]}]
+    metrics_enabled = metrics.enabled()
+
+    # Each iteration varies the prompt so the cache and request coalescing don't hide the work
+    scenarios = {
+        "extract_skills_and_experience": lambda i: model.extract_skills_and_experience(
+            dict(profile, skills=profile["skills"] + [f"Skill {i}"]), bypass_cache=True
+        ),
+        "generate_job_suggestions": lambda i: model.generate_job_suggestions(
+            extracted, f"Fintech {i}", bypass_cache=True
+        ),
+        "generate_learning_path": lambda i: model.generate_learning_path(
+            extracted, f"Data Engineer {i}", bypass_cache=True
+        ),
+        "questionnaire_course_recommendations": lambda i: questionnare.generate_course_recommendations(
+            dict(questionnaire_inputs, expectations=f"get a job {i}"), bypass_cache=True
+        ),
+        "skills_course_recommendations": lambda i: skills.generate_course_recommendations(
+            skills_data, f"Data Science {i}", bypass_cache=True
+        ),
+        "project_recommendations": lambda i: projects.generate_project_recommendations(
+            courses, f"Web Development {i}", "beginner", bypass_cache=True
+        ),
+        "questionnaire_course_recommendations_cached": lambda i: questionnare.generate_course_recommendations(
+            questionnaire_inputs
+        ),
+        "skill_canonicalize_10k": lambda i: (
+            skill_canon.canonicalize.cache_clear(),
+            skill_canon.canonical_names(skill_batch),
+        ),
+        "db_save_and_get_user_profile": lambda i: (
+            db_helpers.save_user_profile(f"user-{i}", {"skills": profile["skills"]}),
+            db_helpers.get_user_profile(f"user-{i}"),
+        ),
+        "db_get_user_profile_repeat": lambda i: db_helpers.get_user_profile(f"user-{i % 20}", ["skills"]),
+        "db_save_career_and_learning_paths": lambda i: (
+            db_helpers.save_career_paths(f"user-{i}", payloads.JOB_SUGGESTIONS),
+            db_helpers.save_learning_path(f"user-{i}", payloads.LEARNING_PATH),
+        ),
+        # Each exchange redeems a fresh code over the pooled session
+        "linkedin_token_exchange": lambda i: model.get_linkedin_access_token(f"benchmark-{next(auth_codes)}"),
+        # A later login: the stored token, and the stored profile revalidated with its ETag
+        "linkedin_repeat_login": lambda i: model.get_linkedin_profile_data(
+            model.cached_linkedin_access_token() or model.get_linkedin_access_token(f"benchmark-{next(auth_codes)}")
+        ),
+        # The no-op run goes first; the next one restores METRICS_ENABLED's setting
+        "metrics_record_10k_noop": lambda i: record_metrics(metrics, 10000, False),
+        "metrics_record_10k": lambda i: record_metrics(metrics, 10000, metrics_enabled),
+    }
+
+    if include_views:
+        scenarios.update(build_view_scenarios(extracted))
+    return scenarios
+
+
+def build_view_scenarios(extracted):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "myproject.settings")
+    import django
+
+    django.setup()
+    from django.test import AsyncClient, Client
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    # The API views need a session or the API token
+    token = os.environ.setdefault("API_TOKEN", secrets.token_urlsafe())
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def post_stream(url, body):
+        # The streaming views return async iterators, which only an AsyncClient reads without buffering
+        async def read():
+            response = await AsyncClient().post(
+                url, data=json.dumps(body), content_type="application/json", headers=headers)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url} returned {response.status_code}")
+            async for _ in response.streaming_content:
+                pass
+
+        asyncio.run(read())
+
+    def post_json(url, body):
+        response = Client(headers=headers).post(url, data=json.dumps(body), content_type="application/json")
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} returned {response.status_code}")
+
+    # Each view gets its own inputs: the views can't bypass the response cache, and a
+    # stream of a prompt another scenario already answered would only measure a cache hit
+    return {
+        "view_learning_path": lambda i: post_json(
+            "/api/learning-path/", {"extracted_data": extracted, "job_choice": f"Data Engineer {i}"}
+        ),
+        "view_stream_job_suggestions": lambda i: post_stream(
+            "/api/stream/job-suggestions/", {"extracted_data": extracted, "target_industry": f"Fintech {i}"}
+        ),
+        "view_stream_learning_path": lambda i: post_stream(
+            "/api/stream/learning-path/", {"extracted_data": extracted, "job_choice": f"ML Engineer {i}"}
+        ),
+    }
+
+
+def compare(results, baseline, tolerance, min_delta_ms=1.0):
+    """Returns a list of human-readable regressions against the baseline.
+
+    Differences smaller than min_delta_ms are treated as noise, so sub-millisecond
+    scenarios don't fail on scheduler jitter.
+    """
+    regressions = []
+    for name, base in baseline.get("scenarios", {}).items():
+        current = results["scenarios"].get(name)
+        if current is None:
+            continue
+        if (current["p95_ms"] > base["p95_ms"] * (1 + tolerance)
+                and current["p95_ms"] - base["p95_ms"] > min_delta_ms):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if (base["p50_ms"] >= min_delta_ms
+                and current["throughput_ops"] < base["throughput_ops"] * (1 - tolerance)):
+            regressions.append(
+                f"{name}: throughput {current['throughput_ops']}/s vs baseline {base['throughput_ops']}/s"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the end-to-end benchmark suite.")
+    parser.add_argument("--latency", default="lognormal:50,0.5", help="fake model latency distribution")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--only", action="append", help="run only the named scenario (repeatable)")
+    parser.add_argument("--skip-views", action="store_true", help="skip the Django view scenarios")
+    parser.add_argument("--skip-import-time", action="store_true", help="skip the import time budget check")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore latency changes below this")
+    args = parser.parse_args()
+
+    _prepare_environment()
+    from .fakes import FakeModel, LatencyDistribution
+
+    fake_model = FakeModel(latency=LatencyDistribution(args.latency, seed=args.seed))
+    scenarios = build_scenarios(fake_model, include_views=not args.skip_views)
+    if args.only:
+        scenarios = {name: fn for name, fn in scenarios.items() if name in args.only}
+
+    results = {
+        "meta": {
+            "latency": args.latency,
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "scenarios": {},
+    }
+    for name, fn in scenarios.items():
+        fn(-1)  # warm up imports, connections and caches
+        stats = measure(fn, args.iterations, args.concurrency)
+        results["scenarios"][name] = stats
+        print(f"{name:<46} p50={stats['p50_ms']:>9.2f}ms p95={stats['p95_ms']:>9.2f}ms "
+              f"{stats['throughput_ops']:>9.2f} ops/s")
+
+    import schemas
+
+    results["parse"] = schemas.parse_stats()
+    for pipeline, stats in results["parse"].items():
+        print(f"parse {pipeline:<40} failure_rate={stats['failure_rate']:.2%} "
+              f"mean={stats['mean_parse_ms']:.3f}ms")
+
+    import_overruns = []
+    if not args.skip_import_time:
+        from . import import_time
+
+        results["import_time"], import_overruns = import_time.check()
+
+    import db_helpers
+
+    cache = db_helpers.get_profile_cache()
+    if cache is not None:
+        results["profile_cache"] = cache.stats()
+        print(f"profile cache hit_ratio={results['profile_cache']['hit_ratio']:.2%} "
+              f"stale_reads={results['profile_cache']['stale_reads']}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline_path.write_text(json.dumps(results, indent=2))
+        print(f"Baseline written to {baseline_path}")
+        return
+    regressions = list(import_overruns)
+    if baseline_path.exists():
+        regressions += compare(results, json.loads(baseline_path.read_text()), args.tolerance, args.min_delta_ms)
+    else:
+        print(f"No baseline at {baseline_path}; run with --update-baseline to create one.")
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    if baseline_path.exists():
+        print("\nNo regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
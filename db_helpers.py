@@ -1,72 +1,489 @@
 import os
+import sys
 import json
-from pymongo import MongoClient
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from pymongo import ASCENDING, IndexModel, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
 from dotenv import load_dotenv
 
+import profile_cache
+
+# metrics and tracing live with the AI modules, whose directory myapp.ai_logic also puts on sys.path
+_AI_LOGIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Backend ai logic")
+if _AI_LOGIC_DIR not in sys.path:
+    sys.path.append(_AI_LOGIC_DIR)
+import metrics
+import tracing
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def _client_options():
+    """Pool size and timeouts, configurable through the environment."""
+    return {
+        "maxPoolSize": int(os.getenv("MONGODB_MAX_POOL_SIZE", "50")),
+        "minPoolSize": int(os.getenv("MONGODB_MIN_POOL_SIZE", "0")),
+        "maxIdleTimeMS": int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000")),
+        "connectTimeoutMS": int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000")),
+        "serverSelectionTimeoutMS": int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+        "socketTimeoutMS": int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "10000")),
+        "waitQueueTimeoutMS": int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "5000")),
+    }
+
+def get_client():
+    """Return the process-wide MongoClient, creating it on first use.
+
+    MongoClient is not fork-safe, so a pre-fork worker that inherited the
+    parent's client gets a fresh one the first time it touches the database.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = MongoClient(os.getenv("MONGODB_URI"), connect=False, **_client_options())
+                _client_pid = pid
+    return _client
+
+def close_client():
+    """Close the pooled client, e.g. on worker shutdown."""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+def _reset_client_after_fork():
+    # Drop the inherited reference without closing the parent's sockets
+    global _client, _client_pid, _client_lock, _write_buffer, _profile_cache
+    _client = None
+    _client_pid = None
+    _client_lock = threading.Lock()
+    # The parent flushes its own buffered writes; the child must not write them again
+    _write_buffer = None
+    _profile_cache = None
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_client_after_fork)
+
+# Every collection is read and upserted by user_id. The unique index turns
+# each lookup into an index seek and stops two concurrent upserts for the
+# same user from inserting two documents.
+INDEXES = {
+    "users": [IndexModel([("user_id", ASCENDING)], unique=True, name="user_id_unique")],
+    "career_paths": [IndexModel([("user_id", ASCENDING)], unique=True, name="user_id_unique")],
+    "learning_paths": [IndexModel([("user_id", ASCENDING)], unique=True, name="user_id_unique")],
+}
+
+_indexes_ready = False
+
+@contextmanager
+def _timed(operation, collection):
+    """Traces an operation and records its latency in mongo_operation_seconds (or mongo_errors_total)."""
+    with tracing.span(f"mongo.{operation}", collection=collection), \
+            metrics.DB_OPERATION_SECONDS.time(operation, collection, errors=metrics.DB_ERRORS):
+        yield
+
+def ensure_indexes(db=None):
+    """Create the indexes in INDEXES (a no-op for ones that exist) and return any still missing."""
+    db = db if db is not None else get_client().career_navigator
+    for collection, indexes in INDEXES.items():
+        with _timed("create_indexes", collection):
+            db[collection].create_indexes(indexes)
+    return verify_indexes(db)
+
+def verify_indexes(db=None):
+    """Names ("collection.index") of the INDEXES entries the database doesn't have."""
+    db = db if db is not None else get_client().career_navigator
+    missing = []
+    for collection, indexes in INDEXES.items():
+        existing = db[collection].index_information()
+        for index in indexes:
+            spec = index.document
+            found = existing.get(spec["name"])
+            if found is None or list(found["key"]) != list(spec["key"].items()) \
+                    or bool(found.get("unique")) != bool(spec.get("unique")):
+                missing.append(f"{collection}.{spec['name']}")
+    return missing
+
+def _ensure_indexes_once(db):
+    global _indexes_ready
+    if _indexes_ready or os.getenv("MONGODB_ENSURE_INDEXES", "1").strip().lower() in ("0", "false", "no", "off"):
+        return
+    with _client_lock:
+        if _indexes_ready:
+            return
+        try:
+            missing = ensure_indexes(db)
+        except OperationFailure as e:
+            # e.g. duplicate user_ids block the unique index; retrying won't help
+            logger.error("Could not create MongoDB indexes: %s", e)
+            _indexes_ready = True
+            return
+        except PyMongoError as e:
+            logger.warning("Could not check MongoDB indexes, will retry: %s", e)
+            return
+        if missing:
+            logger.error("MongoDB indexes missing after bootstrap: %s", ", ".join(missing))
+        _indexes_ready = True
+
 def get_db_connection():
     """Connect to MongoDB."""
-    client = MongoClient(os.getenv("MONGODB_URI"))
+    client = get_client()
     db = client.career_navigator
+    # The first connection in a process creates or verifies the indexes
+    _ensure_indexes_once(db)
     return db
 
-def save_user_profile(user_id, profile_data):
-    """Save user profile to database."""
-    db = get_db_connection()
-    users = db.users
-    
-    # Update if exists, insert if not
-    users.update_one(
-        {"user_id": user_id},
-        {"$set": profile_data},
-        upsert=True
-    )
-
-def get_user_profile(user_id):
-    """Retrieve user profile from database."""
-    db = get_db_connection()
-    users = db.users
-    
-    user = users.find_one({"user_id": user_id})
-    return user
+class WriteBehindBuffer:
+    """Queues upserts and flushes them with unordered bulk_write, by batch size or age.
 
-def save_career_paths(user_id, paths_data):
-    """Save generated career paths."""
-    db = get_db_connection()
-    career_paths = db.career_paths
-    
+    Writes to the same user and collection are coalesced into one $set, so
+    saving a profile twice before a flush costs one operation. get_user_profile
+    overlays writes still in the buffer (or in a flush that hasn't been
+    acknowledged), so a process always reads its own writes. The buffer is
+    bounded: once max_pending users are waiting, a save for another user is
+    written straight to MongoDB (raising if that fails, as with write-behind
+    off) instead of queued. Writes that fail are requeued and retried after an
+    exponential backoff of up to max_backoff seconds, except ones that can't
+    be encoded at all, which are logged and dropped. Pending writes are
+    flushed at interpreter exit; writes still buffered when a process is
+    killed are lost, so set MONGODB_WRITE_BEHIND=0 where every save must be
+    durable before returning.
+    """
+
+    def __init__(self, batch_size=100, flush_interval=0.5, max_pending=10000, max_backoff=30.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_backoff = max_backoff
+        self.flushes = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.overflowed = 0  # saves written straight through because the buffer was full
+        self._failed_flushes = 0  # in a row, for the backoff
+        self._retry_at = 0.0
+        self._pending = {}  # (collection, user_id) -> fields to $set
+        self._inflight = {}
+        self._callbacks = {}  # (collection, user_id) -> functions to call once the write is acknowledged
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    @classmethod
+    def from_env(cls):
+        """Builds a buffer configured from MONGODB_WRITE_BEHIND_* environment variables."""
+        return cls(
+            batch_size=int(os.getenv("MONGODB_WRITE_BEHIND_BATCH_SIZE", "100")),
+            flush_interval=float(os.getenv("MONGODB_WRITE_BEHIND_INTERVAL", "0.5")),
+            max_pending=int(os.getenv("MONGODB_WRITE_BEHIND_MAX_PENDING", "10000")),
+            max_backoff=float(os.getenv("MONGODB_WRITE_BEHIND_MAX_BACKOFF", "30")),
+        )
+
+    def _ensure_thread(self):
+        # Threads don't survive a fork; a worker process starts its own flusher
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="mongo-write-behind", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            # After a failed flush, wait out the backoff even when a full batch wakes us
+            delay = self._retry_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                self.flush()
+            except Exception:
+                # The thread must outlive any one flush; what failed is back in the buffer
+                logger.exception("Write-behind flush failed")
+
+    def upsert(self, collection, user_id, fields, on_written=None):
+        """Queues {"$set": fields} for the user's document in a collection.
+
+        on_written, if given, is called from the flushing thread once MongoDB
+        has acknowledged the write. When the buffer is full the write is made
+        before returning instead, and on_written is called by this thread.
+        """
+        key = (collection, user_id)
+        with self._lock:
+            self._ensure_thread()
+            # Coalescing into a queued write doesn't grow the buffer, and a write for a
+            # user in a flush must queue behind it to land in order
+            queued = key in self._pending or key in self._inflight or len(self._pending) < self.max_pending
+            if queued:
+                self._pending.setdefault(key, {}).update(fields)
+                if on_written is not None:
+                    self._callbacks.setdefault(key, []).append(on_written)
+            else:
+                self.overflowed += 1
+            size = len(self._pending)
+        if size >= self.batch_size:
+            self._wake.set()
+        if not queued:
+            with _timed("update_one", collection):
+                get_db_connection()[collection].update_one({"user_id": user_id}, {"$set": fields}, upsert=True)
+            if on_written is not None:
+                on_written()
+
+    def overlay(self, collection, user_id, document, fields=None):
+        """Applies this process's unflushed writes for a user on top of a document read from MongoDB.
+
+        With `fields`, only those top-level fields of the buffered writes are applied.
+        """
+        key = (collection, user_id)
+        with self._lock:
+            inflight = self._inflight.get(key)
+            pending = self._pending.get(key)
+        if inflight is None and pending is None:
+            return document
+        merged = dict(document) if document is not None else {"user_id": user_id}
+        for fields_set in (inflight or {}, pending or {}):
+            merged.update(fields_set if fields is None else
+                          {name: value for name, value in fields_set.items() if name in fields})
+        return merged
+
+    def _write(self, db, collection, writes):
+        """Bulk-writes one collection's upserts; returns the user_ids that are done with (written or dropped)."""
+        operations = [UpdateOne({"user_id": user_id}, {"$set": fields}, upsert=True) for user_id, fields in writes]
+        try:
+            with _timed("bulk_write", collection):
+                db[collection].bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            logger.warning("%s of %s writes to %s failed: %s", len(errors), len(operations), collection,
+                           errors[0].get("errmsg") if errors else e)
+            self.written += len(operations) - len(errors)
+            failed = {writes[error["index"]][0] for error in errors}
+            return {user_id for user_id, _ in writes} - failed
+        except PyMongoError as e:
+            logger.warning("Could not write %s documents to %s: %s", len(operations), collection, e)
+            return set()
+        except Exception as e:
+            # e.g. bson's InvalidDocument: one document that can't be encoded fails the whole batch
+            if len(writes) == 1:
+                logger.error("Dropping a write to %s for user %s: %s", collection, writes[0][0], e)
+                self.dropped += 1
+                return {writes[0][0]}
+            logger.warning("Could not write %s documents to %s (%s), writing them one at a time",
+                           len(operations), collection, e)
+            done = set()
+            for write in writes:
+                done |= self._write(db, collection, [write])
+            return done
+        self.written += len(operations)
+        logger.debug("Wrote %s documents to %s", len(operations), collection)
+        return {user_id for user_id, _ in writes}
+
+    def flush(self):
+        """Writes everything queued so far, one unordered bulk_write per collection."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, {}
+                callbacks, self._callbacks = self._callbacks, {}
+                self._inflight = batch
+            # Whatever isn't written (or dropped as unwritable) by the end goes back in the buffer
+            unwritten = dict(batch)
+            written = []
+            try:
+                by_collection = {}
+                for (collection, user_id), fields in batch.items():
+                    by_collection.setdefault(collection, []).append((user_id, fields))
+                db = get_db_connection()
+                for collection, writes in by_collection.items():
+                    for user_id in self._write(db, collection, writes):
+                        del unwritten[(collection, user_id)]
+                        written.extend(callbacks.pop((collection, user_id), ()))
+            finally:
+                with self._lock:
+                    self.flushes += 1
+                    self.failed += len(unwritten)
+                    # Failed writes go back in the buffer, under anything newer written meanwhile
+                    for key, fields in unwritten.items():
+                        self._pending[key] = dict(fields, **self._pending.get(key, {}))
+                    for key, functions in callbacks.items():
+                        if key in unwritten:
+                            self._callbacks[key] = functions + self._callbacks.get(key, [])
+                    self._inflight = {}
+                    if unwritten:
+                        self._failed_flushes += 1
+                        backoff = min(self.flush_interval * 2 ** self._failed_flushes, self.max_backoff)
+                        self._retry_at = time.monotonic() + backoff
+                    else:
+                        self._failed_flushes = 0
+                        self._retry_at = 0.0
+            for on_written in written:
+                try:
+                    on_written()
+                except Exception:
+                    logger.exception("Write-behind callback failed")
+
+    def stats(self):
+        with self._lock:
+            return {"pending": len(self._pending), "flushes": self.flushes, "written": self.written,
+                    "failed": self.failed, "dropped": self.dropped, "overflowed": self.overflowed}
+
+
+_write_buffer = None
+
+def write_behind_enabled():
+    return os.getenv("MONGODB_WRITE_BEHIND", "1").strip().lower() not in ("0", "false", "no", "off")
+
+def get_write_buffer():
+    """Return the process-wide write-behind buffer, creating it on first use."""
+    global _write_buffer
+    if _write_buffer is None:
+        with _client_lock:
+            if _write_buffer is None:
+                _write_buffer = WriteBehindBuffer.from_env()
+    return _write_buffer
+
+def flush_writes():
+    """Write every buffered save now, e.g. before a worker exits or at the end of a batch."""
+    if _write_buffer is not None:
+        _write_buffer.flush()
+
+atexit.register(flush_writes)
+
+def _upsert(collection, user_id, fields, on_written=None):
+    if write_behind_enabled():
+        with tracing.span("mongo.buffer_save", collection=collection):
+            get_write_buffer().upsert(collection, user_id, fields, on_written)
+        return
+    with _timed("update_one", collection):
+        get_db_connection()[collection].update_one({"user_id": user_id}, {"$set": fields}, upsert=True)
+    if on_written is not None:
+        on_written()
+
+def _as_document(data):
     # Parse string to JSON if needed
-    if isinstance(paths_data, str):
+    if isinstance(data, str):
         try:
-            paths_data = json.loads(paths_data)
+            return json.loads(data)
         except json.JSONDecodeError:
             # If not valid JSON, store as is
-            paths_data = {"raw_response": paths_data}
-    
-    # Update if exists, insert if not
-    career_paths.update_one(
-        {"user_id": user_id},
-        {"$set": {"paths": paths_data}},
-        upsert=True
-    )
+            return {"raw_response": data}
+    return data
+
+_profile_cache = None
+
+def get_profile_cache():
+    """Return the process-wide profile cache, or None if PROFILE_CACHE_DISABLE is set."""
+    global _profile_cache
+    if os.getenv("PROFILE_CACHE_DISABLE", "").strip().lower() in ("1", "true", "yes", "on"):
+        return None
+    if _profile_cache is None:
+        with _client_lock:
+            if _profile_cache is None:
+                _profile_cache = profile_cache.ProfileCache.from_env()
+    return _profile_cache
+
+def _collect_metrics():
+    families = []
+    if _write_buffer is not None:
+        stats = _write_buffer.stats()
+        families += [
+            ("mongo_write_buffer_pending", "gauge", "Saves buffered and not yet written.", (), {(): stats["pending"]}),
+            ("mongo_write_buffer_written_total", "counter", "Buffered saves written to MongoDB.",
+             (), {(): stats["written"]}),
+            ("mongo_write_buffer_failed_total", "counter", "Buffered saves that failed and were requeued.",
+             (), {(): stats["failed"]}),
+            ("mongo_write_buffer_dropped_total", "counter", "Buffered saves dropped because they can't be encoded.",
+             (), {(): stats["dropped"]}),
+            ("mongo_write_buffer_overflowed_total", "counter", "Saves written directly because the buffer was full.",
+             (), {(): stats["overflowed"]}),
+        ]
+    if _profile_cache is not None:
+        stats = _profile_cache.stats()
+        families += [
+            ("profile_cache_entries", "gauge", "Profiles held in this process's cache.", (), {(): stats["entries"]}),
+            ("profile_cache_lookups_total", "counter", "Profile cache lookups (hit or miss).",
+             ("result",), {("hit",): stats["hits"], ("miss",): stats["misses"]}),
+            ("profile_cache_stale_reads_total", "counter",
+             "Profiles served after another process had saved a newer one.", (), {(): stats["stale_reads"]}),
+        ]
+    return families
+
+metrics.register_collector(_collect_metrics)
+
+def save_user_profile(user_id, profile_data):
+    """Save user profile to database."""
+    cache = get_profile_cache()
+    if cache is None:
+        # Update if exists, insert if not
+        _upsert("users", user_id, profile_data)
+        return
+    saved_at = time.time()
+    # Other workers are only told once MongoDB has the write; told earlier, they
+    # would re-read and cache the old profile for a whole TTL
+    _upsert("users", user_id, profile_data, on_written=lambda: cache.publish(user_id, saved_at))
+    cache.update(user_id, profile_data, publish=False)
+
+def find_user_document(collection, user_id, fields=None):
+    """Read a user's document from a collection.
+
+    With `fields`, only those fields (plus user_id, without _id) are fetched,
+    so large stored responses aren't sent over the wire when they aren't needed.
+    """
+    projection = None
+    if fields is not None:
+        projection = dict({"_id": 0, "user_id": 1}, **{field: 1 for field in fields})
+    with _timed("find_one", collection):
+        document = get_db_connection()[collection].find_one({"user_id": user_id}, projection)
+    if _write_buffer is not None:
+        document = _write_buffer.overlay(collection, user_id, document, fields)
+    return document
+
+def get_user_profile(user_id, fields=None):
+    """Retrieve user profile from database, optionally only the given fields.
+
+    Reads go through the profile cache; a miss fetches and caches the whole
+    document, and `fields` is then applied to the cached copy.
+    """
+    cache = get_profile_cache()
+    if cache is None:
+        return find_user_document("users", user_id, fields)
+    user = cache.get(user_id)
+    if user is profile_cache.MISSING:
+        version = cache.version()
+        user = find_user_document("users", user_id)
+        cache.set(user_id, user, version)
+    if user is None or fields is None:
+        return user
+    return {name: user[name] for name in ("user_id", *fields) if name in user}
+
+def save_career_paths(user_id, paths_data):
+    """Save generated career paths."""
+    _upsert("career_paths", user_id, {"paths": _as_document(paths_data)})
 
 def save_learning_path(user_id, learning_data):
     """Save generated learning recommendations."""
-    db = get_db_connection()
-    learning_paths = db.learning_paths
-    
-    # Parse string to JSON if needed
-    if isinstance(learning_data, str):
-        try:
-            learning_data = json.loads(learning_data)
-        except json.JSONDecodeError:
-            # If not valid JSON, store as is
-            learning_data = {"raw_response": learning_data}
-    
-    # Update if exists, insert if not
-    learning_paths.update_one(
-        {"user_id": user_id},
-        {"$set": {"recommendations": learning_data}},
-        upsert=True
-    )
\ No newline at end of file
+    _upsert("learning_paths", user_id, {"recommendations": _as_document(learning_data)})
+
+def get_career_paths(user_id):
+    """Retrieve saved career paths, or None."""
+    document = find_user_document("career_paths", user_id, ["paths"])
+    return document.get("paths") if document else None
+
+def get_learning_path(user_id):
+    """Retrieve saved learning recommendations, or None."""
+    document = find_user_document("learning_paths", user_id, ["recommendations"])
+    return document.get("recommendations") if document else None
@@ -0,0 +1,23 @@
+import asyncio
+import importlib
+import sys
+
+from django.conf import settings
+
+AI_LOGIC_DIR = settings.BASE_DIR / 'Backend ai logic'
+
+
+def load(module_name):
+    """Import one of the 'Backend ai logic' modules (model, questionnare, skills, projects)."""
+    path = str(AI_LOGIC_DIR)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return importlib.import_module(module_name)
+
+
+async def load_async(module_name):
+    """load() for async views: the first import reads modules from disk, so it runs off the event loop."""
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    return await asyncio.to_thread(load, module_name)
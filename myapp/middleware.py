@@ -0,0 +1,137 @@
+"""Request tracing, and the request and user IDs that app_logging attaches to every log record."""
+import re
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+import app_logging
+
+from . import ai_logic
+
+# A client-supplied ID is only trusted if it looks like one
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+# W3C trace context: version-trace_id-parent_id-flags
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+
+class TracingMiddleware:
+    """Makes each request the root span of a trace (see 'Backend ai logic/tracing.py').
+
+    Must come first, so the other middleware and the view run inside the
+    span. A valid traceparent header continues the caller's trace; the trace
+    ID is returned as X-Trace-ID. A streaming response's span ends when the
+    stream does.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.tracing = ai_logic.load('tracing')
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _start(self, request):
+        match = _TRACEPARENT.match(request.headers.get('traceparent', ''))
+        trace_id, parent_span_id = match.groups() if match else (None, None)
+        if trace_id == '0' * 32 or parent_span_id == '0' * 16:
+            trace_id = parent_span_id = None
+        return self.tracing.start_trace(
+            f'{request.method} {request.path}', trace_id=trace_id, parent_span_id=parent_span_id,
+            method=request.method, path=request.path,
+        )
+
+    def _finish(self, request, response, span):
+        if span is self.tracing.NO_SPAN:
+            return response
+        route = getattr(request.resolver_match, 'route', None)
+        if route:
+            span.name = f'{request.method} /{route}'
+            span.set_attribute('route', route)
+        span.set_attribute('status_code', response.status_code)
+        if response.status_code >= 500:
+            span.status = 'ERROR'
+        response['X-Trace-ID'] = span.trace_id
+        if not response.streaming:
+            span.end()
+        elif response.is_async:
+            response.streaming_content = self.tracing.aiter_in_span(response.streaming_content, span)
+        else:
+            response.streaming_content = self.tracing.iter_in_span(response.streaming_content, span)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        span = self._start(request)
+        try:
+            with self.tracing.activate(span):
+                response = self.get_response(request)
+        except Exception as e:
+            span.record_error(e)
+            span.end()
+            raise
+        return self._finish(request, response, span)
+
+    async def __acall__(self, request):
+        span = self._start(request)
+        try:
+            with self.tracing.activate(span):
+                response = await self.get_response(request)
+        except Exception as e:
+            span.record_error(e)
+            span.end()
+            raise
+        return self._finish(request, response, span)
+
+
+def _user_id(request):
+    user = getattr(request, 'user', None)
+    return user.pk if user is not None else None
+
+
+class RequestContextMiddleware:
+    """Takes X-Request-ID from the client (or makes one up) and echoes it on the response.
+
+    Must come after AuthenticationMiddleware, which provides request.user.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.tracing = ai_logic.load('tracing')
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _request_id(self, request):
+        header = request.headers.get('X-Request-ID', '')
+        return header if _REQUEST_ID.match(header) else uuid.uuid4().hex
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.request_id = self._request_id(request)
+        tokens = app_logging.bind_context(request.request_id, _user_id(request))
+        self.tracing.current().set_attributes(request_id=request.request_id, user_id=app_logging.user_id.get())
+        try:
+            response = self.get_response(request)
+        finally:
+            app_logging.reset_context(tokens)
+        response['X-Request-ID'] = request.request_id
+        return response
+
+    async def __acall__(self, request):
+        request.request_id = self._request_id(request)
+        # request.user would hit the database from the event loop. Not request.auser(): it needs
+        # aget_user() on the session's backend, which the LinkedIn one doesn't have
+        tokens = app_logging.bind_context(request.request_id, await sync_to_async(_user_id)(request))
+        self.tracing.current().set_attributes(request_id=request.request_id, user_id=app_logging.user_id.get())
+        try:
+            response = await self.get_response(request)
+        finally:
+            app_logging.reset_context(tokens)
+        response['X-Request-ID'] = request.request_id
+        return response
@@ -0,0 +1,84 @@
+"""Server-Sent Events for the streaming AI endpoints.
+
+relay() turns an async iterator of (event, data) pairs into SSE text. The
+pipeline runs in its own task and feeds a small bounded queue, so a client
+that reads slowly makes the task stop pulling from Gemini instead of
+buffering the whole answer in memory. While nothing new arrives, a comment
+line goes out every few seconds to keep proxies from closing the
+connection. When the client disconnects, Django cancels the response, and
+cancelling the pipeline task closes the Gemini stream so no more tokens are
+generated.
+"""
+import asyncio
+import json
+import logging
+import os
+
+from django.http import StreamingHttpResponse
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))
+BUFFER_EVENTS = int(os.getenv('SSE_BUFFER_EVENTS', '16'))
+# How long a browser's EventSource waits before reconnecting
+RETRY_MS = 3000
+
+
+def format_event(event, data, event_id=None):
+    """One SSE message; data is sent as JSON, which never spans lines."""
+    message = f'event: {event}\ndata: {json.dumps(data, default=str)}\n\n'
+    return message if event_id is None else f'id: {event_id}\n{message}'
+
+
+async def relay(events, heartbeat=HEARTBEAT_SECONDS, buffer=BUFFER_EVENTS):
+    """Yields SSE text for an async iterator of (event, data) pairs, ending with a "done" event."""
+    queue = asyncio.Queue(maxsize=buffer)
+
+    async def produce():
+        try:
+            async for item in events:
+                await queue.put(item)
+        except Exception:
+            logger.exception("Error in AI stream")
+            await queue.put(('error', {'error': 'Generation failed. Please try again.'}))
+        await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    getter = None
+    event_id = 0
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        while True:
+            # A pending get survives heartbeat timeouts, so no event can be dropped between them
+            if getter is None:
+                getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=heartbeat)
+            if not done:
+                yield ': heartbeat\n\n'
+                continue
+            item, getter = getter.result(), None
+            if item is None:
+                break
+            event_id += 1
+            yield format_event(*item, event_id=event_id)
+        yield format_event('done', {}, event_id=event_id + 1)
+    finally:
+        if getter is not None:
+            getter.cancel()
+        producer.cancel()
+        try:
+            await producer
+        except asyncio.CancelledError:
+            pass
+        # The producer may have been parked on a full queue rather than inside the stream
+        aclose = getattr(events, 'aclose', None)
+        if aclose is not None:
+            await aclose()
+
+
+def event_stream_response(events):
+    response = StreamingHttpResponse(relay(events), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the events until the end
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,3 +1,1604 @@
-from django.test import TestCase
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from unittest import mock
 
-# Create your tests here.
+import mongomock
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import Client, SimpleTestCase, TestCase
+
+import app_logging
+import db_helpers
+import profile_cache
+
+from . import ai_logic, sse
+
+
+class FitPromptTests(SimpleTestCase):
+    def setUp(self):
+        self.prompts = ai_logic.load('prompts')
+
+    def test_fits_untouched_when_under_budget(self):
+        prompt = self.prompts.job_suggestions_prompt({'technical_skills': ['Python', 'SQL']}, 'Fintech')
+        self.assertIn('["Python","SQL"]', prompt)
+        self.assertNotIn('more"', prompt)
+
+    def test_trims_largest_list_with_marker(self):
+        skills = [f'Skill {i}' for i in range(3000)]
+        prompt = self.prompts.job_suggestions_prompt({'technical_skills': skills}, 'Fintech')
+        self.assertLessEqual(self.prompts.estimate_tokens(prompt), self.prompts.budget_for('job_suggestions'))
+        self.assertRegex(prompt, r'"\+\d+ more"')
+        self.assertIn('"Skill 0"', prompt)
+
+    def test_marker_counts_every_dropped_item(self):
+        skills = [f'Skill {i}' for i in range(3000)]
+        prompt = self.prompts.job_suggestions_prompt({'technical_skills': skills}, 'Fintech')
+        kept = re.findall(r'"Skill \d+"', prompt)
+        dropped = int(re.search(r'"\+(\d+) more"', prompt).group(1))
+        self.assertEqual(len(kept) + dropped, 3000)
+
+    def test_single_oversized_item_terminates(self):
+        # A list cut down to [item, "+N more"] can't shrink further; the item itself is shortened
+        extracted = {'technical_skills': ['x' * 20000, 'Python', 'SQL']}
+        prompt = self.prompts.job_suggestions_prompt(extracted, 'Fintech')
+        self.assertLessEqual(self.prompts.estimate_tokens(prompt), self.prompts.budget_for('job_suggestions'))
+        self.assertEqual(extracted['technical_skills'][0], 'x' * 20000)  # the caller's data is untouched
+
+    def test_single_item_list_is_truncated(self):
+        prompt = self.prompts.job_suggestions_prompt({'technical_skills': ['x' * 20000]}, 'Fintech')
+        self.assertLessEqual(self.prompts.estimate_tokens(prompt), self.prompts.budget_for('job_suggestions'))
+        self.assertIn('…', prompt)
+
+    def test_short_strings_are_never_cut(self):
+        with self.assertLogs('prompts', 'WARNING'):
+            prompt = self.prompts.fit_prompt('job_suggestions', lambda data: data['text'] * 2000, {'text': 'abcdefgh'})
+        self.assertEqual(len(prompt), 16000)
+
+
+def _skills(*names, level=None, years=None):
+    return {'technical_skills': [{'skill': name, 'proficiency_level': level, 'years_experience': years}
+                                 for name in names]}
+
+
+class AsyncPromptTests(SimpleTestCase):
+    """Building a prompt may count tokens over the network, so the async pipelines do it in a thread."""
+
+    def _prompt_threads(self, module, builder, pipeline, *args):
+        threads = []
+        build = getattr(module, builder)
+
+        def recording(*args):
+            threads.append(threading.current_thread())
+            return build(*args)
+
+        async def text(*args, **kwargs):
+            return '{"recommendations": []}'
+
+        async def chunks(*args, **kwargs):
+            yield '{"recommendations": []}'
+
+        async def scenario():
+            await getattr(module, pipeline)(*args)
+            [item async for item in getattr(module, pipeline.replace('generate_', 'stream_'))(*args)]
+
+        with mock.patch.object(module, builder, recording), \
+                mock.patch.object(module, 'generate_text_async', text), \
+                mock.patch.object(module, 'stream_text_async', chunks):
+            asyncio.run(scenario())
+        return threads
+
+    def test_prompts_are_built_off_the_event_loop(self):
+        model, projects = ai_logic.load('model'), ai_logic.load('projects')
+        cases = [
+            (model, 'build_job_suggestions_prompt', 'generate_job_suggestions_async', {}, 'Fintech'),
+            (model, 'build_learning_path_prompt', 'generate_learning_path_async', {}, 'Data Engineer'),
+            (projects, 'build_project_prompt', 'generate_project_recommendations_async', [], 'Data', 'beginner'),
+        ]
+        for module, builder, pipeline, *args in cases:
+            with self.subTest(pipeline=pipeline):
+                threads = self._prompt_threads(module, builder, pipeline, *args)
+                self.assertEqual(len(threads), 2)
+                self.assertNotIn(threading.main_thread(), threads)
+
+
+class FakeModel:
+    """Stands in for a GenerativeModel: answers every prompt with `text` and counts the calls."""
+
+    model_name = 'models/test-model'
+
+    def __init__(self, text='Data Engineer', delay=0):
+        self.text = text
+        self.delay = delay
+        self.calls = 0
+
+    def generate_content(self, prompt, generation_config=None):
+        self.calls += 1
+        return types.SimpleNamespace(text=self.text)
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return types.SimpleNamespace(text=self.text)
+
+
+class LazyImportTests(SimpleTestCase):
+    def test_importing_the_pipelines_loads_no_sdk(self):
+        # A fresh interpreter, where anything importing these at module load fails
+        script = '''
+import importlib.abc, os, sys
+sys.path.insert(0, sys.argv[1])
+os.environ.pop("GOOGLE_API_KEY", None)
+
+class Blocker(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path=None, target=None):
+        if name.split(".")[0] in ("numpy", "requests") or name.startswith("google.generativeai"):
+            raise ImportError(f"{name} imported at module load")
+
+sys.meta_path.insert(0, Blocker())
+import model, questionnare, skills, projects, semantic_cache, batch_runner, job_queue
+print(model.model.model_name)
+'''
+        result = subprocess.run([sys.executable, '-c', script, str(ai_logic.AI_LOGIC_DIR)],
+                                capture_output=True, text=True, cwd=settings.BASE_DIR)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), 'models/gemini-pro')
+
+    def test_missing_api_key_fails_the_call_not_the_import(self):
+        model, llm_client = ai_logic.load('model'), ai_logic.load('llm_client')
+        with mock.patch.dict(os.environ), mock.patch.object(llm_client, '_models', {}):
+            os.environ.pop('GOOGLE_API_KEY', None)
+            with self.assertRaisesRegex(RuntimeError, 'GOOGLE_API_KEY is not set'):
+                model.model.generate_content('Hello')
+            with self.assertLogs(model.logger, 'ERROR'):
+                result = model.extract_skills_and_experience({'headline': 'Engineer'}, bypass_cache=True)
+        self.assertIn('GOOGLE_API_KEY is not set', result['error'])
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.response_cache = ai_logic.load('response_cache')
+        self.llm_client = ai_logic.load('llm_client')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = self.response_cache.ResponseCache(path=f'{directory.name}/cache.sqlite3',
+                                                       ttls={'learning_path': 0.05})
+        self.addCleanup(lambda: self.cache._conn and self.cache._conn.close())
+
+    def test_hit_after_miss(self):
+        self.assertIsNone(self.cache.get('models/test-model', 'Suggest jobs', 'job_suggestions'))
+        self.cache.set('models/test-model', 'Suggest jobs', 'job_suggestions', 'Data Engineer')
+        # Whitespace doesn't change the key; the model does
+        self.assertEqual(self.cache.get('models/test-model', '  Suggest\n  jobs', 'job_suggestions'), 'Data Engineer')
+        self.assertIsNone(self.cache.get('models/other-model', 'Suggest jobs', 'job_suggestions'))
+        self.assertEqual(self.cache.stats()['pipelines'], {'job_suggestions': {'hits': 1, 'misses': 2}})
+
+    def test_entries_expire_after_their_pipeline_ttl(self):
+        self.cache.set('models/test-model', 'Plan a path', 'learning_path', 'Learn SQL')
+        self.cache.set('models/test-model', 'Suggest jobs', 'job_suggestions', 'Data Engineer')
+        self.assertEqual(self.cache.get('models/test-model', 'Plan a path', 'learning_path'), 'Learn SQL')
+        time.sleep(0.06)
+        self.assertIsNone(self.cache.get('models/test-model', 'Plan a path', 'learning_path'))
+        self.assertEqual(self.cache.get('models/test-model', 'Suggest jobs', 'job_suggestions'), 'Data Engineer')
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.cache.max_entries = 2
+        for prompt in ('first', 'second'):
+            self.cache.set('models/test-model', prompt, 'job_suggestions', prompt)
+            time.sleep(0.01)
+        self.cache.get('models/test-model', 'first', 'job_suggestions')
+        self.cache.set('models/test-model', 'third', 'job_suggestions', 'third')
+        found = [self.cache.get('models/test-model', prompt, 'job_suggestions')
+                 for prompt in ('first', 'second', 'third')]
+        self.assertEqual(found, ['first', None, 'third'])
+
+    def test_generate_text_calls_the_model_once_per_prompt(self):
+        model = FakeModel()
+        with mock.patch.object(self.llm_client, '_cache', self.cache):
+            for _ in range(2):
+                self.assertEqual(self.llm_client.generate_text(model, 'Suggest jobs', 'job_suggestions'),
+                                 'Data Engineer')
+            self.assertEqual(asyncio.run(self.llm_client.generate_text_async(model, 'Suggest jobs', 'job_suggestions')),
+                             'Data Engineer')
+            self.assertEqual(model.calls, 1)
+            self.llm_client.generate_text(model, 'Suggest jobs', 'job_suggestions', bypass_cache=True)
+            self.llm_client.generate_text(model, 'Suggest jobs', 'job_suggestions', generation_config={'x': 1})
+            self.assertEqual(model.calls, 3)
+
+
+class GatherBoundedTests(SimpleTestCase):
+    def setUp(self):
+        self.llm_client = ai_logic.load('llm_client')
+
+    def test_runs_at_most_limit_at_once_and_keeps_order(self):
+        running, peak = 0, 0
+
+        async def job(value):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01 * (5 - value))
+            running -= 1
+            return value
+
+        results = asyncio.run(self.llm_client.gather_bounded([job(value) for value in range(5)], limit=2))
+        self.assertEqual(results, [0, 1, 2, 3, 4])
+        self.assertEqual(peak, 2)
+
+    def test_failure_cancels_the_rest(self):
+        cancelled = []
+
+        async def job(value):
+            try:
+                await asyncio.sleep(0 if value == 0 else 10)
+            except asyncio.CancelledError:
+                cancelled.append(value)
+                raise
+            raise ValueError('boom')
+
+        with self.assertRaisesRegex(ValueError, 'boom'):
+            asyncio.run(self.llm_client.gather_bounded([job(value) for value in range(3)], limit=3))
+        self.assertEqual(sorted(cancelled), [1, 2])
+
+    def test_timeout_cancels_everything(self):
+        async def job():
+            await asyncio.sleep(10)
+
+        start = time.monotonic()
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(self.llm_client.gather_bounded([job() for _ in range(4)], limit=2, timeout=0.05))
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_coroutines_cancelled_before_starting_are_closed(self):
+        async def job():
+            await asyncio.sleep(10)
+
+        coroutines = [job() for _ in range(3)]
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(self.llm_client.gather_bounded(coroutines, timeout=0))
+        # An unclosed coroutine keeps its frame, and warns "never awaited" when collected
+        self.assertEqual([coroutine.cr_frame for coroutine in coroutines], [None, None, None])
+
+    def test_fan_out_shares_the_model_concurrency_limit(self):
+        model = FakeModel(delay=0.02)
+
+        async def scenario():
+            prompts = [f'Suggest jobs in industry {index}' for index in range(6)]
+            coroutines = [self.llm_client.generate_text_async(model, prompt, 'job_suggestions', bypass_cache=True)
+                          for prompt in prompts]
+            return await self.llm_client.gather_bounded(coroutines, limit=6)
+
+        in_flight, peak = 0, 0
+        generate = model.generate_content_async
+
+        async def counting(prompt, generation_config=None):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            try:
+                return await generate(prompt, generation_config)
+            finally:
+                in_flight -= 1
+
+        # gather_bounded would let all six run; the per-loop Gemini semaphore allows two
+        with mock.patch.object(self.llm_client, 'MAX_CONCURRENCY', 2), \
+                mock.patch.object(model, 'generate_content_async', counting):
+            self.assertEqual(asyncio.run(scenario()), ['Data Engineer'] * 6)
+        self.assertEqual((model.calls, peak), (6, 2))
+
+
+class SemanticCacheTests(SimpleTestCase):
+    # (field, field, same request?) -- the labelled set DEFAULT_THRESHOLD was chosen from
+    FIELD_PAIRS = [
+        ('Data Science', 'data science', True),
+        ('DS', 'Data Science', True),
+        ('ML', 'Machine Learning', True),
+        ('Full Stack Development', 'Full-Stack Development', True),
+        ('Web Development', 'Web Developer', False),
+        ('Data Science', 'Data Engineering', False),
+        ('Frontend Development', 'Backend Development', False),
+        ('Machine Learning', 'Deep Learning', False),
+        ('Data Analytics', 'Data Science', False),
+        ('Software Engineering', 'Software Testing', False),
+    ]
+
+    def setUp(self):
+        self.semantic_cache = ai_logic.load('semantic_cache')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = self.semantic_cache.SemanticCache(path=f'{directory.name}/cache.npz')
+
+    def _set(self, skills_data, field):
+        key = self.semantic_cache.skill_key(skills_data)
+        self.cache.set(f'test:{key}', self.semantic_cache.canonical_text(field), 'stored')
+
+    def _get(self, skills_data, field):
+        key = self.semantic_cache.skill_key(skills_data)
+        return self.cache.get(f'test:{key}', self.semantic_cache.canonical_text(field))
+
+    def test_threshold_separates_labelled_fields(self):
+        for first, second, same in self.FIELD_PAIRS:
+            score = float(self.semantic_cache.embed(self.semantic_cache.canonical_text(first))
+                          @ self.semantic_cache.embed(self.semantic_cache.canonical_text(second)))
+            with self.subTest(first=first, second=second):
+                self.assertEqual(score >= self.semantic_cache.DEFAULT_THRESHOLD, same, score)
+
+    def test_different_skill_is_a_miss(self):
+        self._set(_skills('Java'), 'Data Science')
+        self.assertIsNone(self._get(_skills('Python'), 'Data Science'))
+
+    def test_one_swapped_skill_is_a_miss(self):
+        self._set(_skills('Python', 'SQL', 'Docker', 'AWS', 'Git'), 'Data Science')
+        self.assertIsNone(self._get(_skills('Python', 'SQL', 'Docker', 'AWS', 'Rust'), 'Data Science'))
+
+    def test_different_level_is_a_miss(self):
+        self._set(_skills('Python', level='beginner', years=1), 'Data Science')
+        self.assertIsNone(self._get(_skills('Python', level='expert', years=10), 'Data Science'))
+
+    def test_order_case_and_abbreviations_hit(self):
+        self._set(_skills('Python', 'SQL', 'Docker'), 'Data Science')
+        self.assertEqual(self._get(_skills('docker', 'sql', 'python'), 'DS'), 'stored')
+
+    def test_persists_across_instances(self):
+        self._set(_skills('Python'), 'Data Science')
+        self.cache.save()
+        reloaded = self.semantic_cache.SemanticCache(path=self.cache.path)
+        self.assertEqual(len(reloaded), 1)
+
+    def test_a_file_with_mismatched_vectors_is_ignored(self):
+        import numpy as np
+
+        self._set(_skills('Python'), 'Data Science')
+        self._set(_skills('Java'), 'Data Science')
+        self.cache.save()
+        with np.load(self.cache.path) as data:
+            meta, vectors = data['meta'], data['vectors']
+        np.savez(self.cache.path, meta=meta, vectors=vectors[:1])
+        with self.assertLogs(self.semantic_cache.logger, 'WARNING'):
+            reloaded = self.semantic_cache.SemanticCache(path=self.cache.path)
+        self.assertEqual(len(reloaded), 0)
+        self.assertIsNone(reloaded.get(f'test:{self.semantic_cache.skill_key(_skills("Java"))}',
+                                        self.semantic_cache.canonical_text('Data Science')))
+
+
+class CourseCatalogTests(SimpleTestCase):
+    COURSES = [
+        {'title': 'Machine Learning Specialization', 'platform': 'Coursera', 'duration_weeks': 10,
+         'skill_level': 'beginner', 'key_topics': ['ML', 'Python']},
+        {'title': 'Practical Deep Learning', 'platform': 'fast.ai', 'estimated_duration': '2 months',
+         'skill_level': 'intermediate', 'key_topics': ['Machine Learning', 'PyTorch']},
+        {'title': 'Python for Everybody', 'platform': 'Coursera', 'duration_weeks': '4 weeks',
+         'skill_level': 'beginner', 'key_topics': ['Python']},
+        {'title': 'SQL Basics', 'platform': 'Khan Academy', 'skill_level': 'beginner', 'key_topics': ['SQL']},
+    ]
+
+    def setUp(self):
+        self.course_catalog = ai_logic.load('course_catalog')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.catalog = self.course_catalog.CourseCatalog(f'{directory.name}/catalog.sqlite3')
+        self.addCleanup(lambda: self.catalog._conn and self.catalog._conn.close())
+        self.catalog.add_courses((course, None) for course in self.COURSES)
+
+    def _titles(self, query, **filters):
+        return [course['title'] for course in self.catalog.search(query, **filters)]
+
+    def test_search_matches_topics_through_skill_aliases(self):
+        self.assertEqual(sorted(self._titles('ML')), ['Machine Learning Specialization', 'Practical Deep Learning'])
+        self.assertEqual(self._titles('I want to learn SQL'), ['SQL Basics'])
+        self.assertEqual(self._titles('Rust'), [])
+
+    def test_level_and_duration_filters(self):
+        self.assertEqual(self._titles('machine learning', level='beginner'), ['Machine Learning Specialization'])
+        # Two months is about 8.6 weeks; SQL Basics has no known duration
+        self.assertEqual(self._titles('machine learning', max_weeks=9), ['Practical Deep Learning'])
+        self.assertEqual(self._titles('SQL', max_weeks=52), [])
+
+    def test_courses_must_cover_most_of_the_query(self):
+        self.assertEqual(self._titles('PyTorch'), ['Practical Deep Learning'])
+        # Each course covers half of this query's weight, short of MIN_COVERAGE
+        self.assertEqual(self._titles('PyTorch SQL'), [])
+
+    def test_repeated_courses_merge_and_rank_first(self):
+        self.catalog.add_courses([({'title': 'Python for  everybody', 'platform': 'coursera'}, None)], source='llm')
+        reloaded = self.course_catalog.CourseCatalog(self.catalog.path)
+        self.assertEqual(len(reloaded), 4)
+        best = reloaded.search('Python')[0]
+        # One course, seen twice, keeping the details the sparser copy lacked
+        self.assertEqual(best['id'], self.course_catalog.course_id('Python for Everybody', 'Coursera'))
+        self.assertEqual((best['times_seen'], best['duration_weeks'], best['skill_level']), (2, 4.0, 'beginner'))
+
+    def test_recommender_uses_catalog_only_with_min_matches(self):
+        questionnare = ai_logic.load('questionnare')
+        user_inputs = {'learning_goal': 'Machine Learning', 'learning_level': 'beginner', 'expectations': '',
+                       'career_pursuit': True, 'occupation': 'student', 'completion_time': 12}
+        with mock.patch.object(self.course_catalog, 'get_catalog', return_value=self.catalog):
+            with mock.patch.object(self.course_catalog, 'MIN_MATCHES', 2):
+                self.assertIsNone(questionnare.catalog_courses(user_inputs))
+                self.assertEqual(questionnare.plan_request(user_inputs)[0], 'course_recommendations')
+            with mock.patch.object(self.course_catalog, 'MIN_MATCHES', 1):
+                pipeline, prompt, courses = questionnare.plan_request(user_inputs)
+        self.assertEqual(pipeline, 'course_narrative')
+        self.assertEqual([course['title'] for course in courses], ['Machine Learning Specialization'])
+        self.assertIn('Machine Learning Specialization', prompt)
+
+
+class SkillCanonTests(SimpleTestCase):
+    def setUp(self):
+        self.skill_canon = ai_logic.load('skill_canon')
+
+    def test_aliases(self):
+        for text, name in [('JS', 'JavaScript'), ('java script', 'JavaScript'), ('reactjs', 'React'),
+                           ('ML', 'Machine Learning'), ('mongodb', 'MongoDB')]:
+            with self.subTest(text=text):
+                self.assertEqual(self.skill_canon.canonicalize(text).name, name)
+
+    def test_typos_of_long_names(self):
+        for text, name in [('pyhton', 'Python'), ('javscript', 'JavaScript'), ('kubernets', 'Kubernetes'),
+                           ('machine lerning', 'Machine Learning'), ('Djnago', 'Django')]:
+            with self.subTest(text=text):
+                match = self.skill_canon.canonicalize(text)
+                self.assertEqual((match.name, match.method), (name, 'fuzzy'))
+
+    def test_near_misses_stay_distinct(self):
+        # Real skills one edit away from a known one must not be merged into it
+        for text, wrong in [('Jest', 'REST APIs'), ('Nest', 'REST APIs'), ('Flash', 'Flask'), ('reat', 'React'),
+                            ('Scala', 'Scalability')]:
+            with self.subTest(text=text):
+                match = self.skill_canon.canonicalize(text)
+                self.assertNotEqual(match.name, wrong)
+                self.assertEqual(match.method, 'new')
+
+    def test_unknown_skill_keeps_spelling(self):
+        self.assertEqual(self.skill_canon.canonicalize('quantum basket weaving').name, 'Quantum Basket Weaving')
+
+    def test_canonicalize_entries_merges_duplicates(self):
+        entries = self.skill_canon.canonicalize_entries([
+            {'skill': 'js', 'years_experience': 2},
+            {'skill': 'JavaScript', 'proficiency_level': 'advanced'},
+            {'skill': 'Python'},
+        ])
+        self.assertEqual([entry['skill'] for entry in entries], ['JavaScript', 'Python'])
+        self.assertEqual(entries[0]['years_experience'], 2)
+        self.assertEqual(entries[0]['proficiency_level'], 'advanced')
+        self.assertEqual(entries[0]['skill_id'], self.skill_canon.canonicalize('javascript').id)
+
+    def test_canonical_names_dedupes_in_order(self):
+        self.assertEqual(self.skill_canon.canonical_names(['Python', 'JS', 'python ', 'javascript', '']),
+                         ['Python', 'JavaScript'])
+
+
+COURSES_DOCUMENT = (
+    '{"needs_analysis": "Needs \\"SQL\\" and \\\\ paths", "recommended_courses": ['
+    '{"title": "SQL \\u00e9tape 1", "weeks": 4}, {"title": "Spark [advanced]", "weeks": 6}, '
+    '{"title": "dbt", "weeks": 2}]}'
+)
+COURSES_RESPONSE = f'Here are [3] courses {{as asked}}:\n```json\n{COURSES_DOCUMENT}\n```'
+COURSE_PATHS = ('needs_analysis', 'recommended_courses.*')
+
+
+class JsonStreamTests(SimpleTestCase):
+    def setUp(self):
+        self.json_stream = ai_logic.load('json_stream')
+        document = json.loads(COURSES_DOCUMENT)
+        self.expected = [('needs_analysis', document['needs_analysis'])] + [
+            ('recommended_courses.*', course) for course in document['recommended_courses']]
+
+    def feed(self, chunks, paths=COURSE_PATHS):
+        parser = self.json_stream.IncrementalJsonParser(paths)
+        return [item for chunk in chunks for item in parser.feed(chunk)]
+
+    def test_preamble_with_brackets_is_skipped(self):
+        self.assertEqual(self.feed([COURSES_RESPONSE]), self.expected)
+
+    def test_any_chunk_boundary(self):
+        # Splits land inside keys, strings, escapes and the preamble's brackets
+        for split in range(1, len(COURSES_RESPONSE)):
+            with self.subTest(split=split):
+                self.assertEqual(self.feed([COURSES_RESPONSE[:split], COURSES_RESPONSE[split:]]), self.expected)
+        self.assertEqual(self.feed(list(COURSES_RESPONSE)), self.expected)
+
+    def test_nested_paths_and_array_documents(self):
+        text = '{"learning_path": [{"level": "Beginner", "courses": [{"t": 1}, {"t": 2}]}]}'
+        items = self.feed([text], ('learning_path.*.level', 'learning_path.*.courses.*'))
+        self.assertEqual(items, [('learning_path.*.level', 'Beginner'), ('learning_path.*.courses.*', {'t': 1}),
+                                 ('learning_path.*.courses.*', {'t': 2})])
+        self.assertEqual(self.feed(['See [note]: [{"t": 1}]'], ('*',)), [('*', {'t': 1})])
+
+    def test_document_is_the_full_text(self):
+        items = list(self.json_stream.iter_items(iter([COURSES_RESPONSE]), COURSE_PATHS + (self.json_stream.DOCUMENT,)))
+        self.assertEqual(items[:-1], self.expected)
+        self.assertEqual(items[-1], (self.json_stream.DOCUMENT, COURSES_RESPONSE))
+
+    def test_limit_counts_only_array_items(self):
+        closed = []
+
+        def chunks():
+            try:
+                yield from COURSES_RESPONSE
+            finally:
+                closed.append(True)
+
+        items = list(self.json_stream.iter_items(chunks(), COURSE_PATHS + (self.json_stream.DOCUMENT,), limit=2))
+        self.assertEqual(items, self.expected[:3])
+        self.assertEqual(closed, [True])
+
+    def test_close_on_early_exit(self):
+        closed = []
+
+        def chunks():
+            try:
+                yield from COURSES_RESPONSE
+            finally:
+                closed.append('sync')
+
+        async def achunks():
+            try:
+                for c in COURSES_RESPONSE:
+                    yield c
+            finally:
+                closed.append('async')
+
+        items = self.json_stream.iter_items(chunks(), COURSE_PATHS)
+        self.assertEqual(next(items), self.expected[0])
+        items.close()
+
+        async def read_one():
+            items = self.json_stream.aiter_items(achunks(), COURSE_PATHS)
+            self.assertEqual(await items.__anext__(), self.expected[0])
+            await items.aclose()
+
+        asyncio.run(read_one())
+        self.assertEqual(closed, ['sync', 'async'])
+
+    def test_closing_a_pipeline_stream_closes_the_model_stream(self):
+        closed = []
+
+        async def model_stream(*args, **kwargs):
+            try:
+                for c in '{"recommended_projects": [{"title": "ETL"}, {"title": "Dashboard"}]}':
+                    yield c
+            finally:
+                closed.append(True)
+
+        async def read_one():
+            stream = projects.stream_project_recommendations_async([], 'Data', 'beginner')
+            self.assertEqual(await stream.__anext__(), ('recommended_projects.*', {'title': 'ETL'}))
+            await stream.aclose()
+            self.assertEqual(closed, [True])  # right away, not when the generator is collected
+
+        projects = ai_logic.load('projects')
+        with mock.patch.object(projects, 'stream_text_async', model_stream):
+            asyncio.run(read_one())
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        self.singleflight = ai_logic.load('singleflight')
+        self.flight = self.singleflight.SingleFlight()
+
+    def test_concurrent_callers_share_one_call(self):
+        calls = []
+        release = threading.Event()
+
+        def work():
+            calls.append(1)
+            release.wait(5)
+            return 'answer'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.flight.do('key', work))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while self.flight.stats()['collapsed'] < 4:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, ['answer'] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.flight.stats(), {'calls': 1, 'collapsed': 4, 'in_flight': 0})
+        # Once finished, the key runs again
+        self.assertEqual(self.flight.do('key', lambda: 'fresh'), 'fresh')
+
+    def test_errors_reach_every_waiter(self):
+        async def scenario():
+            started = asyncio.Event()
+
+            async def fail():
+                started.set()
+                await asyncio.sleep(0.01)
+                raise ValueError('boom')
+
+            leader = asyncio.create_task(self.flight.do_async('key', fail))
+            await started.wait()
+            follower = asyncio.create_task(self.flight.do_async('key', fail))
+            for task in (leader, follower):
+                with self.assertRaisesRegex(ValueError, 'boom'):
+                    await task
+
+        asyncio.run(scenario())
+
+    def test_cancelled_leader_and_follower_timeout(self):
+        async def scenario():
+            started = asyncio.Event()
+            calls = []
+
+            async def slow():
+                calls.append(len(calls))
+                started.set()
+                await asyncio.sleep(10 if len(calls) == 1 else 0.01)
+                return len(calls)
+
+            leader = asyncio.create_task(self.flight.do_async('key', slow))
+            await started.wait()
+            with self.assertRaises(TimeoutError):
+                await self.flight.do_async('key', slow, timeout=0.01)
+            followers = [asyncio.create_task(self.flight.do_async('key', slow)) for _ in range(3)]
+            await asyncio.sleep(0)
+            leader.cancel()
+            # The followers don't inherit the cancellation: one of them reruns the call for all
+            self.assertEqual(await asyncio.gather(*followers), [2, 2, 2])
+            self.assertEqual(calls, [0, 1])
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+
+        asyncio.run(scenario())
+        self.assertEqual(self.flight.stats()['in_flight'], 0)
+
+    def test_thread_followers_retry_after_interrupted_leader(self):
+        class Interrupted(BaseException):
+            pass
+
+        started, release = threading.Event(), threading.Event()
+
+        def interrupted():
+            started.set()
+            release.wait(5)
+            raise Interrupted()
+
+        def leader():
+            with self.assertRaises(Interrupted):
+                self.flight.do('key', interrupted)
+
+        thread = threading.Thread(target=leader)
+        thread.start()
+        started.wait(5)
+        threading.Timer(0.02, release.set).start()
+        self.assertEqual(self.flight.do('key', lambda: 'fresh', timeout=5), 'fresh')
+        thread.join()
+        self.assertEqual(self.flight.stats(), {'calls': 2, 'collapsed': 1, 'in_flight': 0})
+
+
+class RateLimitStreamTests(SimpleTestCase):
+    def setUp(self):
+        rate_limit = ai_logic.load('rate_limit')
+        self.limiter = rate_limit.ModelLimiter('test-model', 6000, 10 ** 9)
+
+    def test_stream_holds_slot_until_exhausted(self):
+        stream = self.limiter.stream(lambda: iter([1, 2, 3]), 'prompt')
+        self.assertEqual(self.limiter.in_flight, 1)
+        self.assertEqual(next(stream), 1)
+        self.assertEqual(self.limiter.in_flight, 1)
+        self.assertEqual(list(stream), [2, 3])
+        self.assertEqual(self.limiter.in_flight, 0)
+        self.assertGreater(self.limiter.limit, 4)
+
+    def test_closed_stream_releases_without_latency(self):
+        stream = self.limiter.stream(lambda: iter([1, 2, 3]), 'prompt')
+        next(stream)
+        stream.close()
+        stream.close()
+        self.assertEqual(self.limiter.in_flight, 0)
+        self.assertEqual(self.limiter.limit, 4)
+
+    def test_async_stream_and_cancelled_call_release(self):
+        async def chunks():
+            yield 1
+            yield 2
+
+        async def start():
+            return chunks()
+
+        async def scenario():
+            stream = await self.limiter.stream_async(start, 'prompt')
+            self.assertEqual(await stream.__anext__(), 1)
+            self.assertEqual(self.limiter.in_flight, 1)
+            await stream.aclose()
+            task = asyncio.create_task(self.limiter.call_async(lambda: asyncio.sleep(10), 'prompt'))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(scenario())
+        self.assertEqual(self.limiter.in_flight, 0)
+
+    def test_interrupted_call_releases(self):
+        def interrupted():
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            self.limiter.call(interrupted, 'prompt')
+        self.assertEqual(self.limiter.in_flight, 0)
+
+
+class BatchRunnerTests(SimpleTestCase):
+    def setUp(self):
+        self.batch_runner = ai_logic.load('batch_runner')
+        self.llm_client = ai_logic.load('llm_client')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.input_path, self.output_path = f'{directory.name}/profiles.jsonl', f'{directory.name}/results.jsonl'
+        # run_batch raises the Gemini concurrency limit to its own
+        patcher = mock.patch.object(self.llm_client, 'MAX_CONCURRENCY', self.llm_client.MAX_CONCURRENCY)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _write_input(self, *lines):
+        with open(self.input_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(line if isinstance(line, str) else json.dumps(line) for line in lines) + '\n')
+
+    def _run(self, failing=(), resume=True):
+        seen = []
+
+        async def run_profile(profile):
+            seen.append(profile['id'])
+            if profile['id'] in failing:
+                return {'error': 'quota exceeded'}
+            return {'courses': [profile['id']]}
+
+        with mock.patch.object(self.batch_runner, 'run_profile', run_profile):
+            stats = asyncio.run(self.batch_runner.run_batch(self.input_path, self.output_path, 2, resume=resume))
+        return stats, sorted(seen)
+
+    def _records(self):
+        with open(self.output_path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_resume_reruns_only_failed_and_unfinished_profiles(self):
+        self._write_input(*({'id': f'u{index}', 'pipeline': 'projects'} for index in range(1, 5)))
+        stats, seen = self._run(failing={'u2'})
+        self.assertEqual((stats['processed'], stats['failed'], seen), (4, 1, ['u1', 'u2', 'u3', 'u4']))
+        # A crash while writing u4's record again leaves a torn last line
+        records = self._records()
+        with open(self.output_path, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(record) + '\n' for record in records if record['id'] != 'u4')
+            f.write('{"id": "u4", "resu')
+
+        stats, seen = self._run()
+        self.assertEqual((stats['processed'], stats['skipped'], stats['failed'], seen), (2, 2, 0, ['u2', 'u4']))
+        with open(self.output_path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[3], '{"id": "u4", "resu')  # terminated, so the next record is whole
+        succeeded = {json.loads(line)['id'] for line in lines[4:] if 'result' in json.loads(line)}
+        self.assertEqual(succeeded, {'u2', 'u4'})
+
+    def test_no_resume_starts_over(self):
+        self._write_input({'id': 'u1'}, {'id': 'u2'})
+        self._run()
+        stats, seen = self._run(resume=False)
+        self.assertEqual((stats['skipped'], seen), (0, ['u1', 'u2']))
+        self.assertEqual(len(self._records()), 2)
+
+    def test_bad_lines_are_recorded_and_skipped(self):
+        self._write_input({'id': 'u1'}, 'not json', '["a list"]', {'pipeline': 'skills'})
+        stats, seen = self._run()
+        self.assertEqual((stats['processed'], stats['invalid'], seen), (2, 2, ['4', 'u1']))
+        errors = {record['line']: record['error'] for record in self._records() if 'line' in record}
+        self.assertIn('Invalid JSON on line 2', errors[2])
+        self.assertEqual(errors[3], 'Line 3 is not a JSON object')
+
+    def test_career_failure_message_is_an_error(self):
+        model = ai_logic.load('model')
+        with mock.patch.object(model, 'extract_skills_and_experience_async', mock.AsyncMock(return_value={})), \
+                mock.patch.object(model, 'generate_job_suggestions_async',
+                                  mock.AsyncMock(return_value=model.JOB_SUGGESTIONS_ERROR)):
+            result = asyncio.run(self.batch_runner.run_profile(
+                {'pipeline': 'career', 'profile_data': {}, 'target_industry': 'Fintech'}))
+        self.assertEqual(result['error'], model.JOB_SUGGESTIONS_ERROR)
+
+
+class JobQueueTests(SimpleTestCase):
+    def setUp(self):
+        self.job_queue = ai_logic.load('job_queue')
+        self.model = ai_logic.load('model')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.queue = self.job_queue.JobQueue(path=f'{directory.name}/jobs.sqlite3', retry_delay=0)
+        self.addCleanup(lambda: self.queue._conn and self.queue._conn.close())
+
+    def _enqueue(self, priority=0, max_attempts=None):
+        payload = {'extracted_data': {}, 'target_industry': 'Data Science'}
+        return self.queue.enqueue('job_suggestions', payload, priority=priority, max_attempts=max_attempts)
+
+    def _work(self, result=None, error=None, **options):
+        async def run_job(job):
+            if error is not None:
+                raise error
+            return result
+
+        worker = self.job_queue.Worker(self.queue, poll_interval=0.01, **options)
+        with mock.patch.object(self.job_queue, 'run_job', run_job):
+            return worker, asyncio.run(worker.run(until_empty=True))
+
+    def test_claim_by_priority_then_age(self):
+        first, urgent, second = self._enqueue(), self._enqueue(priority=5), self._enqueue()
+        claimed = [self.queue.claim('w')['id'] for _ in range(3)]
+        self.assertEqual(claimed, [urgent, first, second])
+        self.assertIsNone(self.queue.claim('w'))
+        self.assertEqual(self.queue.get(first)['attempts'], 1)
+
+    def test_expired_lease_is_claimed_again(self):
+        self.queue.lease_seconds = 0.05
+        job_id = self._enqueue(max_attempts=2)
+        self.assertEqual(self.queue.claim('dead')['id'], job_id)
+        self.assertIsNone(self.queue.claim('live'))
+        time.sleep(0.06)
+        job = self.queue.claim('live')
+        self.assertEqual((job['id'], job['attempts']), (job_id, 2))
+        self.assertFalse(self.queue.complete(job_id, 'dead', 'late'))
+        time.sleep(0.06)
+        self.assertIsNone(self.queue.claim('live'))
+        self.assertEqual(self.queue.get(job_id)['status'], self.job_queue.FAILED)
+
+    def test_failed_attempts_retry_with_backoff_then_fail(self):
+        self.queue.retry_delay = 10
+        job_id = self._enqueue(max_attempts=2)
+        self.queue.fail(self.queue.claim('w')['id'], 'w', 'boom')
+        job = self.queue.get(job_id)
+        self.assertEqual((job['status'], job['error']), (self.job_queue.QUEUED, 'boom'))
+        self.assertGreater(job['run_after'], time.time() + 9)
+        self.assertIsNone(self.queue.claim('w'))
+
+        self.queue.retry_delay = 0
+        with self.queue._lock:
+            self.queue._conn.execute('UPDATE ai_jobs SET run_after = 0')
+            self.queue._conn.commit()
+        self.queue.fail(self.queue.claim('w')['id'], 'w', 'boom again')
+        job = self.queue.get(job_id)
+        self.assertEqual((job['status'], job['error'], job['attempts']), (self.job_queue.FAILED, 'boom again', 2))
+
+    def test_worker_stores_results(self):
+        job_id = self._enqueue()
+        worker, stats = self._work(result='Data Scientist')
+        self.assertEqual(stats, {'processed': 1, 'failed': 0})
+        job = self.queue.get(job_id)
+        self.assertEqual((job['status'], job['result']), (self.job_queue.SUCCEEDED, 'Data Scientist'))
+
+    def test_worker_retries_error_messages_and_exceptions(self):
+        for failure in ({'result': self.model.JOB_SUGGESTIONS_ERROR}, {'result': {'error': 'bad response'}},
+                        {'error': RuntimeError('quota')}):
+            with self.subTest(**failure):
+                job_id = self._enqueue()
+                worker, stats = self._work(**failure)
+                self.assertEqual(stats, {'processed': 0, 'failed': 3})
+                job = self.queue.get(job_id)
+                self.assertEqual((job['status'], job['attempts']), (self.job_queue.FAILED, 3))
+                self.assertIsNone(job['result'])
+
+    def test_worker_survives_claim_errors(self):
+        job_id = self._enqueue()
+        claim = self.queue.claim
+        errors = iter([sqlite3.OperationalError('database is locked')] * 2)
+
+        def flaky_claim(worker):
+            error = next(errors, None)
+            if error is not None:
+                raise error
+            return claim(worker)
+
+        with mock.patch.object(self.queue, 'claim', flaky_claim), self.assertLogs(self.job_queue.logger, 'WARNING'):
+            worker, stats = self._work(result='ok')
+        self.assertEqual(stats, {'processed': 1, 'failed': 0})
+        self.assertEqual(self.queue.get(job_id)['status'], self.job_queue.SUCCEEDED)
+
+
+class ProfileCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.channel_path = f'{directory.name}/invalidations.sqlite3'
+        self.cache = profile_cache.ProfileCache(
+            channel=profile_cache.InvalidationChannel(self.channel_path), poll_interval=0)
+
+    def _cache(self, user_id, document):
+        self.cache.set(user_id, document, self.cache.version())
+
+    def test_int_and_str_ids_are_one_entry(self):
+        self._cache(42, {'user_id': 42, 'name': 'Ada'})
+        self.assertEqual(self.cache.get('42'), {'user_id': 42, 'name': 'Ada'})
+        self.cache.update('42', {'name': 'Grace'}, publish=False)
+        self.assertEqual(self.cache.get(42)['name'], 'Grace')
+        self.cache.invalidate('42')
+        self.assertIs(self.cache.get(42), profile_cache.MISSING)
+
+    def test_save_in_another_process_invalidates_int_id(self):
+        self._cache(42, {'user_id': 42, 'name': 'Ada'})
+        self.cache.get(42)  # connects to the channel, so only later saves are seen
+        script = ('import sys, profile_cache; '
+                  'cache = profile_cache.ProfileCache(channel=profile_cache.InvalidationChannel(sys.argv[1])); '
+                  'cache.update(42, {"name": "Grace"})')
+        subprocess.run([sys.executable, '-c', script, self.channel_path], check=True, cwd=settings.BASE_DIR)
+        self.assertIs(self.cache.get(42), profile_cache.MISSING)
+        self.assertEqual(self.cache.stats()['invalidations'], 1)
+
+
+class MongoClientTests(SimpleTestCase):
+    def setUp(self):
+        for name, value in (('MongoClient', mock.Mock(side_effect=lambda *args, **kwargs: mock.Mock())),
+                            ('_client', None), ('_client_pid', None)):
+            patcher = mock.patch.object(db_helpers, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @mock.patch.dict(os.environ, {'MONGODB_MAX_POOL_SIZE': '5'})
+    def test_one_pooled_client_per_process(self):
+        client = db_helpers.get_client()
+        self.assertIs(db_helpers.get_client(), client)
+        self.assertEqual(db_helpers.MongoClient.call_count, 1)
+        options = db_helpers.MongoClient.call_args.kwargs
+        self.assertEqual((options['connect'], options['maxPoolSize']), (False, 5))
+
+        db_helpers.close_client()
+        client.close.assert_called_once_with()
+        self.assertIsNot(db_helpers.get_client(), client)
+
+    def test_forked_child_gets_its_own_client(self):
+        parent_client = db_helpers.get_client()
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # The child must not reuse (or close) the parent's sockets
+            try:
+                inherited = db_helpers._client is None
+                fresh = db_helpers.get_client() is not parent_client
+                os.write(write_end, b'%d%d%d' % (inherited, fresh, parent_client.close.called))
+            finally:
+                os._exit(0)
+        os.close(write_end)
+        with os.fdopen(read_end, 'rb') as pipe:
+            self.assertEqual(pipe.read(), b'110')
+        os.waitpid(pid, 0)
+        self.assertIs(db_helpers.get_client(), parent_client)
+
+
+class MongoIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.db = mongomock.MongoClient().career_navigator
+        for name, value in (('_indexes_ready', False), ('_write_buffer', None),
+                            ('get_db_connection', mock.Mock(return_value=self.db))):
+            patcher = mock.patch.object(db_helpers, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_bootstrap_creates_missing_indexes(self):
+        self.assertEqual(len(db_helpers.verify_indexes(self.db)), 3)
+        self.assertEqual(db_helpers.ensure_indexes(self.db), [])
+        self.assertTrue(self.db.users.index_information()['user_id_unique']['unique'])
+        # Idempotent
+        self.assertEqual(db_helpers.ensure_indexes(self.db), [])
+
+    def test_non_unique_index_is_reported(self):
+        self.db.users.create_index('user_id', name='user_id_unique')
+        self.assertEqual(db_helpers.verify_indexes(self.db), [
+            'users.user_id_unique', 'career_paths.user_id_unique', 'learning_paths.user_id_unique'])
+
+    def test_bootstrap_runs_once_and_retries_transient_errors(self):
+        with mock.patch.object(db_helpers, 'ensure_indexes',
+                               side_effect=[db_helpers.PyMongoError('timed out'), []]) as ensure, \
+                self.assertLogs(db_helpers.logger, 'WARNING'):
+            for _ in range(3):
+                db_helpers._ensure_indexes_once(self.db)
+        self.assertEqual(ensure.call_count, 2)
+
+        db_helpers._indexes_ready = False
+        with mock.patch.object(db_helpers, 'ensure_indexes',
+                               side_effect=db_helpers.OperationFailure('duplicate key')) as ensure, \
+                self.assertLogs(db_helpers.logger, 'ERROR'):
+            for _ in range(2):
+                db_helpers._ensure_indexes_once(self.db)
+        self.assertEqual(ensure.call_count, 1)
+
+    @mock.patch.dict(os.environ, {'PROFILE_CACHE_DISABLE': '1'})
+    def test_projected_reads(self):
+        self.db.learning_paths.insert_one({'user_id': 'ada', 'recommendations': {'courses': []}, 'big': 'x' * 1000})
+        self.db.users.insert_one({'user_id': 'ada', 'name': 'Ada', 'skills': ['Python'], 'resume': 'x' * 1000})
+        self.assertEqual(db_helpers.find_user_document('learning_paths', 'ada', ['recommendations']),
+                         {'user_id': 'ada', 'recommendations': {'courses': []}})
+        self.assertEqual(db_helpers.get_learning_path('ada'), {'courses': []})
+        self.assertEqual(db_helpers.get_user_profile('ada', ['name']), {'user_id': 'ada', 'name': 'Ada'})
+        self.assertIn('resume', db_helpers.get_user_profile('ada'))
+
+    def test_projection_applies_to_buffered_writes(self):
+        self.db.users.insert_one({'user_id': 'ada', 'name': 'Ada'})
+        buffer = db_helpers.WriteBehindBuffer()
+        buffer._pending[('users', 'ada')] = {'name': 'Ada Lovelace', 'resume': 'x' * 1000}
+        with mock.patch.object(db_helpers, '_write_buffer', buffer):
+            self.assertEqual(db_helpers.find_user_document('users', 'ada', ['name']),
+                             {'user_id': 'ada', 'name': 'Ada Lovelace'})
+
+
+class FakeCollection:
+    """Records upserts like a MongoDB collection; fails every call while `down` is set."""
+
+    def __init__(self):
+        self.documents = {}
+        self.bulk_writes = []
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise db_helpers.PyMongoError('connection refused')
+
+    def bulk_write(self, operations, ordered=True):
+        self._check()
+        self.bulk_writes.append(len(operations))
+        for operation in operations:
+            self.update_one(operation._filter, operation._doc, upsert=True)
+
+    def update_one(self, query, update, upsert=False):
+        self._check()
+        self.documents.setdefault(query['user_id'], {}).update(update['$set'])
+
+
+class WriteBehindBufferTests(SimpleTestCase):
+    def setUp(self):
+        self.users = FakeCollection()
+        patcher = mock.patch.object(db_helpers, 'get_db_connection', return_value={'users': self.users})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.buffer = db_helpers.WriteBehindBuffer(batch_size=100, max_pending=2)
+        # The tests flush by hand, without the background flusher
+        patcher = mock.patch.object(self.buffer, '_ensure_thread')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_saves_to_one_user_are_coalesced(self):
+        written = []
+        self.buffer.upsert('users', 'ada', {'name': 'Ada'}, on_written=lambda: written.append(1))
+        self.buffer.upsert('users', 'ada', {'field': 'Data'}, on_written=lambda: written.append(2))
+        self.assertEqual(self.buffer.overlay('users', 'ada', None), {'user_id': 'ada', 'name': 'Ada', 'field': 'Data'})
+        self.buffer.flush()
+        self.assertEqual(self.users.bulk_writes, [1])
+        self.assertEqual(self.users.documents, {'ada': {'name': 'Ada', 'field': 'Data'}})
+        self.assertEqual(written, [1, 2])
+
+    def test_full_buffer_writes_through(self):
+        self.buffer.upsert('users', 'ada', {'name': 'Ada'})
+        self.buffer.upsert('users', 'alan', {'name': 'Alan'})
+        written = []
+        self.buffer.upsert('users', 'grace', {'name': 'Grace'}, on_written=lambda: written.append('grace'))
+        self.assertEqual((self.users.documents, written), ({'grace': {'name': 'Grace'}}, ['grace']))
+        self.buffer.upsert('users', 'ada', {'field': 'Data'})  # already queued, so still buffered
+        self.assertEqual(self.buffer.stats()['pending'], 2)
+        self.assertEqual(self.buffer.stats()['overflowed'], 1)
+
+        self.users.down = True
+        with self.assertRaises(db_helpers.PyMongoError):
+            self.buffer.upsert('users', 'linus', {'name': 'Linus'})
+        self.assertEqual(self.buffer.stats()['pending'], 2)
+
+    def test_failed_flushes_are_requeued_with_backoff(self):
+        self.buffer.flush_interval, self.buffer.max_backoff = 1, 3
+        self.users.down = True
+        delays = []
+        for name in ('Ada', 'Ada Lovelace', 'Ada King'):
+            self.buffer.upsert('users', 'ada', {'name': name})
+            with self.assertLogs(db_helpers.logger, 'WARNING'):
+                self.buffer.flush()
+            delays.append(self.buffer._retry_at - time.monotonic())
+        self.assertEqual([round(delay) for delay in delays], [2, 3, 3])
+        self.assertEqual(self.buffer.stats()['failed'], 3)
+
+        self.users.down = False
+        self.buffer.flush()
+        self.assertEqual(self.users.documents, {'ada': {'name': 'Ada King'}})
+        self.assertEqual((self.buffer.stats()['pending'], self.buffer._retry_at), (0, 0.0))
+
+
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        self.metrics = ai_logic.load('metrics')
+        self.llm_client = ai_logic.load('llm_client')
+
+    def _metric(self, metric):
+        self.addCleanup(self.metrics._metrics.remove, metric)
+        return metric
+
+    def _lines(self, prefix):
+        return [line for line in self.metrics.render().splitlines() if line.startswith(prefix)]
+
+    def test_counter_exposition(self):
+        counter = self._metric(self.metrics.Counter('test_events_total', 'Events.', ('kind',)))
+        counter.inc('say "hi"\n')
+        counter.inc('plain', amount=2.5)
+        self.assertEqual(self._lines('test_events_total'), [
+            'test_events_total{kind="say \\"hi\\"\\n"} 1',
+            'test_events_total{kind="plain"} 2.5',
+        ])
+        self.assertIn('# TYPE test_events_total counter', self.metrics.render())
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self._metric(self.metrics.Histogram('test_seconds', 'Latency.', ('op',), buckets=(0.1, 1.0)))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, 'find')
+        self.assertEqual(self._lines('test_seconds'), [
+            'test_seconds_bucket{op="find",le="0.1"} 2',
+            'test_seconds_bucket{op="find",le="1"} 3',
+            'test_seconds_bucket{op="find",le="+Inf"} 4',
+            'test_seconds_sum{op="find"} 3.65',
+            'test_seconds_count{op="find"} 4',
+        ])
+
+    def test_timer_counts_errors_and_skips_cancellation(self):
+        histogram = self._metric(self.metrics.Histogram('test_call_seconds', 'Latency.', ('op',)))
+        errors = self._metric(self.metrics.Counter('test_call_errors_total', 'Errors.', ('op',)))
+        with histogram.time('call', errors=errors):
+            pass
+        with self.assertRaises(ValueError), histogram.time('call', errors=errors):
+            raise ValueError()
+        with self.assertRaises(asyncio.CancelledError), histogram.time('call', errors=errors):
+            raise asyncio.CancelledError()
+        self.assertEqual((histogram.count('call'), errors.value('call')), (1, 1))
+
+    def test_disabled_metrics_record_nothing(self):
+        counter = self._metric(self.metrics.Counter('test_disabled_total', 'Events.'))
+        self.metrics.set_enabled(False)
+        self.addCleanup(self.metrics.set_enabled, True)
+        counter.inc()
+        self.assertEqual(counter.value(), 0)
+
+    def test_collectors_are_read_at_scrape_time_and_failures_skipped(self):
+        stats = {'entries': 3}
+
+        def broken():
+            raise RuntimeError('gone')
+
+        def collect():
+            return [('test_cache_entries', 'gauge', 'Entries.', (), {(): stats['entries']})]
+
+        for collector in (broken, collect):
+            self.metrics.register_collector(collector)
+            self.addCleanup(self.metrics._collectors.remove, collector)
+        stats['entries'] = 5
+        with self.assertLogs(self.metrics.logger, 'WARNING'):
+            self.assertEqual(self._lines('test_cache_entries'), ['test_cache_entries 5'])
+
+    def test_gemini_calls_show_up_at_the_endpoint(self):
+        labels = ('job_suggestions', 'test-model', 'false')
+        before = self.metrics.LLM_REQUEST_SECONDS.count(*labels)
+        self.llm_client.generate_text(FakeModel(), 'Suggest jobs', 'job_suggestions', bypass_cache=True)
+        self.assertEqual(self.metrics.LLM_REQUEST_SECONDS.count(*labels), before + 1)
+        with mock.patch.dict(os.environ, {'METRICS_TOKEN': 'scrape'}):
+            self.assertEqual(self.client.get('/metrics/').status_code, 401)
+            response = self.client.get('/metrics/', headers={'Authorization': 'Bearer scrape'})
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn(f'llm_request_seconds_count{{pipeline="job_suggestions",model="test-model",stream="false"}} '
+                      f'{before + 1}', body)
+        self.assertIn('llm_cache_lookups_total{pipeline="job_suggestions",result="bypass"}', body)
+
+
+class LinkedInClientTests(SimpleTestCase):
+    def setUp(self):
+        from benchmarks import fakes
+
+        self.linkedin_client = ai_logic.load('linkedin_client')
+        self.fake = fakes.FakeLinkedIn().start()
+        self.addCleanup(self.fake.stop)
+        patcher = mock.patch.dict(os.environ, {
+            'LINKEDIN_OAUTH_URL': self.fake.oauth_url, 'LINKEDIN_API_URL': self.fake.api_url})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.linkedin_client.close_session()
+        self.addCleanup(self.linkedin_client.close_session)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'tokens.sqlite3')
+        self.store = self._use_store()
+
+    def _use_store(self):
+        # A new store on the same file stands in for a later run of the program
+        store = self.linkedin_client.TokenStore(path=self.path)
+        self.addCleanup(store.close)
+        previous = self.linkedin_client.set_store(store)
+        self.addCleanup(self.linkedin_client.set_store, previous)
+        return store
+
+    def test_a_stored_token_is_reused_by_a_later_run(self):
+        token = self.linkedin_client.exchange_code('code-1', 'client', 'secret', 'http://localhost/callback')
+        self._use_store()
+        self.assertEqual(self.linkedin_client.cached_access_token('client', 'secret'), token)
+        self.assertEqual(self.fake.stats['grants'], 1)
+        self.assertIsNone(self.linkedin_client.cached_access_token('another client', 'secret'))
+
+    def test_an_expiring_token_is_refreshed(self):
+        self.fake.expires_in = self.linkedin_client.EXPIRY_MARGIN - 1
+        token = self.linkedin_client.exchange_code('code-1', 'client', 'secret', 'http://localhost/callback')
+        refreshed = self.linkedin_client.cached_access_token('client', 'secret')
+        self.assertIsNotNone(refreshed)
+        self.assertNotEqual(refreshed, token)
+        self.assertEqual(self.fake.stats['grants'], 2)
+        # Without the secret there is no refresh, and the expired token is forgotten
+        self.assertIsNone(self.linkedin_client.cached_access_token('client'))
+        self.assertIsNone(self.store.get_token('client'))
+
+    def test_a_redeemed_code_is_not_retried(self):
+        import requests
+
+        self.linkedin_client.exchange_code('code-1', 'client', 'secret', 'http://localhost/callback')
+        with self.assertRaises(requests.HTTPError) as raised:
+            self.linkedin_client.exchange_code('code-1', 'client', 'secret', 'http://localhost/callback')
+        self.assertEqual(raised.exception.response.status_code, 400)
+        self.assertEqual(self.fake.stats['requests'], 2)
+
+    def test_profiles_are_revalidated_over_one_pooled_connection(self):
+        token = self.linkedin_client.exchange_code('code-1', 'client', 'secret', 'http://localhost/callback')
+        self.fake.fail(1)
+        first = self.linkedin_client.get_profile(token)
+        second = self.linkedin_client.get_profile(token)
+        self.assertEqual(first, self.fake.profile)
+        self.assertEqual(second, first)
+        # The token request, the 503, the retried GET and the 304 all share a connection
+        self.assertEqual(self.fake.stats, {'requests': 4, 'connections': 1, 'grants': 1, 'not_modified': 1})
+
+    def test_a_rejected_token_is_forgotten(self):
+        import requests
+
+        self.linkedin_client.exchange_code('code-1', 'client', 'secret', 'http://localhost/callback')
+        self.store.save_token('client', {'access_token': 'revoked', 'expires_in': 3600})
+        with self.assertRaises(requests.HTTPError):
+            self.linkedin_client.get_profile('revoked')
+        self.assertIsNone(self.store.get_token('client'))
+
+
+@mock.patch.dict(os.environ, {'API_TOKEN': 'test-token'})
+class TracingTests(SimpleTestCase):
+    TRACE_ID, PARENT_ID = '4bf92f3577b34da6a3ce929d0e0e4736', '00f067aa0ba902b7'
+
+    def setUp(self):
+        self.tracing = ai_logic.load('tracing')
+        self.exporter = self.tracing.MemoryExporter()
+        previous = self.tracing.set_exporter(self.exporter)
+        self.addCleanup(self.tracing.set_exporter, previous)
+
+    def _spans(self, trace):
+        return {span['name']: span for span in trace['spans']}
+
+    def test_spans_follow_tasks_and_threads(self):
+        def in_thread():
+            with self.tracing.span('in thread'):
+                pass
+
+        async def in_task():
+            with self.tracing.span('in task'):
+                await asyncio.sleep(0)
+
+        async def scenario():
+            with self.tracing.start_trace('root'):
+                with self.tracing.span('outer'):
+                    await asyncio.gather(asyncio.to_thread(in_thread), asyncio.create_task(in_task()))
+                with self.assertRaises(ValueError), self.tracing.span('failing'):
+                    raise ValueError('boom')
+
+        asyncio.run(scenario())
+        [trace] = self.exporter.traces()
+        spans = self._spans(trace)
+        self.assertEqual(spans['outer']['parent_span_id'], spans['root']['span_id'])
+        for name in ('in thread', 'in task'):
+            self.assertEqual(spans[name]['parent_span_id'], spans['outer']['span_id'])
+        self.assertEqual(spans['failing']['status'], {'code': 'ERROR', 'message': 'ValueError: boom'})
+        self.assertEqual({span['trace_id'] for span in trace['spans']}, {trace['trace_id']})
+        self.assertIs(self.tracing.span('outside any trace'), self.tracing.NO_SPAN)
+
+    def test_request_continues_the_callers_trace_through_the_pipeline(self):
+        model, llm_client, response_cache = (ai_logic.load(name) for name in ('model', 'llm_client', 'response_cache'))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache = response_cache.ResponseCache(path=f'{directory.name}/cache.sqlite3')
+        with mock.patch.object(model, 'model', FakeModel()), mock.patch.object(llm_client, '_cache', cache):
+            response = self.client.post(
+                '/api/job-suggestions/', data=json.dumps({'extracted_data': {}, 'target_industry': 'Fintech'}),
+                content_type='application/json', headers={
+                    'Authorization': 'Bearer test-token', 'traceparent': f'00-{self.TRACE_ID}-{self.PARENT_ID}-01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Trace-ID'], self.TRACE_ID)
+        [trace] = self.exporter.traces()
+        self.assertEqual((trace['trace_id'], trace['name']), (self.TRACE_ID, 'POST /api/job-suggestions/'))
+        spans = self._spans(trace)
+        self.assertEqual(spans['POST /api/job-suggestions/']['parent_span_id'], self.PARENT_ID)
+        by_id = {span['span_id']: span for span in trace['spans']}
+        for name in ('prompt.build', 'llm.generate', 'gemini.generate_content', 'serialize'):
+            with self.subTest(span=name):
+                ancestor = spans[name]
+                while ancestor['parent_span_id'] in by_id:
+                    ancestor = by_id[ancestor['parent_span_id']]
+                self.assertEqual(ancestor['name'], 'POST /api/job-suggestions/')
+        self.assertEqual(spans['llm.generate']['attributes']['cache'], 'miss')
+
+    def test_malformed_traceparent_starts_a_new_trace(self):
+        response = self.client.get('/api/jobs/abc/', headers={'traceparent': f'00-{"0" * 32}-{self.PARENT_ID}-01'})
+        self.assertNotEqual(response['X-Trace-ID'], '0' * 32)
+        [trace] = self.exporter.traces()
+        self.assertIsNone(trace['spans'][0]['parent_span_id'])
+        self.assertEqual(trace['attributes']['status_code'], 401)
+
+    async def test_streaming_request_span_ends_with_the_stream(self):
+        async def chunks(extracted_data, target_industry):
+            yield 'Data '
+            await asyncio.sleep(0.02)
+            yield 'Engineer'
+
+        model = await ai_logic.load_async('model')
+        with mock.patch.object(model, 'stream_job_suggestions_async', chunks):
+            response = await self.async_client.post(
+                '/api/stream/job-suggestions/', data=json.dumps({'extracted_data': {}, 'target_industry': 'Fintech'}),
+                content_type='application/json', headers={'Authorization': 'Bearer test-token'})
+            self.assertEqual(self.exporter.traces(), [])
+            body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(body, b'Data Engineer')
+        [trace] = self.exporter.traces()
+        self.assertGreaterEqual(trace['duration_ms'], 20)
+
+
+class SseRelayTests(SimpleTestCase):
+    def _collect(self, events, **options):
+        async def scenario():
+            return [message async for message in sse.relay(events, **options)]
+
+        return asyncio.run(scenario())
+
+    def test_heartbeats_while_waiting_then_numbered_events(self):
+        async def events():
+            await asyncio.sleep(0.05)
+            yield 'chunk', {'text': 'Data'}
+            yield 'chunk', {'text': ' Engineer'}
+
+        messages = self._collect(events(), heartbeat=0.01)
+        self.assertEqual(messages[0], f'retry: {sse.RETRY_MS}\n\n')
+        self.assertIn(': heartbeat\n\n', messages[1:-3])
+        self.assertEqual(messages[-3:], [
+            'id: 1\nevent: chunk\ndata: {"text": "Data"}\n\n',
+            'id: 2\nevent: chunk\ndata: {"text": " Engineer"}\n\n',
+            'id: 3\nevent: done\ndata: {}\n\n',
+        ])
+
+    def test_pipeline_failure_becomes_an_error_event(self):
+        async def events():
+            yield 'item', {'path': 'courses', 'value': 1}
+            raise RuntimeError('quota')
+
+        with self.assertLogs(sse.logger, 'ERROR'):
+            messages = self._collect(events())
+        self.assertEqual([message.split('\n')[1] for message in messages[1:]],
+                         ['event: item', 'event: error', 'event: done'])
+
+    def test_disconnect_stops_and_closes_the_pipeline(self):
+        produced = []
+        closed = asyncio.Event()
+
+        async def events():
+            try:
+                for index in range(1000):
+                    produced.append(index)
+                    yield 'chunk', {'text': str(index)}
+            finally:
+                closed.set()
+
+        async def scenario():
+            stream = sse.relay(events(), buffer=4)
+            async for message in stream:
+                if message.startswith('id: 2\n'):
+                    break
+            # Django closes the response's iterator when the client goes away
+            await stream.aclose()
+            self.assertTrue(closed.is_set())
+
+        asyncio.run(scenario())
+        # The bounded queue stopped the producer long before the end of the stream
+        self.assertLess(len(produced), 10)
+
+
+class AppLoggingTests(SimpleTestCase):
+    def _record(self, name='myapp', level=logging.INFO, msg='hello %s', args=('world',), **extra):
+        return logging.makeLogRecord({'name': name, 'levelno': level, 'levelname': logging.getLevelName(level),
+                                      'msg': msg, 'args': args, **extra})
+
+    def test_json_lines_carry_context_and_extra_fields(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        handler = app_logging.QueueListenerHandler(f'{directory.name}/logs/app.log', console=False)
+        handler.addFilter(app_logging.ContextFilter())
+        tokens = app_logging.bind_context('req-1', 42)
+        try:
+            handler.handle(self._record(pipeline='learning_path'))
+            try:
+                raise ValueError('boom')
+            except ValueError:
+                handler.handle(self._record(level=logging.ERROR, msg='failed', args=(), exc_info=sys.exc_info()))
+        finally:
+            app_logging.reset_context(tokens)
+        handler.close()  # writes out the queue
+        with open(f'{directory.name}/logs/app.log', encoding='utf-8') as f:
+            first, second = [json.loads(line) for line in f]
+        fields = ('level', 'logger', 'message', 'request_id', 'user_id', 'pipeline')
+        self.assertEqual({key: first[key] for key in fields},
+                         {'level': 'INFO', 'logger': 'myapp', 'message': 'hello world', 'request_id': 'req-1',
+                          'user_id': 42, 'pipeline': 'learning_path'})
+        self.assertIn('ValueError: boom', second['exc'])
+
+    def test_full_queue_drops_and_reports(self):
+        handler = app_logging.QueueListenerHandler(console=False, queue_size=2)
+        self.addCleanup(handler.close)
+        # With the listener stopped nothing drains the queue
+        handler.listener.stop()
+        handler.listener = None
+        for _ in range(5):
+            handler.handle(self._record())
+        self.assertEqual(handler.dropped, 3)
+        handler.queue.get_nowait()
+        handler.queue.get_nowait()
+        handler.handle(self._record(msg='after', args=()))
+        messages = [handler.queue.get_nowait().getMessage() for _ in range(2)]
+        self.assertEqual(messages, ['after', 'Log queue was full, dropped 3 records'])
+
+    def test_sampling_keeps_a_fraction_of_debug_only(self):
+        sampling = app_logging.SamplingFilter(rate=1.0, rates={'django.db': 0.5, 'django.db.backends': 0.0})
+        self.assertTrue(sampling.filter(self._record('django.db.backends.schema', logging.WARNING)))
+        self.assertFalse(sampling.filter(self._record('django.db.backends.schema', logging.DEBUG)))
+        self.assertTrue(sampling.filter(self._record('myapp', logging.DEBUG)))
+        with mock.patch.object(app_logging.random, 'random', side_effect=[0.3, 0.7]):
+            kept = [sampling.filter(self._record('django.db.models', logging.DEBUG)) for _ in range(2)]
+        self.assertEqual(kept, [True, False])
+        self.assertEqual(sampling.dropped, 2)
+
+    @mock.patch.dict(os.environ, {'LOG_LEVELS': 'myapp=debug,django.request=error',
+                                  'LOG_SAMPLE_RATES': 'myapp=0.1', 'LOG_ROTATION': 'time'})
+    def test_config_reads_the_environment(self):
+        config = app_logging.logging_config('app.log', 'WARNING')
+        self.assertEqual(config['root']['level'], 'WARNING')
+        self.assertEqual(config['loggers'], {'myapp': {'level': 'DEBUG'}, 'django.request': {'level': 'ERROR'}})
+        self.assertEqual(config['filters']['sampling']['rates'], {'django.db.backends': 0.01, 'myapp': 0.1})
+        self.assertEqual(config['handlers']['queue']['rotation'], 'time')
+
+    def test_sql_queries_are_sampled_not_silenced(self):
+        self.assertTrue(logging.getLogger('django.db.backends').isEnabledFor(logging.DEBUG))
+        config = settings.LOGGING['filters']['sampling']
+        sampling = app_logging.SamplingFilter(config['rate'], config['rates'])
+        self.assertEqual(sampling.rate_for('django.db.backends'), 0.01)
+
+
+@mock.patch.dict(os.environ, {'API_TOKEN': 'test-token'})
+class ApiViewTests(SimpleTestCase):
+    def post(self, url, body, token='test-token'):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        return self.client.post(url, data=json.dumps(body), content_type='application/json', headers=headers)
+
+    def test_requires_session_or_token(self):
+        for token in (None, 'wrong-token'):
+            with self.subTest(token=token):
+                response = self.post('/api/learning-path/', {}, token=token)
+                self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.client.get('/api/jobs/abc/').status_code, 401)
+        self.assertEqual(self.post('/api/events/learning-path/', {}, token=None).status_code, 401)
+
+    def test_token_requests_skip_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        response = client.post('/api/learning-path/', data='{}', content_type='application/json',
+                               HTTP_AUTHORIZATION='Bearer test-token')
+        self.assertEqual(response.status_code, 400)  # past auth and CSRF, stopped by validation
+        response = client.post('/api/learning-path/', data='{}', content_type='application/json',
+                               HTTP_AUTHORIZATION='Bearer wrong-token')
+        self.assertEqual(response.status_code, 401)
+
+    def test_missing_and_malformed_fields_are_400(self):
+        cases = [
+            ('/api/learning-path/', {'extracted_data': {}}, 'job_choice required'),
+            ('/api/learning-path/', {'extracted_data': 'Python', 'job_choice': 'Data Engineer'},
+             'extracted_data must be a JSON object'),
+            ('/api/course-recommendations/', {'user_inputs': {'learning_goal': 'Python'}},
+             'user_inputs.learning_level must be a string'),
+            ('/api/course-recommendations/', {'user_inputs': {
+                'learning_goal': 'Python', 'learning_level': 'beginner', 'expectations': '', 'career_pursuit': True,
+                'occupation': 'student', 'completion_time': True}}, 'user_inputs.completion_time must be an integer'),
+            ('/api/skills-course-recommendations/', {'skills_data': {'technical_skills': 'Python'},
+                                                     'target_field': 'Data'},
+             'skills_data.technical_skills must be a list of JSON objects'),
+            ('/api/project-recommendations/', {'completed_courses': ['SQL'], 'field': 'Data',
+                                               'experience_level': 'beginner'},
+             'completed_courses must be a list of JSON objects'),
+            ('/api/stream/learning-path/', {'extracted_data': {}, 'job_choice': 3}, 'job_choice must be a string'),
+            ('/api/jobs/', {'kind': 'learning_path', 'payload': {'extracted_data': []}},
+             'payload.extracted_data must be a JSON object; payload.job_choice required'),
+            ('/api/jobs/', {'kind': ['learning_path'], 'payload': {}}, 'Unknown job kind'),
+        ]
+        for url, body, message in cases:
+            with self.subTest(url=url, body=body):
+                response = self.post(url, body)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(message, response.json()['error'])
+
+    def test_text_failure_messages_are_502(self):
+        model = ai_logic.load('model')
+        body = {'extracted_data': {}, 'target_industry': 'Fintech'}
+        with mock.patch.object(model, 'generate_job_suggestions_async',
+                               mock.AsyncMock(return_value=model.JOB_SUGGESTIONS_ERROR)):
+            response = self.post('/api/job-suggestions/', body)
+            self.assertEqual(response.status_code, 502)
+            self.assertEqual(response.json(), {'error': model.JOB_SUGGESTIONS_ERROR})
+        with mock.patch.object(model, 'generate_job_suggestions_async', mock.AsyncMock(return_value='Data Engineer')):
+            response = self.post('/api/job-suggestions/', body)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {'job_suggestions': 'Data Engineer'})
+
+    async def test_event_stream_endpoint(self):
+        async def chunks(extracted_data, job_choice):
+            yield 'Learn SQL'
+
+        model = await ai_logic.load_async('model')
+        with mock.patch.object(model, 'stream_learning_path_async', chunks):
+            response = await self.async_client.post(
+                '/api/events/learning-path/', data=json.dumps({'extracted_data': {}, 'job_choice': 'Data Engineer'}),
+                content_type='application/json', headers={'Authorization': 'Bearer test-token'})
+            self.assertEqual((response['Content-Type'], response['Cache-Control']), ('text/event-stream', 'no-cache'))
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn('event: chunk\ndata: {"text": "Learn SQL"}\n\n', body)
+        self.assertTrue(body.endswith('event: done\ndata: {}\n\n'))
+        response = await self.async_client.post(
+            '/api/events/unknown/', data='{}', content_type='application/json',
+            headers={'Authorization': 'Bearer test-token'})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_text_streams_are_async(self):
+        # A sync iterator would be buffered whole under ASGI
+        async def chunks(extracted_data, target_industry):
+            yield 'Data '
+            yield 'Engineer'
+
+        model = ai_logic.load('model')
+        with mock.patch.object(model, 'stream_job_suggestions_async', chunks):
+            response = await self.async_client.post(
+                '/api/stream/job-suggestions/', data=json.dumps({'extracted_data': {}, 'target_industry': 'Fintech'}),
+                content_type='application/json', headers={'Authorization': 'Bearer test-token'})
+            self.assertTrue(response.is_async)
+            self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), b'Data Engineer')
+
+
+class ApiSessionCsrfTests(TestCase):
+    def setUp(self):
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(get_user_model().objects.create_user('learner'))
+
+    def test_session_requests_need_a_csrf_token(self):
+        response = self.client.post('/api/learning-path/', data='{}', content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        token = 'a' * 32
+        self.client.cookies['csrftoken'] = token
+        response = self.client.post('/api/learning-path/', data='{}', content_type='application/json',
+                                    HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.status_code, 400)
+
+
+class RequestContextMiddlewareTests(TestCase):
+    async def test_async_requests_know_a_linkedin_user(self):
+        tracing = ai_logic.load('tracing')
+        exporter = tracing.MemoryExporter()
+        self.addCleanup(tracing.set_exporter, tracing.set_exporter(exporter))
+        user = await get_user_model().objects.acreate(username='learner')
+        # The social backend has no aget_user, so request.auser() can't load this session
+        await self.async_client.aforce_login(user, backend='social_core.backends.linkedin.LinkedinOAuth2')
+        response = await self.async_client.get('/api/unknown/', headers={'X-Request-ID': 'request-1'})
+        self.assertEqual(response['X-Request-ID'], 'request-1')
+        [trace] = exporter.traces()
+        self.assertEqual(trace['attributes']['request_id'], 'request-1')
+        self.assertEqual(trace['attributes']['user_id'], user.pk)
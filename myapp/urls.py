@@ -1,9 +1,27 @@
 from django.urls import path
 from django.contrib.auth.views import LogoutView
-from .views import home, LoginView
+from .views import (
+    home, LoginView, extract_profile, job_suggestions, learning_path, course_recommendations,
+    skills_course_recommendations, project_recommendations, submit_job, job_status, cancel_job,
+    stream_events, stream_job_suggestions, stream_learning_path, prometheus_metrics,
+)
 
 urlpatterns = [
     path('', home, name='home'),
     path('login/', LoginView.as_view(), name='login'),
     path('logout/', LogoutView.as_view(next_page='home'), name='logout'),
+    path('api/extract/', extract_profile, name='extract_profile'),
+    path('api/job-suggestions/', job_suggestions, name='job_suggestions'),
+    path('api/learning-path/', learning_path, name='learning_path'),
+    path('api/course-recommendations/', course_recommendations, name='course_recommendations'),
+    path('api/skills-course-recommendations/', skills_course_recommendations,
+         name='skills_course_recommendations'),
+    path('api/project-recommendations/', project_recommendations, name='project_recommendations'),
+    path('api/jobs/', submit_job, name='submit_job'),
+    path('api/jobs/<str:job_id>/', job_status, name='job_status'),
+    path('api/jobs/<str:job_id>/cancel/', cancel_job, name='cancel_job'),
+    path('api/events/<slug:pipeline>/', stream_events, name='stream_events'),
+    path('api/stream/job-suggestions/', stream_job_suggestions, name='stream_job_suggestions'),
+    path('api/stream/learning-path/', stream_learning_path, name='stream_learning_path'),
+    path('metrics/', prometheus_metrics, name='metrics'),
 ]
@@ -1,10 +1,425 @@
+import asyncio
+import hmac
+import json
+import logging
+import os
+from functools import wraps
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
 from django.views.generic import TemplateView
 
+from . import ai_logic
+from .sse import event_stream_response
+
+logger = logging.getLogger(__name__)
+
 @login_required
 def home(request):
     return render(request, 'home.html', {'user': request.user})
 
 class LoginView(TemplateView):
     template_name = 'login.html'
+
+def _json_body(request):
+    try:
+        body = json.loads(request.body or b'{}')
+    except json.JSONDecodeError:
+        return None
+    return body if isinstance(body, dict) else None
+
+async def _closing(chunks):
+    try:
+        async for text in chunks:
+            yield text
+    finally:
+        # Runs when the client disconnects too, closing the Gemini stream behind the generator
+        await chunks.aclose()
+
+def _text_stream(chunks):
+    """Plain-text response for an async iterator of text chunks.
+
+    The iterator must be async: under ASGI, Django buffers a sync iterator's
+    whole body before sending it, so nothing would reach the client early.
+    """
+    response = StreamingHttpResponse(_closing(chunks), content_type='text/plain; charset=utf-8')
+    # Stop nginx-style proxies from buffering the chunks until the end
+    response['X-Accel-Buffering'] = 'no'
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+# Upper bound on one API request, including time queued behind other Gemini calls
+API_TIMEOUT = float(os.getenv('AI_API_TIMEOUT', '120'))
+
+def _has_api_token(request):
+    token = os.getenv('API_TOKEN')
+    return bool(token) and hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode())
+
+_csrf = CsrfViewMiddleware(lambda request: None)
+
+def _check_session(request, authenticated):
+    """Returns the error response for a request without the API token, or None if its session may call the API.
+
+    Session requests still need a CSRF token, since a browser sends the
+    session cookie with cross-site requests; a bearer token isn't sent
+    automatically, so token requests skip the check.
+    """
+    if not authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    if _csrf.process_view(request, None, (), {}) is not None:
+        return JsonResponse({'error': 'CSRF check failed'}, status=403)
+    return None
+
+def api_login_required(view):
+    """Like login_required for the JSON API, but answers 401 instead of redirecting to the login page.
+
+    A request needs "Authorization: Bearer <API_TOKEN>" (for scripts and
+    other services) or a signed-in session and a CSRF token. Works on sync
+    and async views.
+    """
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if not _has_api_token(request):
+                # Not request.auser(): the social-auth backends have no aget_user
+                authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+                error = _check_session(request, authenticated)
+                if error:
+                    return error
+            return await view(request, *args, **kwargs)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _has_api_token(request):
+                error = _check_session(request, request.user.is_authenticated)
+                if error:
+                    return error
+            return view(request, *args, **kwargs)
+    # CsrfViewMiddleware can't tell token requests apart, so _check_session does its check
+    return csrf_exempt(wrapper)
+
+# JSON type of each pipeline input (see job_queue.HANDLERS for which pipeline takes which)
+FIELD_TYPES = {
+    'profile_data': dict,
+    'extracted_data': dict,
+    'target_industry': str,
+    'job_choice': str,
+    'user_inputs': dict,
+    'skills_data': dict,
+    'target_field': str,
+    'completed_courses': list,
+    'field': str,
+    'experience_level': str,
+}
+# The questionnaire answers the course prompt reads (see questionnare.get_user_inputs)
+USER_INPUT_TYPES = {
+    'learning_goal': str,
+    'learning_level': str,
+    'expectations': str,
+    'career_pursuit': bool,
+    'occupation': str,
+    'completion_time': int,
+}
+SKILL_SECTIONS = ('technical_skills', 'soft_skills', 'industry_knowledge')
+TYPE_NAMES = {dict: 'a JSON object', list: 'a list', str: 'a string', bool: 'true or false', int: 'an integer'}
+
+def _is_a(value, expected):
+    # JSON true/false must not pass as an integer
+    return isinstance(value, expected) and not (expected is int and isinstance(value, bool))
+
+def _shape_errors(values, fields, prefix=''):
+    """Messages for the fields that are missing or not the shape their pipeline reads."""
+    errors = []
+    for field in fields:
+        name = prefix + field
+        if field not in values:
+            errors.append(f'{name} required')
+            continue
+        value, expected = values[field], FIELD_TYPES.get(field)
+        if expected and not _is_a(value, expected):
+            errors.append(f'{name} must be {TYPE_NAMES[expected]}')
+        elif field == 'user_inputs':
+            for key, key_type in USER_INPUT_TYPES.items():
+                if not _is_a(value.get(key), key_type):
+                    errors.append(f'{name}.{key} must be {TYPE_NAMES[key_type]}')
+        elif field == 'skills_data':
+            for section in SKILL_SECTIONS:
+                entries = value.get(section, [])
+                if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+                    errors.append(f'{name}.{section} must be a list of JSON objects')
+        elif field == 'completed_courses' and not all(isinstance(course, dict) for course in value):
+            errors.append(f'{name} must be a list of JSON objects')
+    return errors
+
+def _invalid(body, *fields):
+    """Returns a 400 response naming the missing or malformed fields, or None if the body is usable."""
+    if body is None:
+        return JsonResponse({'error': 'Request body must be a JSON object'}, status=400)
+    errors = _shape_errors(body, fields)
+    if errors:
+        return JsonResponse({'error': '; '.join(errors)}, status=400)
+    return None
+
+async def _run(coroutine, wrap=None):
+    """Awaits a pipeline coroutine and turns its result or failure into a JsonResponse.
+
+    The view's task only waits on the event loop, so one process can hold
+    hundreds of slow Gemini requests open (LLM_MAX_CONCURRENCY bounds how many
+    reach Gemini at once).
+    """
+    try:
+        result = await asyncio.wait_for(coroutine, API_TIMEOUT)
+    except asyncio.TimeoutError:
+        return JsonResponse({'error': 'Generation timed out. Please try again.'}, status=504)
+    except Exception:
+        logger.exception("Error in AI pipeline")
+        return JsonResponse({'error': 'Generation failed. Please try again.'}, status=502)
+    if isinstance(result, dict) and 'error' in result:
+        return JsonResponse(result, status=502)
+    if wrap:
+        # The text pipelines return their failure message instead of raising
+        model = await ai_logic.load_async('model')
+        if model.is_error_message(result):
+            return JsonResponse({'error': result}, status=502)
+    tracing = await ai_logic.load_async('tracing')
+    with tracing.span('serialize'):
+        return JsonResponse({wrap: result} if wrap else result)
+
+@api_login_required
+@require_POST
+async def extract_profile(request):
+    """Extracts skills and experience from raw profile data."""
+    body = _json_body(request)
+    error = _invalid(body, 'profile_data')
+    if error:
+        return error
+    model = await ai_logic.load_async('model')
+    return await _run(model.extract_skills_and_experience_async(body['profile_data']))
+
+@api_login_required
+@require_POST
+async def job_suggestions(request):
+    body = _json_body(request)
+    error = _invalid(body, 'extracted_data', 'target_industry')
+    if error:
+        return error
+    model = await ai_logic.load_async('model')
+    coroutine = model.generate_job_suggestions_async(body['extracted_data'], body['target_industry'])
+    return await _run(coroutine, wrap='job_suggestions')
+
+@api_login_required
+@require_POST
+async def learning_path(request):
+    body = _json_body(request)
+    error = _invalid(body, 'extracted_data', 'job_choice')
+    if error:
+        return error
+    model = await ai_logic.load_async('model')
+    coroutine = model.generate_learning_path_async(body['extracted_data'], body['job_choice'])
+    return await _run(coroutine, wrap='learning_path')
+
+@api_login_required
+@require_POST
+async def course_recommendations(request):
+    """Course recommendations from the questionnaire answers (see questionnare.get_user_inputs)."""
+    body = _json_body(request)
+    error = _invalid(body, 'user_inputs')
+    if error:
+        return error
+    questionnare = await ai_logic.load_async('questionnare')
+    return await _run(questionnare.generate_course_recommendations_async(body['user_inputs']))
+
+@api_login_required
+@require_POST
+async def skills_course_recommendations(request):
+    """Course recommendations from a skills profile (see skills.collect_skills) and target field."""
+    body = _json_body(request)
+    error = _invalid(body, 'skills_data', 'target_field')
+    if error:
+        return error
+    skills = await ai_logic.load_async('skills')
+    return await _run(skills.generate_course_recommendations_async(body['skills_data'], body['target_field']))
+
+@api_login_required
+@require_POST
+async def project_recommendations(request):
+    body = _json_body(request)
+    error = _invalid(body, 'completed_courses', 'field', 'experience_level')
+    if error:
+        return error
+    projects = await ai_logic.load_async('projects')
+    coroutine = projects.generate_project_recommendations_async(
+        body['completed_courses'], body['field'], body['experience_level'])
+    return await _run(coroutine)
+
+# Longest a job status request may wait for the job to finish (?wait=seconds)
+JOB_MAX_WAIT = float(os.getenv('AI_JOB_MAX_WAIT', '30'))
+
+def _job_response(job, status=200):
+    data = {key: job[key] for key in ('id', 'kind', 'status', 'attempts', 'created_at', 'updated_at')}
+    if job['status'] == 'succeeded':
+        data['result'] = job['result']
+    elif job['error']:
+        data['error'] = job['error']
+    return JsonResponse(data, status=status)
+
+@api_login_required
+@require_POST
+async def submit_job(request):
+    """Queues a generation for the background workers and returns its ID right away.
+
+    Body: {"kind": "learning_path", "payload": {...the pipeline's inputs...}, "priority": 0}.
+    Kinds and their payload fields are listed in job_queue.HANDLERS.
+    """
+    body = _json_body(request)
+    error = _invalid(body, 'kind', 'payload')
+    if error:
+        return error
+    job_queue = await ai_logic.load_async('job_queue')
+    kind, payload = body['kind'], body['payload']
+    if not isinstance(kind, str) or kind not in job_queue.HANDLERS:
+        return JsonResponse({'error': f"Unknown job kind {kind!r}"}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({'error': 'payload must be a JSON object'}, status=400)
+    errors = _shape_errors(payload, job_queue.HANDLERS[kind][2], prefix='payload.')
+    if errors:
+        return JsonResponse({'error': '; '.join(errors)}, status=400)
+    try:
+        priority = int(body.get('priority', 0))
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'priority must be an integer'}, status=400)
+    queue = job_queue.get_queue()
+    job_id = await asyncio.to_thread(queue.enqueue, kind, payload, priority)
+    response = JsonResponse({'id': job_id, 'status': 'queued', 'status_url': f'/api/jobs/{job_id}/'}, status=202)
+    response['Location'] = f'/api/jobs/{job_id}/'
+    return response
+
+@api_login_required
+@require_GET
+async def job_status(request, job_id):
+    """Returns a job's status and, once it succeeded, its result.
+
+    With ?wait=N the request long-polls: it returns as soon as the job
+    finishes, or after N seconds (at most AI_JOB_MAX_WAIT) with the current status.
+    """
+    try:
+        wait = min(max(float(request.GET.get('wait', 0)), 0), JOB_MAX_WAIT)
+    except ValueError:
+        return JsonResponse({'error': 'wait must be a number of seconds'}, status=400)
+    job_queue = await ai_logic.load_async('job_queue')
+    queue = job_queue.get_queue()
+    if wait:
+        job = await queue.wait(job_id, wait)
+    else:
+        job = await asyncio.to_thread(queue.get, job_id)
+    if job is None:
+        return JsonResponse({'error': 'No such job'}, status=404)
+    return _job_response(job)
+
+@api_login_required
+@require_POST
+async def cancel_job(request, job_id):
+    """Cancels a job that no worker has started yet."""
+    job_queue = await ai_logic.load_async('job_queue')
+    queue = job_queue.get_queue()
+    cancelled = await asyncio.to_thread(queue.cancel, job_id)
+    job = await asyncio.to_thread(queue.get, job_id)
+    if job is None:
+        return JsonResponse({'error': 'No such job'}, status=404)
+    return _job_response(job, status=200 if cancelled else 409)
+
+# pipeline -> (module, async stream function, body fields, whether it streams text or parsed JSON items)
+EVENT_PIPELINES = {
+    'job-suggestions': ('model', 'stream_job_suggestions_async', ('extracted_data', 'target_industry'), 'text'),
+    'learning-path': ('model', 'stream_learning_path_async', ('extracted_data', 'job_choice'), 'text'),
+    'course-recommendations': ('questionnare', 'stream_course_recommendations_async', ('user_inputs',), 'items'),
+    'skills-course-recommendations': (
+        'skills', 'stream_course_recommendations_async', ('skills_data', 'target_field'), 'items'),
+    'project-recommendations': (
+        'projects', 'stream_project_recommendations_async', ('completed_courses', 'field', 'experience_level'),
+        'items'),
+}
+
+async def _text_events(chunks):
+    try:
+        async for text in chunks:
+            yield 'chunk', {'text': text}
+    finally:
+        # Closing the pipeline's generator closes the Gemini stream behind it
+        await chunks.aclose()
+
+async def _item_events(items):
+    try:
+        async for path, value in items:
+            if path != 'recommendations':
+                yield 'item', {'path': path, 'value': value}
+            elif isinstance(value, dict) and 'error' in value:
+                yield 'error', value
+            else:
+                yield 'result', value
+    finally:
+        await items.aclose()
+
+@api_login_required
+@require_POST
+async def stream_events(request, pipeline):
+    """Streams a pipeline's output as Server-Sent Events.
+
+    Text pipelines send "chunk" events as Gemini writes; JSON pipelines send
+    an "item" event for each course or project as soon as it is complete,
+    then a "result" event with the whole answer. Every stream ends with
+    "done". EventSource can't POST, so browsers read this with fetch().
+    """
+    if pipeline not in EVENT_PIPELINES:
+        return JsonResponse({'error': f"Unknown pipeline {pipeline!r}"}, status=404)
+    module_name, function_name, fields, kind = EVENT_PIPELINES[pipeline]
+    body = _json_body(request)
+    error = _invalid(body, *fields)
+    if error:
+        return error
+    module = await ai_logic.load_async(module_name)
+    stream = getattr(module, function_name)(*(body[field] for field in fields))
+    return event_stream_response(_text_events(stream) if kind == 'text' else _item_events(stream))
+
+@api_login_required
+@require_POST
+async def stream_job_suggestions(request):
+    """Streams job suggestions as plain text while Gemini generates them."""
+    body = _json_body(request)
+    error = _invalid(body, 'extracted_data', 'target_industry')
+    if error:
+        return error
+    model = await ai_logic.load_async('model')
+    chunks = model.stream_job_suggestions_async(body['extracted_data'], body['target_industry'])
+    return _text_stream(chunks)
+
+@api_login_required
+@require_POST
+async def stream_learning_path(request):
+    """Streams a learning path as plain text while Gemini generates it."""
+    body = _json_body(request)
+    error = _invalid(body, 'extracted_data', 'job_choice')
+    if error:
+        return error
+    model = await ai_logic.load_async('model')
+    chunks = model.stream_learning_path_async(body['extracted_data'], body['job_choice'])
+    return _text_stream(chunks)
+
+@require_GET
+def prometheus_metrics(request):
+    """LLM and MongoDB metrics for this process in the Prometheus text format.
+
+    If METRICS_TOKEN is set, scrapers must send "Authorization: Bearer <token>".
+    """
+    token = os.getenv('METRICS_TOKEN')
+    if token and not hmac.compare_digest(
+            request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+        return HttpResponse(status=401)
+    metrics = ai_logic.load('metrics')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,5 +1,8 @@
+import os
 from pathlib import Path
 
+from app_logging import logging_config
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = 'django-insecure-eiw%i+fya)fs0+0)(n=3!d^hml1uh$gl(by(15#knf8lk9)i-h'
@@ -19,11 +22,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'myapp.middleware.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'myapp.middleware.RequestContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'social_django.middleware.SocialAuthExceptionMiddleware',
@@ -75,6 +80,25 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 SITE_ID = 1
 
+# Everything goes through one queued handler; a listener thread writes JSON lines to
+# logs/app.log (rotated by size, or daily with LOG_ROTATION=time) and text to the console.
+# LOG_LEVELS and LOG_SAMPLE_RATES take "logger=value,logger=value" overrides.
+LOG_DIR = Path(os.getenv('LOG_DIR', BASE_DIR / 'logs'))
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+
+LOGGING = logging_config(LOG_DIR / 'app.log', LOG_LEVEL)
+LOGGING['loggers'] = {
+    # Replaces Django's own console handlers, which would print every record twice
+    'django': {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False},
+    'django.server': {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False},
+    # Drops the file-watcher chatter that filled the old django_debug.log
+    'django.utils.autoreload': {'level': 'WARNING'},
+    # Lets SQL queries (logged while DEBUG is on) reach the 0.01 sampling rate of logging_config()
+    'django.db.backends': {'level': 'DEBUG'},
+    # LOG_LEVELS overrides
+    **LOGGING['loggers'],
+}
+
 AUTHENTICATION_BACKENDS = [
     'social_core.backends.linkedin.LinkedinOAuth2',
     'django.contrib.auth.backends.ModelBackend',
@@ -0,0 +1,224 @@
+"""In-process read-through cache for user profiles.
+
+db_helpers.get_user_profile reads through a bounded LRU cache with a TTL,
+and save_user_profile updates the cached copy in the saving process. Other
+processes (e.g. several Django workers) learn about the save through an
+invalidation channel: a small SQLite log that every process appends user IDs
+to and polls at most every poll_interval seconds. A save is only published
+once MongoDB has acknowledged it (db_helpers may hold it in its write-behind
+buffer first), so a worker that drops its copy re-reads the new profile. A
+profile can therefore be stale in another worker from the save until the
+flush plus poll_interval, and stats() counts reads that fell into that
+window, including ones that cached the old document before the flush.
+"""
+import copy
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class InvalidationChannel:
+    """Cross-process invalidation log in SQLite; a stand-in for a pub/sub broker."""
+
+    def __init__(self, path, keep_seconds=3600):
+        self.path = path
+        self.keep_seconds = keep_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._last_seq = None
+        self._published = 0
+
+    def _connect(self):
+        # SQLite connections must not be shared across a fork
+        if self._conn is not None and self._pid != os.getpid():
+            self._conn = None
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS profile_invalidations (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    origin TEXT NOT NULL,
+                    at REAL NOT NULL
+                )"""
+            )
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+            if self._last_seq is None:
+                # Only saves made after this process started matter
+                self._last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM profile_invalidations").fetchone()[0]
+        return self._conn
+
+    def publish(self, user_id, origin, at=None):
+        """Records a save made at `at` (default: now)."""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT INTO profile_invalidations (user_id, origin, at) VALUES (?, ?, ?)",
+                         (str(user_id), origin, at or now))
+            self._published += 1
+            if self._published % 1000 == 0:
+                conn.execute("DELETE FROM profile_invalidations WHERE at < ?", (now - self.keep_seconds,))
+            conn.commit()
+
+    def poll(self):
+        """Returns (user_id, origin, at) for every save published since the last poll."""
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT seq, user_id, origin, at FROM profile_invalidations WHERE seq > ? ORDER BY seq",
+                (self._last_seq,),
+            ).fetchall()
+            if rows:
+                self._last_seq = rows[-1][0]
+        return [row[1:] for row in rows]
+
+
+class ProfileCache:
+    """LRU + TTL cache of user profile documents keyed by user_id.
+
+    Keys are str(user_id), the form the invalidation channel carries, so an
+    int ID and its string are the same profile.
+    """
+
+    def __init__(self, max_entries=1000, ttl=300, channel=None, poll_interval=0.5):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.origin = uuid.uuid4().hex
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_reads = 0
+        self._entries = OrderedDict()  # str(user_id) -> [document, expires_at, last_read_at]
+        self._lock = threading.Lock()
+        self._version = 0
+        self._next_poll = 0.0
+
+    @classmethod
+    def from_env(cls):
+        """Builds a cache configured from PROFILE_CACHE_* environment variables."""
+        channel_path = os.getenv("PROFILE_CACHE_CHANNEL_PATH")
+        return cls(
+            max_entries=int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "1000")),
+            ttl=float(os.getenv("PROFILE_CACHE_TTL", "300")),
+            channel=InvalidationChannel(channel_path) if channel_path else None,
+            poll_interval=float(os.getenv("PROFILE_CACHE_POLL_INTERVAL", "0.5")),
+        )
+
+    def _poll(self, now):
+        if self.channel is None or now < self._next_poll:
+            return
+        self._next_poll = now + self.poll_interval
+        try:
+            events = self.channel.poll()
+        except sqlite3.Error as e:
+            logger.warning("Profile invalidation channel unavailable, clearing cache: %s", e)
+            self.clear()
+            return
+        with self._lock:
+            for user_id, origin, at in events:
+                if origin == self.origin:
+                    continue
+                entry = self._entries.pop(user_id, None)
+                self._version += 1
+                if entry is not None:
+                    self.invalidations += 1
+                    # Served from cache (or read from MongoDB before the flush) after another
+                    # process had already saved a newer profile
+                    if entry[2] > at:
+                        self.stale_reads += 1
+
+    def version(self):
+        """Token for set(): a set() after any write or invalidation since version() is ignored."""
+        with self._lock:
+            return self._version
+
+    def get(self, user_id):
+        """Returns a copy of the cached profile (which may be None), or MISSING."""
+        key = str(user_id)
+        now = time.time()
+        self._poll(now)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            entry[2] = now
+            self.hits += 1
+            return copy.deepcopy(entry[0])
+
+    def set(self, user_id, document, version):
+        """Caches a document read from MongoDB, unless it was invalidated while being read."""
+        key = str(user_id)
+        now = time.time()
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries[key] = [copy.deepcopy(document), now + self.ttl, now]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def update(self, user_id, fields, publish=True):
+        """Applies a save to the cached copy and, with `publish`, tells other processes to drop theirs.
+
+        Pass publish=False while the save isn't in MongoDB yet, and call
+        publish() once it is.
+        """
+        with self._lock:
+            self._version += 1
+            entry = self._entries.get(str(user_id))
+            if entry is not None:
+                document = entry[0] if entry[0] is not None else {"user_id": user_id}
+                document.update(copy.deepcopy(fields))
+                entry[0] = document
+        if publish:
+            self.publish(user_id)
+
+    def publish(self, user_id, saved_at=None):
+        """Tells other processes that the profile saved at `saved_at` (default: now) is in MongoDB."""
+        if self.channel is not None:
+            try:
+                self.channel.publish(user_id, self.origin, saved_at)
+            except sqlite3.Error as e:
+                logger.warning("Could not publish profile invalidation: %s", e)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._version += 1
+            if self._entries.pop(str(user_id), None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "invalidations": self.invalidations,
+                "stale_reads": self.stale_reads,
+            }